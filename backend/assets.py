@@ -0,0 +1,269 @@
+"""Serves the frontend and the clipart from an in-memory, content-hashed asset table.
+
+Built once at startup (load()):
+- Every file in frontend/ is read, precompressed with gzip and, when the
+  optional `brotli` package is installed, brotli, and published at a URL with
+  its content hash (/static/app.3f2a9c1b07de.js). index.html is rewritten to
+  reference those URLs.
+- Every clipart and its WebP card variant (data/clipart/thumbs/, written by
+  generate_clipart.py) is hashed and published the same way. Clipart added
+  while the server runs is found on disk at its first request and published
+  then; one replaced on disk is hashed again when its plain URL is next
+  requested. A hashed URL always serves the bytes it was hashed from.
+
+Hashed URLs are cached by browsers for a year as `immutable`, so a repeat page
+load only revalidates index.html, which is answered with 304 Not Modified.
+The plain URLs (/static/app.js, /api/clipart/<name>) keep working and are
+revalidated on every use. ETags are strong and differ per encoding.
+"""
+import gzip
+import hashlib
+import importlib.util
+import mimetypes
+import os
+import re
+from typing import Dict, Mapping, Optional
+
+from starlette.responses import Response
+
+from backend import clipart
+from backend import file_watch
+
+FRONTEND_DIR = "frontend"
+CLIPART_URL = "/api/clipart"
+STATIC_URL = "/static"
+THUMB_DIR = "thumbs"
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# Worth compressing; images are compressed already.
+COMPRESSIBLE = {"text/html", "text/css", "text/javascript", "application/javascript", "application/json", "image/svg+xml"}
+# Development convenience: re-read edited frontend files (by mtime) at most once per interval.
+RELOAD = os.environ.get("LINGOFLOW_ASSET_RELOAD", "0") == "1"
+RELOAD_CHECK_INTERVAL = 1.0
+
+_STATIC_REF = re.compile(r'((?:src|href)=")/static/([^"?#]+)(")')
+
+_brotli = None
+if importlib.util.find_spec("brotli") is not None:
+    import brotli as _brotli
+
+class Asset:
+    __slots__ = ("content_type", "digest", "cache_control", "body", "encoded", "path")
+
+    def __init__(self, content_type: str, digest: str, cache_control: str,
+                 body: bytes, path: Optional[str] = None):
+        self.content_type = content_type
+        self.digest = digest
+        self.cache_control = cache_control
+        self.body = body
+        self.path = path  # the clipart file it was read from
+        self.encoded: Dict[str, bytes] = {}  # content-coding -> precompressed body
+
+    def published(self, cache_control: str) -> "Asset":
+        """The same content under another cache policy (the plain URL of a hashed asset)."""
+        asset = Asset(self.content_type, self.digest, cache_control, self.body, self.path)
+        asset.encoded = self.encoded
+        return asset
+
+_assets: Dict[str, Asset] = {}
+_hashed: Dict[str, str] = {}  # plain URL -> content-hashed URL
+_frontend = file_watch.Watcher(RELOAD_CHECK_INTERVAL)  # the frontend files as loaded
+_clipart_files = file_watch.Watcher()  # each clipart file as hashed
+# Clipart URLs found missing on disk, forgotten when a clipart directory changes (checked at most once a second).
+_missing = set()
+_clipart_dirs = file_watch.Watcher(RELOAD_CHECK_INTERVAL)
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+def _content_type(name: str) -> str:
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return f"{content_type}; charset=utf-8" if content_type.startswith("text/") or content_type.endswith("javascript") else content_type
+
+def _hashed_name(name: str, digest: str) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest}{ext}"
+
+def _compress(asset: Asset):
+    if asset.content_type.split(";")[0] not in COMPRESSIBLE:
+        return
+    candidates = {"gzip": gzip.compress(asset.body, 9, mtime=0)}
+    if _brotli is not None:
+        candidates["br"] = _brotli.compress(asset.body, quality=11)
+    # Only kept where it actually saves bytes
+    asset.encoded = {coding: data for coding, data in candidates.items() if len(data) < len(asset.body)}
+
+def _publish(url: str, asset: Asset):
+    """Publishes `asset` at its content-hashed URL and, revalidated, at `url`."""
+    directory, name = url.rsplit("/", 1)
+    hashed = f"{directory}/{_hashed_name(name, asset.digest)}"
+    _assets[hashed] = asset
+    _assets[url] = asset.published(REVALIDATE)
+    _hashed[url] = hashed
+
+def _load_frontend():
+    files = {}
+    for name in sorted(os.listdir(FRONTEND_DIR)):
+        path = os.path.join(FRONTEND_DIR, name)
+        if os.path.isfile(path) and not name.startswith("."):
+            _frontend.remember(path)
+            with open(path, "rb") as f:
+                files[name] = f.read()
+
+    for name, body in files.items():
+        if name == "index.html":
+            continue
+        asset = Asset(_content_type(name), _digest(body), IMMUTABLE, body)
+        _compress(asset)
+        _publish(f"{STATIC_URL}/{name}", asset)
+
+    if "index.html" in files:
+        # The page itself is always revalidated, so it can point at the immutable URLs.
+        html = _STATIC_REF.sub(lambda m: m.group(1) + url(f"{STATIC_URL}/{m.group(2)}") + m.group(3),
+                               files["index.html"].decode("utf-8")).encode("utf-8")
+        index = Asset(_content_type("index.html"), _digest(html), REVALIDATE, html)
+        _compress(index)
+        _assets["/"] = _assets["/index.html"] = index
+
+def _publish_clipart(plain: str, path: str):
+    # Noted before reading, so a change made while reading is still seen next time.
+    _clipart_files.remember(path)
+    with open(path, "rb") as f:
+        body = f.read()
+    # Kept in memory: the hashed URL must keep serving exactly these bytes even if the file is replaced.
+    _publish(plain, Asset(_content_type(path), _digest(body), IMMUTABLE, body, path))
+
+def _load_clipart():
+    directory = clipart.CLIPART_DIR
+    for subdir in ("", THUMB_DIR):
+        _clipart_dirs.remember(os.path.join(directory, subdir))
+    if not os.path.isdir(directory):
+        return
+    for subdir in ("", THUMB_DIR):
+        folder = os.path.join(directory, subdir)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if not name.endswith((".png", ".webp")):
+                continue
+            plain = f"{CLIPART_URL}/{subdir}/{name}" if subdir else f"{CLIPART_URL}/{name}"
+            _publish_clipart(plain, os.path.join(folder, name))
+
+def _clipart_from_disk(path: str) -> Optional[Asset]:
+    """Publishes a clipart written or replaced since it was loaded (generate_clipart.py run meanwhile);
+    None if there is none."""
+    if not path.startswith(f"{CLIPART_URL}/"):
+        return None
+    parts = path[len(CLIPART_URL) + 1:].split("/")
+    if len(parts) == 2 and parts[0] == THUMB_DIR:
+        name = parts[1]
+    elif len(parts) == 1:
+        name = parts[0]
+    else:
+        return None
+    # Only plain file names in the clipart directory and its thumbnails.
+    if not name.endswith((".png", ".webp")) or name.startswith(".") or "\\" in name:
+        return None
+    if path in _missing:
+        changed = _clipart_dirs.changed() if _clipart_dirs.due() else None
+        if not changed:
+            return None
+        for folder in changed:
+            _clipart_dirs.remember(folder)
+        _missing.clear()
+    try:
+        _publish_clipart(path, os.path.join(clipart.CLIPART_DIR, *parts))
+    except FileNotFoundError:
+        # Gone, or never there. A hashed URL handed out before keeps its bytes.
+        _assets.pop(path, None)
+        _hashed.pop(path, None)
+        _missing.add(path)
+        return None
+    except OSError:
+        return None
+    return _assets.get(path)
+
+def load():
+    """(Re)builds the asset table; returns the number of published URLs."""
+    global _assets, _hashed, _frontend, _clipart_files, _missing, _clipart_dirs
+    previous = _assets, _hashed, _frontend, _clipart_files, _missing, _clipart_dirs
+    _assets, _hashed, _missing = {}, {}, set()
+    _frontend, _clipart_files, _clipart_dirs = (file_watch.Watcher(RELOAD_CHECK_INTERVAL), file_watch.Watcher(),
+                                                file_watch.Watcher(RELOAD_CHECK_INTERVAL))
+    try:
+        _load_frontend()
+        _load_clipart()
+    except OSError:
+        _assets, _hashed, _frontend, _clipart_files, _missing, _clipart_dirs = previous
+        raise
+    return len(_assets)
+
+def _reload_changed():
+    if not _frontend.due():
+        return
+    try:
+        names = [os.path.join(FRONTEND_DIR, n) for n in os.listdir(FRONTEND_DIR) if not n.startswith(".")]
+        if _frontend.changed(p for p in names if os.path.isfile(p)):
+            load()
+            print("Reloaded frontend assets")
+    except OSError as e:
+        # Keep serving the last good version while files are being edited.
+        print(f"Could not reload frontend assets: {e}")
+
+def url(plain_url: str) -> str:
+    """The content-hashed URL for a plain one (unchanged if it is not a published asset)."""
+    return _hashed.get(plain_url, plain_url)
+
+def clipart_thumb_url(name: str) -> str:
+    """Where to load a clipart shown as a card: its WebP variant if there is one, else the image itself."""
+    stem = name[:-4] if name.endswith(".png") else name
+    thumb = f"{CLIPART_URL}/{THUMB_DIR}/{stem}.webp"
+    if thumb not in _hashed:
+        _clipart_from_disk(thumb)
+    return _hashed.get(thumb) or url(f"{CLIPART_URL}/{name}")
+
+def _accepted_codings(header: str):
+    codings = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            codings.add(coding.strip().lower())
+    return codings
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # Weak comparison, as for any GET
+    return any(tag.strip() in ("*", etag) or tag.strip() == f"W/{etag}" for tag in header.split(","))
+
+def response(path: str, headers: Mapping[str, str]) -> Response:
+    """The response for a GET of `path` given the request headers; 404 if it is not an asset."""
+    if RELOAD:
+        _reload_changed()
+    asset = _assets.get(path)
+    if asset is None or (asset.path is not None and path in _hashed and _clipart_files.is_changed(asset.path)):
+        # A clipart that is new on disk, or replaced there since it was hashed (plain URLs only).
+        asset = _clipart_from_disk(path)
+        if asset is None:
+            return Response(status_code=404)
+
+    coding = None
+    if asset.encoded:
+        accepted = _accepted_codings(headers.get("accept-encoding", ""))
+        coding = next((c for c in ("br", "gzip") if c in asset.encoded and c in accepted), None)
+    etag = f'"{asset.digest}-{coding}"' if coding else f'"{asset.digest}"'
+    response_headers = {"ETag": etag, "Cache-Control": asset.cache_control}
+    if asset.encoded:
+        response_headers["Vary"] = "Accept-Encoding"
+
+    if _etag_matches(headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=response_headers)
+    if coding:
+        response_headers["Content-Encoding"] = coding
+        return Response(asset.encoded[coding], media_type=asset.content_type, headers=response_headers)
+    return Response(asset.body, media_type=asset.content_type, headers=response_headers)
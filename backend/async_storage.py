@@ -0,0 +1,83 @@
+"""Awaitable access to `backend.storage` for the async FastAPI handlers.
+
+Every storage call runs on a database thread, so SQLite I/O never blocks the
+event loop. Each learner's calls always run on the same one of DB_THREADS
+threads, in order, which keeps that thread's pooled connections and
+`storage.unit_of_work()` transactions intact; different learners' databases
+are written to in parallel.
+
+    settings = await async_storage.get_settings()
+    result = await async_storage.run(some_sync_fn_using_unit_of_work, arg)
+    await async_storage.run_as("alice", storage.has_queued_jobs)
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from backend import metrics
+from backend import storage
+
+DB_THREADS = int(os.environ.get("LINGOFLOW_DB_THREADS", "4"))
+
+_executors: List[ThreadPoolExecutor] = []
+
+def start():
+    """Starts the database threads; the app lifespan calls it, scripts get them on first use."""
+    if not _executors:
+        _executors[:] = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"lingoflow-db-{i}") for i in range(DB_THREADS)]
+
+def _executor_for(learner: str) -> ThreadPoolExecutor:
+    if not _executors:
+        start()
+    return _executors[zlib.crc32(learner.encode("utf-8")) % len(_executors)]
+
+async def run(fn, *args, **kwargs):
+    """Runs a synchronous storage function on the current learner's database thread."""
+    return await _submit(contextvars.copy_context(), fn, args, kwargs)
+
+async def run_as(learner: str, fn, *args, **kwargs):
+    """Like run, on behalf of `learner` rather than the current request's learner."""
+    ctx = contextvars.copy_context()
+    ctx.run(storage.current_learner.set, learner)
+    return await _submit(ctx, fn, args, kwargs)
+
+async def _submit(ctx, fn, args, kwargs):
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
+    
+    def call():
+        started = time.perf_counter()
+        metrics.DB_QUEUE_SECONDS.observe(started - submitted)
+        try:
+            return ctx.run(fn, *args, **kwargs)
+        finally:
+            metrics.DB_CALL_SECONDS.observe(time.perf_counter() - started, op=getattr(fn, "__name__", "call"))
+    
+    return await loop.run_in_executor(_executor_for(ctx.run(storage.current_learner.get)), call)
+
+async def shutdown():
+    # Waits for every thread's queued calls before the connections are closed,
+    # off the event loop; start() makes fresh threads for the next lifespan.
+    executors = list(_executors)
+    _executors.clear()
+    for executor in executors:
+        await asyncio.to_thread(executor.shutdown, wait=True)
+    storage.close_connections()
+
+def __getattr__(name):
+    # Mirror each public storage function as an awaitable with the same signature.
+    target = getattr(storage, name, None)
+    if name.startswith("_") or not callable(target):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    @functools.wraps(target)
+    async def call(*args, **kwargs):
+        return await run(target, *args, **kwargs)
+
+    globals()[name] = call
+    return call
@@ -0,0 +1,105 @@
+"""In-memory index of the available clipart, from the manifest generate_clipart.py writes.
+
+Scenario generation asks the model for a "descriptive filename", which rarely
+names a file that exists. resolve() maps it to the closest clipart by the words
+in the names, each weighted by how rare it is among the clipart (so "counter"
+alone does not turn a pharmacy into a train station), and falls back to the
+default clipart below MIN_SIMILARITY. The index is loaded once; nothing touches
+the filesystem per scenario.
+"""
+import json
+import math
+import os
+import re
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+CLIPART_DIR = os.path.join("data", "clipart")
+MANIFEST_NAME = "manifest.json"
+DEFAULT_CLIPART = "default_conversation.png"
+# Weighted share of words a requested name must have in common with a clipart.
+MIN_SIMILARITY = 0.25
+MAX_RESOLVED = 4096
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+class _Index:
+    def __init__(self, names: List[str], default: str):
+        self.names = set(names)
+        self.default = default
+        self.words: List[Tuple[str, FrozenSet[str]]] = [(n, _words(n)) for n in sorted(self.names) if n != default]
+        counts: Dict[str, int] = {}
+        for _, words in self.words:
+            for w in words:
+                counts[w] = counts.get(w, 0) + 1
+        total = len(self.words)
+        self.weights = {w: math.log(1 + total / c) for w, c in counts.items()}
+        # Words no clipart has count as rare as possible.
+        self.unknown_weight = math.log(1 + total) if total else 1.0
+        self.resolved: Dict[str, str] = {}
+
+    def weight(self, words) -> float:
+        return sum(self.weights.get(w, self.unknown_weight) for w in words)
+
+_index: Optional[_Index] = None
+
+def _words(name: str) -> FrozenSet[str]:
+    stem = re.sub(r"\.png$", "", name.lower())
+    return frozenset(_singular(w) for w in _WORD.findall(stem))
+
+def _singular(word: str) -> str:
+    # Plurals match singulars ("tickets" ~ "ticket", "pharmacies" ~ "pharmacy").
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def load(directory: str = CLIPART_DIR) -> int:
+    """(Re)builds the index; returns the number of clipart. Without a manifest the directory is listed once."""
+    global _index
+    default = DEFAULT_CLIPART
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), encoding="utf-8") as f:
+            manifest = json.load(f)
+        names = list(manifest.get("clipart", {}))
+        default = manifest.get("default", default)
+    except FileNotFoundError:
+        print(f"No {MANIFEST_NAME} in {directory}; run generate_clipart.py to create it. Listing the directory instead.")
+        names = [f for f in os.listdir(directory) if f.endswith(".png")] if os.path.isdir(directory) else []
+    except (OSError, ValueError) as e:
+        print(f"Could not read the clipart manifest: {e}")
+        names = []
+    _index = _Index(names, default)
+    return len(_index.names)
+
+def resolve(requested) -> str:
+    """The clipart to show for a model-requested file name: itself, the closest match, or the default."""
+    if _index is None:
+        load()
+    index = _index
+    if not isinstance(requested, str) or not requested:
+        return index.default
+    if requested in index.names:
+        return requested
+    match = index.resolved.get(requested)
+    if match is None:
+        match = _closest(index, requested)
+        if len(index.resolved) >= MAX_RESOLVED:
+            index.resolved.clear()
+        index.resolved[requested] = match
+    return match
+
+def _closest(index: _Index, requested: str) -> str:
+    wanted = _words(requested)
+    if not wanted:
+        return index.default
+    best, best_score = index.default, 0.0
+    for name, words in index.words:
+        shared = wanted & words
+        if not shared:
+            continue
+        # Weighted Jaccard similarity; ties go to the alphabetically first name.
+        score = index.weight(shared) / index.weight(wanted | words)
+        if score > best_score:
+            best, best_score = name, score
+    return best if best_score >= MIN_SIMILARITY else index.default
@@ -0,0 +1,67 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+from backend import ollama_client
+
+def _parse_budgets(value: str) -> Dict[str, int]:
+    budgets = {}
+    for item in value.split(","):
+        if "=" in item:
+            model, tokens = item.rsplit("=", 1)
+            budgets[model.strip()] = int(tokens)
+    return budgets
+
+# Prompt tokens a chat turn may use, per model ("gemma3:4b=8192,qwen3:8b=16384") with a default.
+DEFAULT_BUDGET = int(os.environ.get("LINGOFLOW_CONTEXT_TOKENS", "4096"))
+MODEL_BUDGETS = _parse_budgets(os.environ.get("LINGOFLOW_MODEL_CONTEXT_TOKENS", ""))
+# Left free for the reply itself.
+RESPONSE_RESERVE = 512
+# Per-message overhead of the chat template (role markers etc.).
+MESSAGE_OVERHEAD = 4
+
+# The newest exchanges always stay verbatim; older ones get folded into the running summary.
+KEEP_EXCHANGES = 4
+# Only fold once this many messages have left the verbatim window, so the summary is
+# recomputed every few turns rather than on every turn.
+FOLD_STEP = 4
+
+def budget_for(model: str) -> int:
+    return MODEL_BUDGETS.get(model, DEFAULT_BUDGET)
+
+def estimate_tokens(text: str) -> int:
+    # Rough: ~4 characters per token for ASCII, ~1 per character for CJK and other scripts.
+    text = text or ""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+def select(model: str, scenario: Dict, history: List[Dict], state: Dict, user_message: str) -> Tuple[Optional[str], List[Dict]]:
+    """Picks what a chat turn sends besides the system prompt and the new user message.
+
+    `history` is the conversation before the new message. Returns the running
+    summary (None until something has been folded) and the newest unfolded
+    messages that fit the model's budget.
+    """
+    summary = state.get("context_summary") if state.get("context_summary_upto") else None
+    available = budget_for(model) - RESPONSE_RESERVE - sum(
+        estimate_tokens(text) for text in (
+            ollama_client.load_prompt("chat_system_prompt.txt"),
+            scenario['setting'], scenario['goal'], summary, user_message,
+        )
+    )
+
+    kept = []
+    for turn in reversed(history[state.get("context_summary_upto", 0):]):
+        cost = estimate_tokens(turn['content']) + MESSAGE_OVERHEAD
+        if cost > available:
+            break
+        kept.append(turn)
+        available -= cost
+    kept.reverse()
+    return summary, kept
+
+def fold_target(history: List[Dict], state: Dict) -> Optional[int]:
+    """How many messages the summary should cover now, or None if it is still current."""
+    target = len(history) - KEEP_EXCHANGES * 2
+    if target - state.get("context_summary_upto", 0) >= FOLD_STEP:
+        return target
+    return None
@@ -0,0 +1,44 @@
+"""Notices files edited while the server runs, by their mtime and size.
+
+Used to reload prompt templates and frontend assets during development and to
+pick up clipart generated after startup. Checks are cheap but not free (one
+stat per file), so callers on a request path throttle them with due().
+"""
+import os
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+Signature = Optional[Tuple[float, int]]  # (mtime, size); None when the file does not exist
+
+def signature(path: str) -> Signature:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime, st.st_size
+
+class Watcher:
+    """Remembers files as they were when loaded and reports which have changed since."""
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._last_check = time.monotonic()
+        self._seen: Dict[str, Signature] = {}
+
+    def remember(self, path: str):
+        self._seen[path] = signature(path)
+
+    def due(self) -> bool:
+        """True at most once per `interval` seconds: whether it is time to look again."""
+        now = time.monotonic()
+        if now - self._last_check < self.interval:
+            return False
+        self._last_check = now
+        return True
+
+    def is_changed(self, path: str) -> bool:
+        return path not in self._seen or signature(path) != self._seen[path]
+
+    def changed(self, paths: Iterable[str] = ()) -> Set[str]:
+        """Remembered files that changed or disappeared, and those of `paths` not seen before."""
+        return {p for p in self._seen if signature(p) != self._seen[p]} | {p for p in paths if p not in self._seen}
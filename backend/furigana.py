@@ -0,0 +1,118 @@
+"""Adds <ruby> furigana to Japanese replies locally, instead of having the model write them.
+
+Optional: needs either fugashi with a UniDic dictionary (`pip install fugashi
+unidic-lite`) or pykakasi. Without one, the chat prompt keeps asking the model
+for <ruby> markup as before.
+"""
+import functools
+import importlib.util
+import os
+import re
+from typing import Callable, List, Optional, Tuple
+
+# "auto" annotates locally when an analyzer is installed, "llm" always leaves it to the model.
+MODE = os.environ.get("LINGOFLOW_FURIGANA", "auto").lower()
+# Analyzed sentences remembered; replies keep reusing the same short ones ("かしこまりました。").
+SENTENCE_CACHE_SIZE = 16384
+
+_KANJI = re.compile(r"[㐀-䶿一-鿿豈-﫿々〆ヶ]")
+_KANJI_RUN = re.compile(r"([㐀-䶿一-鿿豈-﫿々〆ヶ]+)")
+_RUBY_ANNOTATION = re.compile(r"<(rt|rp)>.*?</\1>", re.S)
+_RUBY_TAG = re.compile(r"</?ruby>")
+_SENTENCE_END = re.compile(r"(?<=[。！？!?\n])")
+
+Analyzer = Callable[[str], List[Tuple[str, Optional[str]]]]
+
+def _fugashi() -> Analyzer:
+    import fugashi
+    tagger = fugashi.Tagger()
+
+    def analyze(text):
+        words = []
+        for word in tagger(text):
+            if word.white_space:
+                words.append((word.white_space, None))
+            reading = getattr(word.feature, "kana", None)
+            words.append((word.surface, reading if reading and reading != "*" else None))
+        return words
+    return analyze
+
+def _pykakasi() -> Analyzer:
+    import pykakasi
+    kks = pykakasi.kakasi()
+
+    def analyze(text):
+        return [(item["orig"], item["hira"]) for item in kks.convert(text)]
+    return analyze
+
+_ANALYZERS = [("fugashi", _fugashi), ("pykakasi", _pykakasi)]
+
+@functools.lru_cache(maxsize=None)
+def _analyzer() -> Optional[Analyzer]:
+    if MODE not in ("auto", "local"):
+        return None
+    for module, factory in _ANALYZERS:
+        if importlib.util.find_spec(module) is None:
+            continue
+        try:
+            analyze = factory()
+            print(f"Furigana: annotating locally with {module}")
+            return analyze
+        except Exception as e:
+            # e.g. fugashi installed without a dictionary
+            print(f"Furigana: could not load {module}: {e}")
+    if MODE == "local":
+        print("Furigana: LINGOFLOW_FURIGANA=local but neither fugashi nor pykakasi is usable; the model will add readings")
+    return None
+
+def active() -> bool:
+    """True when readings are added here, so the model should write plain Japanese."""
+    return _analyzer() is not None
+
+def enabled_for(practice_language: str) -> bool:
+    return practice_language == "Japanese" and active()
+
+def _hiragana(text: str) -> str:
+    return "".join(chr(ord(ch) - 0x60) if "ァ" <= ch <= "ヶ" else ch for ch in text)
+
+def ruby(surface: str, reading: Optional[str]) -> str:
+    """Wraps each run of kanji in one word in <ruby>, leaving the okurigana outside:
+    引き出し + ヒキダシ -> <ruby>引<rt>ひ</rt></ruby>き<ruby>出<rt>だ</rt></ruby>し."""
+    if not reading or not _KANJI.search(surface) or _KANJI.search(reading):
+        return surface
+    reading = _hiragana(reading)
+
+    # Kana in the word must appear as-is in the reading; each kanji run takes what lies between.
+    runs = _KANJI_RUN.split(surface)
+    pattern = "".join("(.+?)" if i % 2 else re.escape(_hiragana(run)) for i, run in enumerate(runs))
+    match = re.fullmatch(pattern, reading)
+    if match is None:
+        # Irregular reading (e.g. 今日 -> きょう spans kana too): annotate the word as a whole.
+        return f"<ruby>{surface}<rt>{reading}</rt></ruby>"
+    groups = iter(match.groups())
+    return "".join(f"<ruby>{run}<rt>{next(groups)}</rt></ruby>" if i % 2 else run for i, run in enumerate(runs))
+
+def strip(text: str) -> str:
+    """Removes <ruby> annotations, keeping the base text."""
+    return _RUBY_TAG.sub("", _RUBY_ANNOTATION.sub("", text or ""))
+
+def annotate(text: str) -> str:
+    """Returns `text` with furigana on every word containing kanji.
+
+    Any <ruby> markup the model wrote anyway is dropped first, so readings
+    are consistent. Returns the text unchanged when no analyzer is loaded.
+    """
+    analyze = _analyzer()
+    if analyze is None or not text:
+        return text
+    plain = strip(text)
+    if not _KANJI.search(plain):
+        return plain
+    return "".join(_annotate_sentence(sentence) for sentence in _SENTENCE_END.split(plain))
+
+@functools.lru_cache(maxsize=SENTENCE_CACHE_SIZE)
+def _annotate_sentence(sentence: str) -> str:
+    # Sentences are analyzed on their own: the analyzer's cost is per sentence, and so is the reuse.
+    if not _KANJI.search(sentence):
+        return sentence
+    return "".join(ruby(surface, reading) for surface, reading in _analyzer()(sentence))
@@ -0,0 +1,80 @@
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from backend import ollama_client
+
+# The evaluator sees at most this many not-yet-evaluated messages on top of its notes,
+# so the prompt stays the same size however long the conversation gets.
+MAX_NEW_MESSAGES = 6
+# User messages shorter than this (after stripping markup and punctuation) cannot complete a goal.
+MIN_USER_CHARS = 2
+
+# Openers that never accomplish a goal on their own, normalized like _normalize does.
+GREETINGS = {
+    "hi", "hello", "hey", "goodmorning", "goodafternoon", "goodevening", "excuseme",
+    "こんにちは", "こんばんは", "おはよう", "おはようございます", "すみません", "もしもし", "どうも",
+    "hola", "buenosdias", "buenastardes", "buenasnoches", "bonjour", "bonsoir", "salut",
+    "merhaba", "selam", "gutentag", "hallo", "ciao", "buongiorno", "olá", "ola", "oi", "bomdia",
+    "你好", "您好", "안녕하세요", "안녕", "привет", "здравствуйте", "hoi", "dzieńdobry", "cześć", "namaste", "नमस्ते",
+    "مرحبا", "السلامعليكم",
+}
+
+_RUBY_READING = re.compile(r"<rt>.*?</rt>", re.S)
+_TAG = re.compile(r"<[^>]+>")
+
+def _normalize(text: str) -> str:
+    text = _TAG.sub("", _RUBY_READING.sub("", text or ""))
+    return "".join(
+        ch for ch in unicodedata.normalize("NFKC", text).casefold()
+        if unicodedata.category(ch)[0] in ("L", "N", "M")
+    )
+
+def needs_llm(history: List[Dict], state: Dict) -> bool:
+    """Cheap pre-check: only ask the model when a new user message could have moved the goal."""
+    for turn in history[state.get("evaluated", 0):]:
+        if turn['speaker'] != 'User':
+            continue
+        text = _normalize(turn['content'])
+        if len(text) >= MIN_USER_CHARS and text not in GREETINGS:
+            return True
+    return False
+
+async def evaluate(model: str, goal: str, history: List[Dict], state: Dict, session: str = None) -> Tuple[bool, Dict]:
+    """Returns (is_reached, new_state) for a conversation ending in the bot's latest reply.
+
+    `state` is the rolling evaluator state stored on the history row: the model's
+    progress notes and how many messages they already cover.
+    """
+    if not needs_llm(history, state):
+        # Nothing decisive happened; these messages are judged together with the next ones.
+        return False, state
+
+    latest = history[state.get("evaluated", 0):][-MAX_NEW_MESSAGES:]
+    is_reached, progress = await ollama_client.evaluate_goal_incremental(
+        model, goal, state.get("progress", ""), latest, session=session
+    )
+    if is_reached is None:
+        # Unusable structured output: fall back to judging the full transcript this once.
+        is_reached = await ollama_client.evaluate_goal(model, goal, history, session=session)
+        progress = state.get("progress", "")
+    return is_reached, {"progress": progress, "evaluated": len(history)}
+
+async def precheck(model: str, goal: str, history: List[Dict], state: Dict, session: str = None) -> Optional[Tuple[bool, Dict]]:
+    """Like evaluate, but for a conversation ending in the user's new message, before the bot replies.
+
+    Returns (is_reached, new_state) when the user's message alone decides the
+    turn, or None when the verdict depends on the reply (or the model's output
+    was unusable) and evaluate() has to run on the full exchange instead.
+    """
+    if not needs_llm(history, state):
+        return False, state
+
+    latest = history[state.get("evaluated", 0):][-MAX_NEW_MESSAGES:]
+    status, progress = await ollama_client.precheck_goal(
+        model, goal, state.get("progress", ""), latest, session=session
+    )
+    if status not in ("REACHED", "PENDING"):
+        return None
+    # The bot's reply stays unevaluated and is judged together with the next user message.
+    return status == "REACHED", {"progress": progress, "evaluated": len(history)}
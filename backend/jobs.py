@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from backend import async_storage
+from backend import storage
+
+# Background work that must survive a restart (conversation summaries) is queued in
+# the jobs table and run by a fixed number of workers.
+MAX_WORKERS = int(os.environ.get("LINGOFLOW_JOB_WORKERS", "2"))
+MAX_ATTEMPTS = 3
+# Retry delay doubles with every failed attempt.
+RETRY_BASE_SECONDS = 5.0
+# Workers also re-check the table this often, to pick up jobs whose retry delay has passed.
+POLL_SECONDS = 5.0
+
+_handlers: Dict[str, Callable[[Dict], Awaitable]] = {}
+_finished: Dict[tuple, asyncio.Event] = {}  # (learner, job id) -> set when the job is done
+_waiting: Dict[tuple, int] = {}  # (learner, job id) -> callers currently in wait()
+# Learners whose database may hold queued jobs, with a counter bumped on every enqueue.
+_learners: Dict[str, int] = {}
+_wakeup: asyncio.Event = None
+_workers: List[asyncio.Task] = []
+
+def register(kind: str, handler: Callable[[Dict], Awaitable]):
+    """`handler(payload)` runs the job; raising makes it retry up to MAX_ATTEMPTS times."""
+    _handlers[kind] = handler
+
+def _mark(learner: str):
+    _learners[learner] = _learners.get(learner, 0) + 1
+
+async def enqueue(kind: str, payload: Dict, history_id: int = None) -> int:
+    """Queues a job in the current learner's database; its handler runs as that learner."""
+    job_id = await async_storage.enqueue_job(kind, payload, history_id)
+    _mark(storage.current_learner.get())
+    if _wakeup is not None:
+        _wakeup.set()
+    return job_id
+
+async def wait(job_id: int, timeout: float) -> bool:
+    """Waits until the current learner's job has finished (either way); False on timeout."""
+    key = (storage.current_learner.get(), job_id)
+    event = _finished.setdefault(key, asyncio.Event())
+    _waiting[key] = _waiting.get(key, 0) + 1
+    try:
+        # Registered before checking, so a job finishing in between still wakes us.
+        if await async_storage.get_job_status(job_id) not in ("queued", "running"):
+            return True
+        await asyncio.wait_for(event.wait(), timeout=timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        _waiting[key] -= 1
+        if not _waiting[key]:
+            del _waiting[key]
+            # The last waiter gone without the job finishing: nobody needs the event any more.
+            if _finished.get(key) is event:
+                del _finished[key]
+
+def _notify(job_id: int):
+    event = _finished.pop((storage.current_learner.get(), job_id), None)
+    if event is not None:
+        event.set()
+
+async def _run(job: Dict):
+    handler = _handlers.get(job['kind'])
+    try:
+        if handler is None:
+            raise RuntimeError(f"No handler for job kind {job['kind']!r}")
+        await handler(job['payload'])
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        if job['attempts'] < MAX_ATTEMPTS and handler is not None:
+            retry_at = time.time() + RETRY_BASE_SECONDS * 2 ** (job['attempts'] - 1)
+            await async_storage.fail_job(job['id'], error, retry_at)
+            print(f"Job {job['id']} ({job['kind']}) failed, retrying: {error}")
+            return
+        await async_storage.fail_job(job['id'], error)
+        print(f"Job {job['id']} ({job['kind']}) failed for good: {error}")
+    else:
+        await async_storage.finish_job(job['id'])
+    _notify(job['id'])
+
+async def _claim():
+    """Claims the next runnable job of any learner: (learner, job), or None."""
+    for learner, marked in list(_learners.items()):
+        job = await async_storage.run_as(learner, storage.claim_next_job, time.time())
+        if job is not None:
+            return learner, job
+        if not await async_storage.run_as(learner, storage.has_queued_jobs) and _learners.get(learner) == marked:
+            # Nothing left, and nothing enqueued meanwhile.
+            del _learners[learner]
+    return None
+
+async def _worker():
+    while True:
+        claimed = await _claim()
+        if claimed is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+            continue
+        learner, job = claimed
+        # The handler and the outcome are recorded in the learner's database.
+        storage.current_learner.set(learner)
+        try:
+            await _run(job)
+            await async_storage.release_job_learner()
+        except Exception as e:
+            # Storage trouble while recording the outcome; the job is requeued at next startup.
+            print(f"Job {job['id']} ({job['kind']}) could not be recorded: {e}")
+
+async def start():
+    global _wakeup
+    _wakeup = asyncio.Event()
+    recovered = 0
+    # Only the learners recorded with unfinished jobs, not every database file.
+    for learner in await async_storage.run(storage.job_learners):
+        recovered += await async_storage.run_as(learner, storage.requeue_running_jobs)
+        if not await async_storage.run_as(learner, storage.release_job_learner):
+            _mark(learner)
+    if recovered:
+        print(f"Requeued {recovered} interrupted job(s)")
+    _workers[:] = [asyncio.create_task(_worker()) for _ in range(MAX_WORKERS)]
+
+async def stop():
+    for task in _workers:
+        task.cancel()
+    for task in _workers:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _workers.clear()
@@ -0,0 +1,217 @@
+"""Write-behind journal: buffers storage writes and commits them in groups.
+
+Messages and per-turn state changes are queued in memory and applied by one
+flusher task, every FLUSH_INTERVAL, in a single transaction per learner
+database for all sessions, instead of one commit (and fsync) per write. The
+transcripts of conversations being written to are also kept here, so reading
+them does not hit the database.
+
+Flush semantics:
+- Each learner's writes are applied in the order they were queued, so their
+  database always holds a prefix of them; a crash loses at most the writes of
+  the last interval, never a later write without an earlier one.
+- `await sync(history_id)` returns once the writes queued for that
+  conversation so far are committed (later writes do not hold it up).
+  Handlers call it before telling the client something is final (a completed
+  conversation) and before deleting or re-reading a conversation;
+  `sync_learner()` does the same for all of the current learner's writes.
+- A batch that cannot be committed (locked, disk full) stays queued and is
+  retried. A write that violates a constraint (e.g. for a conversation deleted
+  meanwhile) is logged and dropped, without holding up the others.
+- `stop()` drains everything still queued.
+
+Durability trade-off: a turn's reply is sent while its messages and goal
+state may exist only in this process's memory. A crash (not a clean
+shutdown, which drains the queue) within FLUSH_INTERVAL of a turn loses it,
+and the learner sees the last turns missing from the conversation. A
+completed conversation is never acknowledged before it is committed: the
+turn handlers sync as soon as they record the completion, before reporting it.
+
+Conversations are identified by (learner, history_id), the learner being the
+current request's (storage.current_learner).
+
+    await journal.append_message(history_id, "User", text)
+    journal.write(history_id, "save_goal_state", history_id, state)
+    history = await journal.get_conversation(history_id)
+"""
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from backend import async_storage
+from backend import storage
+
+# How long a write may wait for others to share its commit.
+FLUSH_INTERVAL = float(os.environ.get("LINGOFLOW_JOURNAL_FLUSH_MS", "20")) / 1000
+# Transcripts kept in memory (least recently used are dropped; they are in the database).
+MAX_CACHED_CONVERSATIONS = 256
+
+Key = Tuple[str, Optional[int]]
+
+_queue: List[tuple] = []  # (sequence number, learner, history id, function name, args, kwargs)
+_seq = 0
+_unflushed: Dict[Key, int] = {}  # conversation -> sequence number of its last uncommitted write
+_waiters: List[tuple] = []  # (learner, history id, last sequence number waited for, future); _ANY matches all
+_ANY = object()
+_transcripts: "OrderedDict[Key, List[Dict]]" = OrderedDict()
+_wakeup: Optional[asyncio.Event] = None
+_flusher: Optional[asyncio.Task] = None
+_stopping = False
+
+def _key(history_id: Optional[int]) -> Key:
+    return storage.current_learner.get(), history_id
+
+def write(history_id: Optional[int], fn_name: str, *args, **kwargs):
+    """Queues `storage.<fn_name>(*args, **kwargs)`; `history_id` is what sync() waits on."""
+    global _seq
+    _seq += 1
+    learner = storage.current_learner.get()
+    _queue.append((_seq, learner, history_id, fn_name, args, kwargs))
+    _unflushed[(learner, history_id)] = _seq
+    if _wakeup is not None:
+        _wakeup.set()
+
+def pending(history_id: Optional[int] = None) -> bool:
+    """True while writes for `history_id` (any write, when None) are not committed yet."""
+    return bool(_unflushed) if history_id is None else _key(history_id) in _unflushed
+
+def _waiting(learner, history_id, upto: int) -> bool:
+    """True while a write up to sequence number `upto` in that scope is still queued."""
+    for seq, entry_learner, entry_history_id, _, _, _ in _queue:
+        if seq > upto:
+            break
+        if learner in (_ANY, entry_learner) and history_id in (_ANY, entry_history_id):
+            return True
+    return False
+
+async def _sync(learner, history_id):
+    if not _waiting(learner, history_id, _seq):
+        return
+    if _flusher is None:
+        # Not started (scripts, shutdown): apply synchronously.
+        await _flush()
+        return
+    fut = asyncio.get_running_loop().create_future()
+    _waiters.append((learner, history_id, _seq, fut))
+    _wakeup.set()
+    await fut
+
+async def sync(history_id: Optional[int] = None):
+    """Waits until the writes queued so far for `history_id` (everyone's writes, when None) are committed."""
+    if history_id is None:
+        await _sync(_ANY, _ANY)
+    else:
+        await _sync(storage.current_learner.get(), history_id)
+
+async def sync_learner():
+    """Waits until the current learner's writes queued so far are committed."""
+    await _sync(storage.current_learner.get(), _ANY)
+
+async def append_message(history_id: int, speaker: str, content: str):
+    key = _key(history_id)
+    transcript = _transcripts.get(key)
+    if transcript is None:
+        # Becoming active (or evicted): the database is only complete once our writes are in.
+        await sync(history_id)
+        loaded = await async_storage.get_conversation(history_id)
+        transcript = _transcripts.setdefault(key, loaded)
+    transcript.append({"speaker": speaker, "content": content})
+    write(history_id, "append_conversation", history_id, speaker, content)
+    _transcripts.move_to_end(key)
+    while len(_transcripts) > MAX_CACHED_CONVERSATIONS:
+        _transcripts.popitem(last=False)
+
+def new_conversation(history_id: int):
+    """Registers a conversation that has just been created, so its (empty) transcript is not loaded."""
+    _transcripts[_key(history_id)] = []
+
+async def get_conversation(history_id: int) -> List[Dict]:
+    """The transcript including queued messages; from memory for conversations written to recently."""
+    transcript = _transcripts.get(_key(history_id))
+    if transcript is not None:
+        return list(transcript)
+    await sync(history_id)
+    return await async_storage.get_conversation(history_id)
+
+def forget(history_id: Optional[int] = None):
+    """Drops a cached transcript (all of the learner's, when None) after the conversation was deleted."""
+    learner = storage.current_learner.get()
+    for key in [k for k in _transcripts if k[0] == learner and history_id in (None, k[1])]:
+        del _transcripts[key]
+
+async def _flush():
+    if not _queue:
+        return
+    by_learner: Dict[str, List[tuple]] = {}
+    for entry in _queue:
+        by_learner.setdefault(entry[1], []).append(entry)
+    # Each learner's database commits on its own thread, in parallel with the others.
+    results = await asyncio.gather(*(
+        async_storage.run_as(learner, storage.apply_journal, [(fn, args, kwargs) for _, _, _, fn, args, kwargs in entries])
+        for learner, entries in by_learner.items()
+    ), return_exceptions=True)
+
+    committed, error = set(), None
+    for (learner, entries), result in zip(by_learner.items(), results):
+        if isinstance(result, BaseException):
+            # This learner's writes stay queued and are retried as a whole.
+            error = error or result
+            continue
+        for fn, reason in result:
+            print(f"Journal: dropped {fn} write for {learner}: {reason}")
+        committed.update(entry[0] for entry in entries)
+    _queue[:] = [entry for entry in _queue if entry[0] not in committed]
+    for key in [k for k, seq in _unflushed.items() if seq in committed]:
+        del _unflushed[key]
+
+    still_waiting = []
+    for learner, history_id, upto, fut in _waiters:
+        if _waiting(learner, history_id, upto):
+            still_waiting.append((learner, history_id, upto, fut))
+        elif not fut.done():
+            fut.set_result(None)
+    _waiters[:] = still_waiting
+    if error is not None:
+        raise error
+
+async def _run():
+    while True:
+        await _wakeup.wait()
+        _wakeup.clear()
+        if not (_waiters or _stopping):
+            # Give concurrent sessions a moment to add their writes to this commit.
+            await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await _flush()
+        except Exception as e:
+            if _stopping:
+                print(f"Journal: {len(_queue)} writes could not be applied at shutdown: {e}")
+                return
+            # The database is unusable (e.g. disk full); keep the writes and try again.
+            print(f"Journal flush failed, retrying: {e}")
+            await asyncio.sleep(max(FLUSH_INTERVAL, 1.0))
+            _wakeup.set()
+            continue
+        if _stopping and not _queue:
+            return
+
+def start():
+    global _wakeup, _flusher, _stopping
+    _stopping = False
+    _wakeup = asyncio.Event()
+    if _queue:
+        _wakeup.set()
+    _flusher = asyncio.create_task(_run())
+
+async def stop():
+    """Applies every queued write, then stops the flusher."""
+    global _flusher, _stopping
+    if _flusher is None:
+        await _flush()
+        return
+    # Not cancelled: a batch being committed must finish and be marked as applied.
+    _stopping = True
+    _wakeup.set()
+    await _flusher
+    _flusher = None
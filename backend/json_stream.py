@@ -0,0 +1,118 @@
+import json
+import re
+
+class JsonStringFieldReader:
+    """Incrementally decodes one top-level string field of a streamed JSON object.
+
+    Feed raw chunks as they arrive; each call returns the newly decoded part of
+    the field's value, so it can be forwarded before the object is complete.
+    """
+
+    def __init__(self, field: str):
+        self._key = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._pos = None
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        if self.done:
+            return ""
+        if self._pos is None:
+            match = self._key.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        out = []
+        buf = self._buffer
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            # Escape sequence: wait until it is complete before decoding it
+            if i + 1 >= len(buf):
+                break
+            length = 2
+            if buf[i + 1] == "u":
+                length = 6
+                if i + 6 > len(buf):
+                    break
+                if 0xD800 <= int(buf[i + 2:i + 6], 16) < 0xDC00:
+                    length = 12
+                    if i + 12 > len(buf):
+                        break
+            out.append(json.loads('"%s"' % buf[i:i + length]))
+            i += length
+        self._pos = i
+        return "".join(out)
+
+class JsonArrayStreamReader:
+    """Incrementally splits a streamed JSON array into its elements.
+
+    Each `feed` returns the elements completed by that chunk, already parsed,
+    so they can be used before the model has finished the array. An element
+    that is not valid JSON is skipped (counted in `errors`) without losing
+    the others. Text before the opening bracket, such as a ```json fence, is
+    ignored. Only object and array elements are returned.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0  # 1 = directly inside the top-level array
+        self._in_string = False
+        self._escaped = False
+        self._start = None
+        self.done = False
+        self.errors = 0
+
+    def feed(self, chunk: str) -> list:
+        self._buffer += chunk
+        items = []
+        buf = self._buffer
+        i = self._pos
+        while i < len(buf) and not self.done:
+            ch = buf[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif self._depth == 0:
+                if ch == "[":
+                    self._depth = 1
+            elif ch == '"':
+                self._in_string = self._depth > 1
+            elif ch in "{[":
+                if self._depth == 1:
+                    self._start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done = True
+                elif self._depth == 1 and self._start is not None:
+                    try:
+                        items.append(json.loads(buf[self._start:i + 1]))
+                    except ValueError:
+                        self.errors += 1
+                    self._start = None
+            i += 1
+
+        # Drop what has been consumed, keeping any element still in progress
+        keep = self._start if self._start is not None else i
+        self._buffer = buf[keep:]
+        self._pos = i - keep
+        if self._start is not None:
+            self._start = 0
+        return items
@@ -0,0 +1,45 @@
+"""Per-request learner identity, from the X-Learner-Id header.
+
+The id selects the learner's own database (see storage.current_learner). Requests
+without the header act as the default learner, i.e. the original single-user data.
+"""
+import json
+import re
+from typing import Optional
+
+from backend import storage
+
+HEADER = b"x-learner-id"
+# Used as a file name, so kept to a safe, case-insensitive alphabet.
+_VALID_ID = re.compile(r"[a-z0-9_-]{1,64}")
+
+def normalize(value: str) -> Optional[str]:
+    """The canonical learner id, or None if `value` is not a valid one."""
+    learner = value.strip().lower()
+    return learner if _VALID_ID.fullmatch(learner) else None
+
+class LearnerMiddleware:
+    """ASGI middleware setting storage.current_learner for the whole request,
+    including streamed responses and background tasks."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        raw = dict(scope["headers"]).get(HEADER)
+        learner = storage.DEFAULT_LEARNER
+        if raw is not None:
+            learner = normalize(raw.decode("latin-1"))
+            if learner is None:
+                body = json.dumps({"detail": "X-Learner-Id must be 1-64 letters, digits, '-' or '_'"}).encode()
+                await send({"type": "http.response.start", "status": 400,
+                            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+                await send({"type": "http.response.body", "body": body})
+                return
+        token = storage.current_learner.set(learner)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            storage.current_learner.reset(token)
@@ -1,22 +1,70 @@
 import os
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+import json
+import time
+import asyncio
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from contextlib import asynccontextmanager
+from contextlib import aclosing, asynccontextmanager
 
 from backend import storage
+from backend import async_storage
 from backend import ollama_client
+from backend import prompt_registry
+from backend import scenario_pool
+from backend import scheduler
+from backend import ollama_router
+from backend import model_residency
+from backend import goal_evaluator
+from backend import context_window
+from backend import response_cache
+from backend import jobs
+from backend import furigana
+from backend import metrics
+from backend import journal
+from backend import learners
+from backend import clipart
+from backend import assets
+
+# "standard" makes two LLM calls per turn (reply, then goal evaluation).
+# "fused" asks for the reply and the goal verdict in one structured call, falling
+# back to the standard path whenever the model's output is malformed.
+# "pipelined" judges the user's message while the reply is being generated and
+# only evaluates after the reply when the verdict depends on it.
+TURN_MODE = os.environ.get("LINGOFLOW_TURN_MODE", "standard").lower()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    storage.init_db()
+    prompt_registry.load_all()
+    furigana.active()  # loads the optional analyzer (and its dictionary) up front
+    clipart.load()
+    assets.load()  # hashes and precompresses the frontend and clipart
+    async_storage.start()
+    await async_storage.run(storage.init_db)
+    journal.start()
+    if response_cache.PERSIST:
+        await async_storage.purge_cached_responses(time.time())
+    
+    ollama_router.start(ollama_client.get_client())
+    # Pay the configured model's cold-load cost now rather than on a learner's first turn.
+    settings = await async_storage.get_settings()
+    model_residency.warm_in_background(settings['model'], refresh=True)
     
     # Initialize scenarios if none exist (we removed the blocking AI call from here)
     # The frontend will now natively command generation if it sees an empty scenario list on load.
+    # Generation itself is served from the warm scenario pool, which refills in the background.
+    scenario_pool.start(settings)
+    await jobs.start()
     yield
+    await jobs.stop()
+    await scenario_pool.stop()
+    await ollama_router.stop()
+    await journal.stop()
+    await async_storage.shutdown()
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(learners.LearnerMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Define request/response models
 class SettingsUpdate(BaseModel):
@@ -38,42 +86,92 @@ class ChatAbandon(BaseModel):
 
 @app.get("/api/settings")
 async def get_settings():
-    return storage.get_settings()
+    return dict(await async_storage.get_settings())
 
 @app.post("/api/settings")
 async def update_settings(update: SettingsUpdate):
-    storage.update_settings(
+    await async_storage.update_settings(
         theme=update.theme,
         model=update.model,
         practice_language=update.practice_language,
         ui_language=update.ui_language
     )
+    # The model or language pair may have changed; warm the model and that pool now.
+    if not model_residency.is_resident(update.model):
+        model_residency.warm_in_background(update.model)
+    scenario_pool.request_refill(await async_storage.get_settings())
     return {"success": True}
 
 @app.get("/api/scenarios")
 async def get_scenarios():
-    return {"scenarios": storage.get_scenarios()}
+    return {"scenarios": [_scenario_view(s) for s in await async_storage.get_scenarios()]}
+
+def _scenario_view(scenario) -> dict:
+    # Cards show the small WebP variant of the clipart, at its cacheable URL.
+    return {**dict(scenario), "thumb_url": assets.clipart_thumb_url(scenario.get('clipart') or clipart.DEFAULT_CLIPART)}
 
 @app.get("/api/models")
 async def get_models():
     models = await ollama_client.get_available_models()
     return {"models": models}
 
+@app.get("/api/ollama/nodes")
+async def get_ollama_nodes():
+    return ollama_router.stats()
+
+@app.get("/api/ollama/queue")
+async def get_ollama_queue():
+    return scheduler.stats()
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of the counters and histograms in backend/metrics.py."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/ollama/cache")
+async def get_response_cache_stats():
+    return response_cache.stats()
+
+@app.get("/api/models/residency")
+async def get_model_residency():
+    return model_residency.snapshot()
+
 @app.post("/api/scenarios/generate")
 async def generate_scenarios():
-    settings = storage.get_settings()
-    new_scenarios = await ollama_client.generate_scenarios(
-        settings['model'], 
-        settings['practice_language'], 
-        settings['ui_language']
-    )
+    settings = await async_storage.get_settings()
+    new_scenarios = await scenario_pool.take(settings, count=5, replace_active=True)
     if new_scenarios:
-        storage.save_scenarios(new_scenarios)
+        await async_storage.save_scenarios(new_scenarios)
         return {"success": True}
     raise HTTPException(status_code=500, detail="Failed to generate scenarios")
 
-@app.post("/api/chat/turn")
-async def process_chat_turn(turn: ChatTurn, background_tasks: BackgroundTasks):
+def _ndjson(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+@app.post("/api/scenarios/generate/stream")
+async def generate_scenarios_stream():
+    """Streams new scenarios as NDJSON: "scenario"* -> "done".
+
+    Each scenario is saved as soon as it is complete, so the dashboard can show
+    it while the model is still writing the rest. The previous scenarios are
+    only replaced once the first new one is ready.
+    """
+    settings = await async_storage.get_settings()
+    
+    async def events():
+        saved = 0
+        async with aclosing(scenario_pool.take_stream(settings, count=5, replace_active=True)) as scenarios:
+            async for scenario in scenarios:
+                await async_storage.save_scenarios([scenario], clear=(saved == 0))
+                saved += 1
+                yield _ndjson({"type": "scenario", "scenario": _scenario_view(scenario)})
+        yield _ndjson({"type": "done", "count": saved})
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+def _load_turn(turn: ChatTurn):
+    # Once the learner has been seen these reads come from storage's cache, without
+    # a query; running on the learner's database thread keeps get-or-create atomic.
     settings = storage.get_settings()
     scenario = storage.get_scenario(turn.scenario_id)
     if not scenario:
@@ -81,81 +179,244 @@ async def process_chat_turn(turn: ChatTurn, background_tasks: BackgroundTasks):
         
     # Get or create history
     history_id = storage.get_incomplete_conversation(turn.scenario_id)
-    if not history_id:
+    created = not history_id
+    if created:
         history_id = storage.start_conversation(
             turn.scenario_id,
             practice_language=settings['practice_language'],
             model=settings['model']
         )
+    conv_state = storage.get_conversation_state(history_id)
+    return settings, scenario, history_id, created, conv_state
+
+async def _begin_turn(turn: ChatTurn):
+    settings, scenario, history_id, created, conv_state = await async_storage.run(_load_turn, turn)
+    if created:
+        journal.new_conversation(history_id)
+    elif journal.pending(history_id):
+        # The previous turn's goal state is still queued; it is in the cache once it has landed.
+        await journal.sync(history_id)
+        conv_state = await async_storage.get_conversation_state(history_id)
     
     # Save user message
-    storage.append_conversation(history_id, "User", turn.message)
+    await journal.append_message(history_id, "User", turn.message)
     
     # Get total history to pass to bot
-    history = storage.get_conversation(history_id)
-    
-    # Generate bot response
-    bot_response = await ollama_client.chat_turn(
+    history = await journal.get_conversation(history_id)
+    return settings, scenario, history_id, history, conv_state
+
+def _session(history_id: int) -> str:
+    # Routing key for a conversation; ids are only unique within one learner's database.
+    return f"{storage.current_learner.get()}:{history_id}"
+
+def _chat_args(settings, scenario, history_id, history, conv_state, user_message) -> dict:
+    # The new user message is already the last history entry; chat_turn sends it separately.
+    context_summary, window = context_window.select(settings['model'], scenario, history[:-1], conv_state, user_message)
+    return dict(
+        session=_session(history_id),
         model=settings['model'],
         practice_language=settings['practice_language'],
         ui_language=settings['ui_language'],
         setting=scenario['setting'],
         goal=scenario['goal'],
-        history=history,
-        user_message=turn.message
+        history=window,
+        user_message=user_message,
+        context_summary=context_summary
     )
-    
+
+def _record_evaluation(history_id: int, goal_state: dict, is_reached: bool):
+    # Queued together, so they are committed together.
+    journal.write(history_id, "save_goal_state", history_id, goal_state)
+    if is_reached:
+        journal.write(history_id, "mark_conversation_completed", history_id)
+        journal.write(history_id, "update_settings", add_score=1)
+
+async def _fold_context(settings, scenario, history_id, history, conv_state):
+    # Runs after the response: the next turn picks up the new summary, so no turn waits on it.
+    target = context_window.fold_target(history, conv_state)
+    if target is None:
+        return
+    summary = await ollama_client.summarize_context(
+        model=settings['model'],
+        ui_language=settings['ui_language'],
+        goal=scenario['goal'],
+        previous_summary=conv_state['context_summary'],
+        history=history[conv_state['context_summary_upto']:target],
+        session=_session(history_id)
+    )
+    if summary:
+        await async_storage.save_context_summary(history_id, summary, target)
+
+def _start_precheck(settings, scenario, history_id, history, conv_state) -> asyncio.Task:
+    # `history` ends with the new user message; the task runs alongside reply generation.
+    return asyncio.create_task(goal_evaluator.precheck(
+        model=settings['model'],
+        goal=scenario['goal'],
+        history=list(history),
+        state=conv_state['goal_state'],
+        session=_session(history_id)
+    ))
+
+async def _precheck_result(task: asyncio.Task):
+    """(is_reached, goal_state) from a finished pre-check, or (None, None) to evaluate after the reply.
+
+    Ollama errors already come back as no verdict (ollama_client.precheck_goal); anything else propagates.
+    """
+    result = await task
+    return result if result is not None else (None, None)
+
+async def _evaluate_turn(settings, scenario, history_id, history, conv_state, bot_response, background_tasks: BackgroundTasks, is_reached=None, goal_state=None) -> bool:
     # Save bot message
-    storage.append_conversation(history_id, "Bot", bot_response)
+    await journal.append_message(history_id, "Bot", bot_response)
     
     # Update history for evaluation check
     history.append({"speaker": "Bot", "content": bot_response})
     
-    # Check if goal is reached
-    is_reached = await ollama_client.evaluate_goal(
-        model=settings['model'],
-        goal=scenario['goal'],
-        history=history
+    # Check if goal is reached, unless a fused turn or the pre-check already returned a verdict
+    if goal_state is None:
+        goal_state = conv_state['goal_state']
+    if is_reached is None:
+        is_reached, goal_state = await goal_evaluator.evaluate(
+            model=settings['model'],
+            goal=scenario['goal'],
+            history=history,
+            state=goal_state,
+            session=_session(history_id)
+        )
+    
+    _record_evaluation(history_id, goal_state, is_reached)
+    if is_reached:
+        # Committed before REACHED is reported; see "Durability" in backend/journal.py.
+        await journal.sync(history_id)
+        background_tasks.add_task(generate_replacement_scenario, settings)
+    elif context_window.fold_target(history, conv_state) is not None:
+        background_tasks.add_task(_fold_context, settings, scenario, history_id, history, conv_state)
+    return is_reached
+
+async def _run_summary_job(payload: dict):
+    # Get full history including the final bot message for accurate summary
+    history_id = payload['history_id']
+    full_history = await journal.get_conversation(history_id)
+    conversation_summary = await ollama_client.generate_conversation_summary(
+        model=payload['model'],
+        practice_language=payload['practice_language'],
+        ui_language=payload['ui_language'],
+        goal=payload['goal'],
+        history=full_history,
+        session=_session(history_id)
     )
+    if conversation_summary is None:
+        raise RuntimeError("Summary could not be generated")
+    await async_storage.save_conversation_summary(history_id, conversation_summary)
+
+jobs.register("summary", _run_summary_job)
+
+async def _enqueue_summary(settings, scenario, history_id):
+    # _evaluate_turn has already committed the completion.
+    await jobs.enqueue("summary", {
+        "history_id": history_id,
+        "model": settings['model'],
+        "practice_language": settings['practice_language'],
+        "ui_language": settings['ui_language'],
+        "goal": scenario['goal'],
+    }, history_id=history_id)
+
+@app.post("/api/chat/turn")
+async def process_chat_turn(turn: ChatTurn, background_tasks: BackgroundTasks):
+    settings, scenario, history_id, history, conv_state = await _begin_turn(turn)
+    chat_args = _chat_args(settings, scenario, history_id, history, conv_state, turn.message)
+    precheck = _start_precheck(settings, scenario, history_id, history, conv_state) if TURN_MODE == "pipelined" else None
     
-    status = "REACHED" if is_reached else "PENDING"
+    try:
+        async with scenario_pool.interactive():
+            # Generate bot response
+            bot_response, is_reached, goal_state = None, None, None
+            if TURN_MODE == "fused":
+                bot_response, is_reached = await ollama_client.chat_turn_fused(**chat_args)
+            if bot_response is None:
+                is_reached = None
+                bot_response = await ollama_client.chat_turn(**chat_args)
+            if furigana.enabled_for(settings['practice_language']):
+                bot_response = furigana.annotate(bot_response)
+            if precheck is not None:
+                is_reached, goal_state = await _precheck_result(precheck)
+        
+            is_reached = await _evaluate_turn(settings, scenario, history_id, history, conv_state, bot_response, background_tasks, is_reached, goal_state)
+            status = "REACHED" if is_reached else "PENDING"
+    finally:
+        if precheck is not None:
+            # No-op once it has finished; stops it when the turn failed or was cancelled.
+            precheck.cancel()
     
-    conversation_summary = None
     if is_reached:
-        # Get full history including the final bot message for accurate summary
-        full_history = storage.get_conversation(history_id)
-        storage.mark_conversation_completed(history_id)
-        storage.update_settings(add_score=1)
-        background_tasks.add_task(generate_replacement_scenario, settings)
-        # Generate summary synchronously so it can be returned in the response
-        try:
-            conversation_summary = await ollama_client.generate_conversation_summary(
-                model=settings['model'],
-                practice_language=settings['practice_language'],
-                ui_language=settings['ui_language'],
-                goal=scenario['goal'],
-                history=full_history
-            )
-            storage.save_conversation_summary(history_id, conversation_summary)
-        except Exception as e:
-            print(f"Failed to generate conversation summary inline: {e}")
+        # The summary is produced by a background job; poll /api/history/{id}/summary for it
+        await _enqueue_summary(settings, scenario, history_id)
         
     return {
         "bot_message": bot_response,
         "status": status,
-        "summary": conversation_summary
+        "summary": None,
+        "summary_status": "pending" if is_reached else None,
+        "history_id": history_id
     }
 
+@app.post("/api/chat/turn/stream")
+async def process_chat_turn_stream(turn: ChatTurn, background_tasks: BackgroundTasks):
+    """Streams a chat turn as NDJSON events: "token"* -> "reply"? -> "status" -> "summary_pending"? -> "done".
+
+    The reply tokens are forwarded as Ollama produces them, so the goal evaluation
+    no longer delays the first visible output. With local furigana, "reply"
+    carries the full reply with <ruby> readings added. The summary of a completed
+    conversation is generated by a background job the client then waits on.
+    """
+    settings, scenario, history_id, history, conv_state = await _begin_turn(turn)
+    chat_args = _chat_args(settings, scenario, history_id, history, conv_state, turn.message)
+    
+    async def events():
+        precheck = _start_precheck(settings, scenario, history_id, history, conv_state) if TURN_MODE == "pipelined" else None
+        try:
+            async with scenario_pool.interactive():
+                parts = []
+                is_reached, goal_state = None, None
+                if TURN_MODE == "fused":
+                    async for kind, value in ollama_client.chat_turn_fused_stream(**chat_args):
+                        if kind == "token":
+                            parts.append(value)
+                            yield _ndjson({"type": "token", "content": value})
+                        else:
+                            is_reached = value
+                if not parts:
+                    is_reached = None
+                    async for chunk in ollama_client.chat_turn_stream(**chat_args):
+                        parts.append(chunk)
+                        yield _ndjson({"type": "token", "content": chunk})
+                bot_response = "".join(parts)
+                if furigana.enabled_for(settings['practice_language']):
+                    # Tokens arrive as plain Japanese; the client swaps in the annotated reply.
+                    bot_response = furigana.annotate(bot_response)
+                    yield _ndjson({"type": "reply", "content": bot_response})
+                if precheck is not None:
+                    is_reached, goal_state = await _precheck_result(precheck)
+        
+                is_reached = await _evaluate_turn(settings, scenario, history_id, history, conv_state, bot_response, background_tasks, is_reached, goal_state)
+                yield _ndjson({"type": "status", "status": "REACHED" if is_reached else "PENDING"})
+        
+            if is_reached:
+                await _enqueue_summary(settings, scenario, history_id)
+                yield _ndjson({"type": "summary_pending", "history_id": history_id})
+            yield _ndjson({"type": "done"})
+        finally:
+            if precheck is not None:
+                # Also runs when the client disconnects mid-stream.
+                precheck.cancel()
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 async def generate_replacement_scenario(settings):
     try:
-        new_scen = await ollama_client.generate_scenarios(
-            settings['model'], 
-            settings['practice_language'], 
-            settings['ui_language'],
-            count=1
-        )
+        new_scen = await scenario_pool.take(settings, count=1)
         if new_scen:
-            storage.save_scenarios(new_scen, clear=False)
+            await async_storage.save_scenarios(new_scen, clear=False)
     except Exception as e:
         print(f"Failed to generate replacement scenario: {e}")
 
@@ -163,64 +424,111 @@ async def generate_replacement_scenario(settings):
 
 @app.post("/api/chat/abandon")
 async def abandon_chat(abandon: ChatAbandon):
-    history_id = storage.get_incomplete_conversation(abandon.scenario_id)
+    history_id = await async_storage.get_incomplete_conversation(abandon.scenario_id)
     if history_id:
-        storage.abandon_conversation(history_id)
+        await journal.sync(history_id)
+        await async_storage.abandon_conversation(history_id)
+        journal.forget(history_id)
     return {"success": True}
 
-@app.post("/api/chat/hint")
-async def get_hint(abandon: ChatAbandon):
+def _load_hint_context(scenario_id: str):
     settings = storage.get_settings()
-    scenario = storage.get_scenario(abandon.scenario_id)
+    scenario = storage.get_scenario(scenario_id)
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
         
-    history_id = storage.get_incomplete_conversation(abandon.scenario_id)
-    history = storage.get_conversation(history_id) if history_id else []
+    history_id = storage.get_incomplete_conversation(scenario_id)
+    return settings, scenario, history_id
+
+@app.post("/api/chat/hint")
+async def get_hint(abandon: ChatAbandon):
+    settings, scenario, history_id = await async_storage.run(_load_hint_context, abandon.scenario_id)
+    history = await journal.get_conversation(history_id) if history_id else []
     
-    hint = await ollama_client.generate_hint(
-         model=settings['model'],
-         practice_language=settings['practice_language'],
-         ui_language=settings['ui_language'],
-         setting=scenario['setting'],
-         goal=scenario['goal'],
-         history=history
-    )
+    async with scenario_pool.interactive():
+        hint = await ollama_client.generate_hint(
+             model=settings['model'],
+             practice_language=settings['practice_language'],
+             ui_language=settings['ui_language'],
+             setting=scenario['setting'],
+             goal=scenario['goal'],
+             history=history,
+             session=_session(history_id) if history_id else None
+        )
     return {"hint": hint}
 
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
 @app.get("/api/history")
-async def get_history():
-    return {"history": storage.get_completed_conversations()}
+async def get_history(limit: int = HISTORY_PAGE_SIZE, cursor: int = None):
+    """Completed conversations, newest first, one page at a time.
+
+    Pass the returned `next_cursor` as `cursor` to get the next page; it is
+    null on the last page. Summaries are fetched per conversation.
+    """
+    limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+    rows = await async_storage.get_completed_conversations(limit + 1, before_id=cursor)
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    return {"history": rows[:limit], "next_cursor": next_cursor}
+
+MAX_SEARCH_RESULTS = 50
+
+@app.get("/api/history/search")
+async def search_history(q: str, limit: int = 20):
+    """Ranked hits in completed conversations' messages and summaries, with <mark>ed snippets."""
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    return {"results": await async_storage.search_conversations(q, limit)}
 
 @app.get("/api/history/{history_id}")
 async def get_history_detail(history_id: int):
     # Simply retrieve the array. The history_id acts as the existence check, and an empty list is valid.
-    conversation = storage.get_conversation(history_id)
+    conversation = await journal.get_conversation(history_id)
     return {"conversation": conversation}
 
+# Longest a summary request may be held open waiting for the job (long polling).
+MAX_SUMMARY_WAIT_SECONDS = 60.0
+
 @app.get("/api/history/{history_id}/summary")
-async def get_history_summary(history_id: int):
-    summary = storage.get_conversation_summary(history_id)
-    return {"summary": summary}
+async def get_history_summary(history_id: int, wait: float = 0):
+    """Returns the summary and its status: done, pending, failed or none.
+
+    With `wait` > 0 a pending summary is waited for up to that many seconds
+    before answering, so clients can subscribe instead of polling rapidly.
+    """
+    summary, status, job_id = await async_storage.get_summary_state(history_id)
+    if status == "pending" and wait > 0:
+        await jobs.wait(job_id, min(wait, MAX_SUMMARY_WAIT_SECONDS))
+        summary, status, _ = await async_storage.get_summary_state(history_id)
+    return {"summary": summary, "status": status}
 
 @app.delete("/api/history/{history_id}")
 async def delete_history_item(history_id: int):
-    storage.delete_conversation(history_id)
+    await journal.sync(history_id)
+    await async_storage.delete_conversation(history_id)
+    journal.forget(history_id)
     return {"success": True}
 
 @app.delete("/api/history")
 async def delete_all_history():
-    storage.delete_all_conversations()
+    await journal.sync_learner()
+    await async_storage.delete_all_conversations()
+    journal.forget()
     return {"success": True}
 
 # --- Static files matching ---
-app.mount("/static", StaticFiles(directory="frontend"), name="static")
+# Served from the asset table (backend/assets.py): precompressed, content-hashed and cached.
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def static_asset(path: str, request: Request):
+    return assets.response(f"{assets.STATIC_URL}/{path}", request.headers)
 
 # Expose clipart files directly
-app.mount("/api/clipart", StaticFiles(directory="data/clipart"), name="clipart")
+@app.api_route("/api/clipart/{path:path}", methods=["GET", "HEAD"])
+async def clipart_asset(path: str, request: Request):
+    return assets.response(f"{assets.CLIPART_URL}/{path}", request.headers)
 
 # Serve index.html
-@app.get("/")
-@app.get("/index.html")
-def root():
-    return FileResponse("frontend/index.html")
+@app.api_route("/", methods=["GET", "HEAD"])
+@app.api_route("/index.html", methods=["GET", "HEAD"])
+async def root(request: Request):
+    return assets.response(request.url.path, request.headers)
@@ -0,0 +1,209 @@
+"""In-process metrics, exposed in the Prometheus text format at /api/metrics.
+
+Recording is a dict lookup and a few additions, cheap enough for the hot paths
+it hooks into: every storage call (async_storage.run), every Ollama request
+(ollama_client), scheduler queueing and each HTTP request (MetricsMiddleware).
+Storage calls record from the database threads, so each metric has a lock;
+rendering copies the values under it and formats them outside.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, Sequence, Tuple
+
+# Seconds. Storage calls are mostly sub-millisecond; model calls take seconds to minutes.
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Ollama always reports a few milliseconds of load_duration; more than this means the model was loaded from disk.
+COLD_LOAD_SECONDS = 0.5
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+            for key, value in values
+        ]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # per label set: [count per bucket (+Inf last), sum]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        lines = self.header()
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: Dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+_registry = []
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "lingoflow_http_request_seconds", "Time from request start to the last byte of the response.",
+    ("method", "route", "status"))
+DB_CALL_SECONDS = Histogram(
+    "lingoflow_db_call_seconds", "Time spent running a storage call on the database thread.",
+    ("op",), DB_BUCKETS)
+DB_QUEUE_SECONDS = Histogram(
+    "lingoflow_db_queue_seconds", "Time a storage call waited for the database thread.",
+    (), DB_BUCKETS)
+LLM_QUEUE_SECONDS = Histogram(
+    "lingoflow_llm_queue_seconds", "Time an Ollama request waited in the scheduler for a slot.",
+    ("kind", "model"))
+LLM_REQUEST_SECONDS = Histogram(
+    "lingoflow_llm_request_seconds", "Duration of an Ollama request, from sending it to its last byte.",
+    ("kind", "model"))
+LLM_LOAD_SECONDS = Histogram(
+    "lingoflow_llm_load_seconds", "Model load time Ollama reported per request (load_duration).",
+    ("model",))
+LLM_COLD_LOADS = Counter(
+    "lingoflow_llm_cold_loads_total", f"Requests whose load_duration exceeded {COLD_LOAD_SECONDS}s.",
+    ("model",))
+LLM_PROMPT_TOKENS = Counter(
+    "lingoflow_llm_prompt_tokens_total", "Prompt tokens evaluated (prompt_eval_count).",
+    ("kind", "model"))
+LLM_GENERATED_TOKENS = Counter(
+    "lingoflow_llm_generated_tokens_total", "Tokens generated (eval_count).",
+    ("kind", "model"))
+LLM_EVAL_SECONDS = Counter(
+    "lingoflow_llm_eval_seconds_total", "Time spent generating tokens (eval_duration).",
+    ("kind", "model"))
+LLM_TOKENS_PER_SECOND = Gauge(
+    "lingoflow_llm_tokens_per_second", "Generation speed of the most recent request.",
+    ("model",))
+
+def record_ollama(kind: str, model: str, data: Dict):
+    """Takes the timing fields of a final Ollama response object (durations are in ns)."""
+    load = data.get("load_duration")
+    if load is not None:
+        LLM_LOAD_SECONDS.observe(load / 1e9, model=model)
+        if load / 1e9 > COLD_LOAD_SECONDS:
+            LLM_COLD_LOADS.inc(model=model)
+    if data.get("prompt_eval_count"):
+        LLM_PROMPT_TOKENS.inc(data["prompt_eval_count"], kind=kind, model=model)
+    generated, duration = data.get("eval_count"), data.get("eval_duration")
+    if generated:
+        LLM_GENERATED_TOKENS.inc(generated, kind=kind, model=model)
+        if duration:
+            LLM_EVAL_SECONDS.inc(duration / 1e9, kind=kind, model=model)
+            LLM_TOKENS_PER_SECOND.set(generated / (duration / 1e9), model=model)
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request until its response body is complete,
+    so streamed responses are measured in full. Labelled by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, method=scope["method"], route=route, status=status
+            )
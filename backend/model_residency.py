@@ -0,0 +1,65 @@
+import asyncio
+import time
+from typing import Dict
+
+from backend import metrics
+from backend import ollama_client
+from backend import ollama_router
+
+# Loading a large model from disk can take far longer than a normal request.
+WARM_TIMEOUT = 600.0
+
+_state: Dict[str, Dict] = {}
+_tasks = set()
+
+async def _warm_node(node, model: str) -> float:
+    # A generate request without a prompt just loads the model and applies keep_alive.
+    res = await ollama_client.get_client().post(
+        f"{node.api}/generate",
+        json={"model": model, "keep_alive": ollama_client.KEEP_ALIVE},
+        timeout=WARM_TIMEOUT
+    )
+    res.raise_for_status()
+    ollama_router.mark_success(node, model)
+    data = res.json()
+    metrics.record_ollama("warm", model, data)
+    return data.get("load_duration", 0) / 1e6
+
+async def warm(model: str, refresh: bool = False):
+    """Loads `model` on every healthy node that has it, so no learner pays the cold start."""
+    if refresh:
+        await ollama_router.refresh_all(ollama_client.get_client())
+    nodes = [
+        n for n in ollama_router.nodes()
+        if n.healthy and (n.available is None or model in n.available)
+    ]
+    _state[model] = {"state": "loading", "started_at": time.time(), "nodes": {}}
+    if not nodes:
+        _state[model].update(state="unavailable", finished_at=time.time())
+        return
+
+    results = await asyncio.gather(*(_warm_node(n, model) for n in nodes), return_exceptions=True)
+    per_node = {}
+    for node, result in zip(nodes, results):
+        if isinstance(result, Exception):
+            ollama_router.mark_failure(node, result)
+            per_node[node.url] = {"state": "failed", "error": str(result) or type(result).__name__}
+        else:
+            per_node[node.url] = {"state": "resident", "load_ms": round(result, 1)}
+    resident = any(r["state"] == "resident" for r in per_node.values())
+    _state[model].update(state="resident" if resident else "failed", nodes=per_node, finished_at=time.time())
+
+def warm_in_background(model: str, refresh: bool = False):
+    task = asyncio.create_task(warm(model, refresh))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+def is_resident(model: str) -> bool:
+    return any(model in n.resident for n in ollama_router.nodes())
+
+def snapshot() -> Dict:
+    return {
+        "keep_alive": ollama_client.KEEP_ALIVE,
+        "warmups": _state,
+        "nodes": [{"url": n.url, "healthy": n.healthy, "resident": sorted(n.resident)} for n in ollama_router.nodes()],
+    }
@@ -1,9 +1,23 @@
 import os
 import json
+import asyncio
+import hashlib
+import time
 import httpx
-from typing import List, Dict
+from contextlib import aclosing
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 
-OLLAMA_BASE_URL = "http://localhost:11434/api"
+from backend import prompt_registry
+from backend import scheduler
+from backend import ollama_router
+from backend import response_cache
+from backend import furigana
+from backend import metrics
+from backend import clipart
+from backend.json_stream import JsonArrayStreamReader, JsonStringFieldReader
+
+# How long Ollama keeps a model loaded after each request (sent explicitly so it never falls back to the server default).
+KEEP_ALIVE = os.environ.get("LINGOFLOW_KEEP_ALIVE", "30m")
 
 _client: httpx.AsyncClient = None
 
@@ -13,10 +27,93 @@ def get_client() -> httpx.AsyncClient:
         _client = httpx.AsyncClient(timeout=120.0)
     return _client
 
+async def _post_json(kind: str, path: str, payload: Dict, session: str = None) -> Dict:
+    """POSTs to Ollama through the scheduler; identical concurrent requests share one call.
+    
+    The router picks the node (sticky per `session`) and fails over to the next
+    one on connection errors or 5xx responses.
+    """
+    payload.setdefault("keep_alive", KEEP_ALIVE)
+    body = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    key = hashlib.sha1(f"{path}\n{body}".encode("utf-8")).hexdigest()
+    model = payload["model"]
+    
+    async def send():
+        tried, last_error = [], None
+        while True:
+            node = ollama_router.pick(model, session, exclude=tried)
+            if node is None:
+                raise last_error or httpx.ConnectError("no Ollama nodes available")
+            tried.append(node)
+            node.in_flight += 1
+            started = time.perf_counter()
+            try:
+                res = await get_client().post(f"{node.api}{path}", json=payload)
+                res.raise_for_status()
+                data = res.json()
+            except Exception as e:
+                if not ollama_router.is_retryable(e):
+                    raise
+                ollama_router.mark_failure(node, e)
+                last_error = e
+                continue
+            finally:
+                node.in_flight -= 1
+            ollama_router.mark_success(node, model)
+            metrics.LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, kind=kind, model=model)
+            metrics.record_ollama(kind, model, data)
+            return data
+    
+    return await scheduler.submit(kind, model, send, key=key)
+
+async def _stream_json(kind: str, path: str, payload: Dict, session: str = None) -> AsyncIterator[Dict]:
+    """Streams Ollama's NDJSON response objects, holding a scheduler slot until the stream ends.
+    
+    Fails over to another node like _post_json, but only before the first object was yielded.
+    """
+    payload.setdefault("keep_alive", KEEP_ALIVE)
+    model = payload["model"]
+    async with scheduler.slot(kind, model):
+        tried, last_error = [], None
+        while True:
+            node = ollama_router.pick(model, session, exclude=tried)
+            if node is None:
+                raise last_error or httpx.ConnectError("no Ollama nodes available")
+            tried.append(node)
+            node.in_flight += 1
+            started = False
+            sent_at = time.perf_counter()
+            try:
+                async with get_client().stream("POST", f"{node.api}{path}", json=payload) as res:
+                    res.raise_for_status()
+                    async for line in res.aiter_lines():
+                        if not line:
+                            continue
+                        data = json.loads(line)
+                        started = True
+                        if data.get("done"):
+                            # The final object carries the token counts and durations
+                            metrics.LLM_REQUEST_SECONDS.observe(time.perf_counter() - sent_at, kind=kind, model=model)
+                            metrics.record_ollama(kind, model, data)
+                        yield data
+                        if data.get("done"):
+                            break
+            except Exception as e:
+                if started or not ollama_router.is_retryable(e):
+                    raise
+                ollama_router.mark_failure(node, e)
+                last_error = e
+                continue
+            finally:
+                node.in_flight -= 1
+            ollama_router.mark_success(node, model)
+            return
+
+def format_transcript(history: List[Dict]) -> str:
+    return "".join(f"{turn['speaker']}: {turn['content']}\n" for turn in history)
+
 def load_prompt(filename: str) -> str:
-    path = os.path.join("prompts", filename)
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
+    return prompt_registry.get(filename).text
 
 def clean_json_response(response_text: str) -> str:
     response_text = response_text.strip()
@@ -28,9 +125,9 @@ def clean_json_response(response_text: str) -> str:
         response_text = response_text[:-3]
     return response_text.strip()
 
-async def get_available_models() -> List[Dict]:
+async def _node_models(node) -> List[Dict]:
     try:
-        res = await get_client().get(f"{OLLAMA_BASE_URL}/tags")
+        res = await get_client().get(f"{node.api}/tags")
         if res.status_code == 200:
             data = res.json()
             return [
@@ -44,95 +141,311 @@ async def get_available_models() -> List[Dict]:
         pass
     return []
 
-async def generate_scenarios(model: str, practice_language: str, ui_language: str, count: int = 5) -> List[Dict]:
+async def get_available_models() -> List[Dict]:
+    """Models available on any of the configured Ollama nodes."""
+    merged = {}
+    for models in await asyncio.gather(*(_node_models(n) for n in ollama_router.nodes())):
+        for m in models:
+            merged.setdefault(m['name'], m)
+    return list(merged.values())
+
+def _check_clipart(scenario: Dict) -> Dict:
+    # The LLM's clipart is rarely a real file; use the closest one we have (or the default).
+    scenario['clipart'] = clipart.resolve(scenario.get('clipart'))
+    return scenario
+
+async def generate_scenarios_stream(model: str, practice_language: str, ui_language: str, count: int = 5) -> AsyncIterator[Dict]:
+    """Yields each generated scenario as soon as the model has finished writing it.
+
+    Malformed elements are skipped, and if the stream breaks off the scenarios
+    completed so far have already been yielded.
+    """
     prompt_template = load_prompt("generate_scenarios.txt")
     prompt = prompt_template.format(practice_language=practice_language, ui_language=ui_language, count=count)
     
+    reader = JsonArrayStreamReader()
     try:
-        res = await get_client().post(
-            f"{OLLAMA_BASE_URL}/generate",
-            json={
-                "model": model,
-                "prompt": prompt,
-                "stream": False
-            }
-        )
-        data = res.json()
-        response_text = data.get("response", "[]")
-        clean_str = clean_json_response(response_text)
-        scenarios = json.loads(clean_str)
-        
-        # Simple validation
-        if not isinstance(scenarios, list):
-            return []
-        
-        # Check for clipart map; if LLM output isn't a real file, fallback to default.
-        for val in scenarios:
-            clipart_name = val.get('clipart', 'default_conversation.png')
-            if not os.path.exists(os.path.join("data", "clipart", clipart_name)):
-                val['clipart'] = "default_conversation.png"
-                 
-        return scenarios
+        # aclosing: a caller that stops early (it has enough scenarios) releases the slot at once
+        async with aclosing(_stream_json("scenario", "/generate", {
+            "model": model,
+            "prompt": prompt,
+            "stream": True
+        })) as stream:
+            async for data in stream:
+                for item in reader.feed(data.get("response", "")):
+                    if isinstance(item, dict):
+                        yield _check_clipart(item)
     except Exception as e:
         print(f"Error generating scenarios: {e}")
-        return []
+    if reader.errors:
+        print(f"Skipped {reader.errors} malformed scenario(s) in the model output")
+
+async def generate_scenarios(model: str, practice_language: str, ui_language: str, count: int = 5) -> List[Dict]:
+    return [s async for s in generate_scenarios_stream(model, practice_language, ui_language, count)]
 
-async def chat_turn(model: str, practice_language: str, ui_language: str, setting: str, goal: str, history: List[Dict], user_message: str) -> str:
+CHAT_ERROR_REPLY = "I'm sorry, I'm having trouble thinking."
+
+CONTEXT_SUMMARY_HEADER = "Summary of the earlier part of this conversation:\n"
+
+def build_chat_messages(practice_language: str, ui_language: str, setting: str, goal: str, history: List[Dict], user_message: str, context_summary: str = None) -> List[Dict]:
+    # With local furigana the model writes plain Japanese (far fewer output tokens), and
+    # earlier replies are sent without their readings too.
+    local_furigana = furigana.enabled_for(practice_language)
     sys_prompt_template = load_prompt("chat_system_prompt.txt")
     sys_prompt = sys_prompt_template.format(
         practice_language=practice_language, 
         ui_language=ui_language, 
         scenario_setting=setting, 
-        scenario_goal=goal
+        scenario_goal=goal,
+        japanese_script_rules=load_prompt("japanese_plain_rules.txt" if local_furigana else "japanese_ruby_rules.txt")
     )
     
     messages = [{"role": "system", "content": sys_prompt}]
+    if context_summary:
+        messages.append({"role": "system", "content": CONTEXT_SUMMARY_HEADER + context_summary})
     for turn in history:
-        messages.append({"role": "user" if turn['speaker'] == 'User' else "assistant", "content": turn['content']})
+        content = furigana.strip(turn['content']) if local_furigana else turn['content']
+        messages.append({"role": "user" if turn['speaker'] == 'User' else "assistant", "content": content})
         
     messages.append({"role": "user", "content": user_message})
+    return messages
+
+async def chat_turn(model: str, practice_language: str, ui_language: str, setting: str, goal: str, history: List[Dict], user_message: str, context_summary: str = None, session: str = None) -> str:
+    messages = build_chat_messages(practice_language, ui_language, setting, goal, history, user_message, context_summary)
     
     try:
-        res = await get_client().post(
-            f"{OLLAMA_BASE_URL}/chat",
-            json={
-                "model": model,
-                "messages": messages,
-                "stream": False
-            }
-        )
-        data = res.json()
+        data = await _post_json("chat", "/chat", {
+            "model": model,
+            "messages": messages,
+            "stream": False
+        }, session=session)
         return data["message"]["content"]
     except Exception as e:
         print(f"Error in chat turn: {e}")
-        return "I'm sorry, I'm having trouble thinking."
+        return CHAT_ERROR_REPLY
+
+async def chat_turn_stream(model: str, practice_language: str, ui_language: str, setting: str, goal: str, history: List[Dict], user_message: str, context_summary: str = None, session: str = None) -> AsyncIterator[str]:
+    """Same as chat_turn, but yields the reply piece by piece as Ollama produces it."""
+    messages = build_chat_messages(practice_language, ui_language, setting, goal, history, user_message, context_summary)
+    
+    produced = False
+    try:
+        async for data in _stream_json("chat", "/chat", {
+            "model": model,
+            "messages": messages,
+            "stream": True
+        }, session=session):
+            chunk = data.get("message", {}).get("content", "")
+            if chunk:
+                produced = True
+                yield chunk
+    except Exception as e:
+        print(f"Error in streamed chat turn: {e}")
+    
+    if not produced:
+        yield CHAT_ERROR_REPLY
+
+# JSON schema passed as Ollama's `format` so one /api/chat call returns both the reply and the verdict.
+FUSED_TURN_FORMAT = {
+    "type": "object",
+    "properties": {
+        "reply": {"type": "string"},
+        "goal_status": {"type": "string", "enum": ["REACHED", "PENDING"]}
+    },
+    "required": ["reply", "goal_status"]
+}
+
+def build_fused_messages(practice_language: str, ui_language: str, setting: str, goal: str, history: List[Dict], user_message: str, context_summary: str = None) -> List[Dict]:
+    messages = build_chat_messages(practice_language, ui_language, setting, goal, history, user_message, context_summary)
+    instructions = load_prompt("fused_turn_instructions.txt").format(scenario_goal=goal)
+    messages[0]["content"] += "\n\n" + instructions
+    return messages
+
+def parse_goal_status(value) -> Optional[bool]:
+    if isinstance(value, str) and value.strip().upper() in ("REACHED", "PENDING"):
+        return value.strip().upper() == "REACHED"
+    return None
+
+def parse_fused_turn(response_text: str) -> Tuple[Optional[str], Optional[bool]]:
+    """Returns (reply, is_reached); either is None when the model's output for it is unusable."""
+    try:
+        data = json.loads(clean_json_response(response_text))
+    except ValueError:
+        return None, None
+    if not isinstance(data, dict):
+        return None, None
+    reply = data.get("reply")
+    if not isinstance(reply, str) or not reply.strip():
+        reply = None
+    return reply, parse_goal_status(data.get("goal_status"))
+
+async def chat_turn_fused(model: str, practice_language: str, ui_language: str, setting: str, goal: str, history: List[Dict], user_message: str, context_summary: str = None, session: str = None) -> Tuple[Optional[str], Optional[bool]]:
+    messages = build_fused_messages(practice_language, ui_language, setting, goal, history, user_message, context_summary)
+    
+    try:
+        data = await _post_json("chat", "/chat", {
+            "model": model,
+            "messages": messages,
+            "format": FUSED_TURN_FORMAT,
+            "stream": False
+        }, session=session)
+        return parse_fused_turn(data["message"]["content"])
+    except Exception as e:
+        print(f"Error in fused chat turn: {e}")
+        return None, None
+
+async def chat_turn_fused_stream(model: str, practice_language: str, ui_language: str, setting: str, goal: str, history: List[Dict], user_message: str, context_summary: str = None, session: str = None) -> AsyncIterator[Tuple[str, object]]:
+    """Streams a fused turn as ("token", text) pairs, ending with one ("verdict", is_reached).
 
-async def evaluate_goal(model: str, goal: str, history: List[Dict]) -> bool:
+    The reply is decoded out of the JSON object while it is still being generated.
+    The verdict is None when the model's output could not be parsed; no tokens at
+    all means the reply itself was unusable.
+    """
+    messages = build_fused_messages(practice_language, ui_language, setting, goal, history, user_message, context_summary)
+    
+    reader = JsonStringFieldReader("reply")
+    raw = []
+    try:
+        async for data in _stream_json("chat", "/chat", {
+            "model": model,
+            "messages": messages,
+            "format": FUSED_TURN_FORMAT,
+            "stream": True
+        }, session=session):
+            chunk = data.get("message", {}).get("content", "")
+            if chunk:
+                raw.append(chunk)
+                text = reader.feed(chunk)
+                if text:
+                    yield "token", text
+    except Exception as e:
+        print(f"Error in streamed fused chat turn: {e}")
+        yield "verdict", None
+        return
+    
+    _, is_reached = parse_fused_turn("".join(raw))
+    yield "verdict", is_reached
+
+async def evaluate_goal(model: str, goal: str, history: List[Dict], session: str = None) -> bool:
     prompt_template = load_prompt("goal_evaluation.txt")
     
-    history_str = ""
-    for turn in history:
-        history_str += f"{turn['speaker']}: {turn['content']}\n"
-        
+    history_str = format_transcript(history)
     prompt = prompt_template.format(scenario_goal=goal, conversation_history=history_str)
     
     try:
-        res = await get_client().post(
-            f"{OLLAMA_BASE_URL}/generate",
-            json={
-                "model": model,
-                "prompt": prompt,
-                "stream": False
-            }
-        )
-        data = res.json()
+        data = await _post_json("evaluate", "/generate", {
+            "model": model,
+            "prompt": prompt,
+            "stream": False
+        }, session=session)
         response_text = data.get("response", "").strip().upper()
         return "REACHED" in response_text
     except Exception as e:
         print(f"Error evaluating goal: {e}")
         return False
 
-async def generate_conversation_summary(model: str, practice_language: str, ui_language: str, goal: str, history: List[Dict]) -> str:
+# Structured output for the incremental evaluator: rolling notes plus the verdict.
+GOAL_PROGRESS_FORMAT = {
+    "type": "object",
+    "properties": {
+        "progress": {"type": "string"},
+        "goal_status": {"type": "string", "enum": ["REACHED", "PENDING"]}
+    },
+    "required": ["progress", "goal_status"]
+}
+
+async def evaluate_goal_incremental(model: str, goal: str, progress_notes: str, latest: List[Dict], session: str = None) -> Tuple[Optional[bool], Optional[str]]:
+    """Judges only the newest messages against the evaluator's notes from earlier turns.
+    
+    Returns (is_reached, updated_notes); (None, None) when the output was unusable.
+    """
+    prompt = load_prompt("goal_evaluation_incremental.txt").format(
+        scenario_goal=goal,
+        progress_notes=progress_notes or "(nothing accomplished yet)",
+        latest_exchange=format_transcript(latest)
+    )
+    
+    try:
+        data = await _post_json("evaluate", "/generate", {
+            "model": model,
+            "prompt": prompt,
+            "format": GOAL_PROGRESS_FORMAT,
+            "stream": False
+        }, session=session)
+        result = json.loads(clean_json_response(data.get("response", "")))
+        progress = result.get("progress") if isinstance(result, dict) else None
+        is_reached = parse_goal_status(result.get("goal_status")) if isinstance(result, dict) else None
+        if is_reached is None or not isinstance(progress, str):
+            return None, None
+        return is_reached, progress.strip()
+    except Exception as e:
+        print(f"Error evaluating goal incrementally: {e}")
+        return None, None
+
+# The pre-check may also defer to the post-reply evaluation.
+GOAL_PRECHECK_FORMAT = {
+    "type": "object",
+    "properties": {
+        "progress": {"type": "string"},
+        "goal_status": {"type": "string", "enum": ["REACHED", "PENDING", "DEPENDS"]}
+    },
+    "required": ["progress", "goal_status"]
+}
+
+async def precheck_goal(model: str, goal: str, progress_notes: str, latest: List[Dict], session: str = None) -> Tuple[Optional[str], Optional[str]]:
+    """Judges a turn from the user's new message alone, before the bot has replied.
+    
+    Returns (status, updated_notes) with status REACHED, PENDING or DEPENDS;
+    (None, None) when the output was unusable.
+    """
+    prompt = load_prompt("goal_precheck.txt").format(
+        scenario_goal=goal,
+        progress_notes=progress_notes or "(nothing accomplished yet)",
+        latest_exchange=format_transcript(latest)
+    )
+    
+    try:
+        data = await _post_json("evaluate", "/generate", {
+            "model": model,
+            "prompt": prompt,
+            "format": GOAL_PRECHECK_FORMAT,
+            "stream": False
+        }, session=session)
+        result = json.loads(clean_json_response(data.get("response", "")))
+        if not isinstance(result, dict):
+            return None, None
+        status, progress = result.get("goal_status"), result.get("progress")
+        status = status.strip().upper() if isinstance(status, str) else None
+        if status not in ("REACHED", "PENDING", "DEPENDS") or not isinstance(progress, str):
+            return None, None
+        return status, progress.strip()
+    except (httpx.HTTPError, ValueError) as e:
+        # Ollama unreachable, failing or timing out, or output that is not JSON; anything else is a bug.
+        print(f"Error pre-checking goal: {e}")
+        return None, None
+
+async def summarize_context(model: str, ui_language: str, goal: str, previous_summary: str, history: List[Dict], session: str = None) -> Optional[str]:
+    """Folds older messages into the running summary used by the chat context window."""
+    prompt = load_prompt("context_summary.txt").format(
+        ui_language=ui_language,
+        scenario_goal=goal,
+        previous_summary=previous_summary or "(none yet)",
+        conversation_history=format_transcript(history)
+    )
+    
+    try:
+        data = await _post_json("summary", "/generate", {
+            "model": model,
+            "prompt": prompt,
+            "stream": False
+        }, session=session)
+        return data.get("response", "").strip() or None
+    except Exception as e:
+        print(f"Error summarizing conversation context: {e}")
+        return None
+
+async def generate_conversation_summary(model: str, practice_language: str, ui_language: str, goal: str, history: List[Dict], session: str = None) -> Optional[str]:
+    """Returns None when no summary could be produced, so the summary job can retry."""
     prompt_template = load_prompt("conversation_summary.txt")
     
     history_str = "\n".join(f"{turn['speaker']}: {turn['content']}" for turn in history)
@@ -144,28 +457,29 @@ async def generate_conversation_summary(model: str, practice_language: str, ui_l
         conversation_history=history_str
     )
     
+    cache_key = response_cache.make_key(model, "conversation_summary.txt", prompt)
+    cached = await response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
-        res = await get_client().post(
-            f"{OLLAMA_BASE_URL}/generate",
-            json={
-                "model": model,
-                "prompt": prompt,
-                "stream": False
-            }
-        )
-        data = res.json()
-        return data.get("response", "Summary could not be generated.")
+        data = await _post_json("summary", "/generate", {
+            "model": model,
+            "prompt": prompt,
+            "stream": False
+        }, session=session)
+        if "response" not in data:
+            return None
+        await response_cache.put(cache_key, data["response"])
+        return data["response"]
     except Exception as e:
         print(f"Error generating conversation summary: {e}")
-        return "Summary could not be generated."
+        return None
 
-async def generate_hint(model: str, practice_language: str, ui_language: str, setting: str, goal: str, history: List[Dict]) -> str:
+async def generate_hint(model: str, practice_language: str, ui_language: str, setting: str, goal: str, history: List[Dict], session: str = None) -> str:
     prompt_template = load_prompt("hint_generation.txt")
     
-    history_str = ""
-    for turn in history:
-        history_str += f"{turn['speaker']}: {turn['content']}\n"
-        
+    history_str = format_transcript(history)
     prompt = prompt_template.format(
         practice_language=practice_language,
         ui_language=ui_language,
@@ -174,17 +488,22 @@ async def generate_hint(model: str, practice_language: str, ui_language: str, se
         conversation_history=history_str
     )
     
+    # Pressing the hint button again on an unchanged conversation reuses the last hint.
+    cache_key = response_cache.make_key(model, "hint_generation.txt", prompt)
+    cached = await response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
-        res = await get_client().post(
-            f"{OLLAMA_BASE_URL}/generate",
-            json={
-                "model": model,
-                "prompt": prompt,
-                "stream": False
-            }
-        )
-        data = res.json()
-        return data.get("response", "Could not generate a hint.")
+        data = await _post_json("hint", "/generate", {
+            "model": model,
+            "prompt": prompt,
+            "stream": False
+        }, session=session)
+        if "response" not in data:
+            return "Could not generate a hint."
+        await response_cache.put(cache_key, data["response"])
+        return data["response"]
     except Exception as e:
         print(f"Error generating hint: {e}")
         return "Error loading hint."
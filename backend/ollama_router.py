@@ -0,0 +1,141 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+import httpx
+
+# Comma-separated Ollama servers, e.g. "http://gpu1:11434,http://gpu2:11434".
+OLLAMA_URLS = [
+    url.strip().rstrip("/")
+    for url in os.environ.get("LINGOFLOW_OLLAMA_URLS", "http://localhost:11434").split(",")
+    if url.strip()
+] or ["http://localhost:11434"]
+HEALTH_CHECK_INTERVAL = 10.0
+HEALTH_CHECK_TIMEOUT = 3.0
+# Conversations remembered for node affinity (so the node's KV cache for them can be reused).
+MAX_STICKY_SESSIONS = 10000
+
+class Node:
+    __slots__ = ("url", "healthy", "available", "resident", "in_flight", "failures", "last_error", "checked_at")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True  # optimistic until the first health check says otherwise
+        self.available: Optional[Set[str]] = None  # models pulled on the node (/api/tags)
+        self.resident: Set[str] = set()  # models currently loaded in memory (/api/ps)
+        self.in_flight = 0
+        self.failures = 0
+        self.last_error = None
+        self.checked_at = None
+
+    @property
+    def api(self) -> str:
+        return f"{self.url}/api"
+
+    def as_dict(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "available": sorted(self.available) if self.available is not None else None,
+            "resident": sorted(self.resident),
+            "in_flight": self.in_flight,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "checked_at": self.checked_at,
+        }
+
+_nodes: List[Node] = [Node(url) for url in OLLAMA_URLS]
+_sticky: "OrderedDict[str, Node]" = OrderedDict()
+_task: asyncio.Task = None
+
+def nodes() -> List[Node]:
+    return list(_nodes)
+
+def _rank(node: Node, model: str):
+    return (
+        not node.healthy,
+        model not in node.resident,
+        node.available is not None and model not in node.available,
+        node.in_flight,
+    )
+
+def pick(model: str, session: str = None, exclude: Iterable[Node] = ()) -> Optional[Node]:
+    """Chooses the node for a request: the conversation's sticky node if it is still
+    usable, otherwise a healthy node that already has the model loaded, then the
+    least busy one. Unhealthy nodes are only used when nothing else is left."""
+    candidates = [n for n in _nodes if n not in exclude]
+    if not candidates:
+        return None
+
+    if session is not None:
+        node = _sticky.get(session)
+        if node in candidates and node.healthy:
+            _sticky.move_to_end(session)
+            return node
+
+    node = min(candidates, key=lambda n: _rank(n, model))
+    if session is not None:
+        _sticky[session] = node
+        _sticky.move_to_end(session)
+        while len(_sticky) > MAX_STICKY_SESSIONS:
+            _sticky.popitem(last=False)
+    return node
+
+def mark_success(node: Node, model: str):
+    node.healthy = True
+    node.failures = 0
+    # Serving the request loaded the model, so it is resident there now.
+    node.resident.add(model)
+
+def mark_failure(node: Node, error: Exception):
+    node.healthy = False
+    node.failures += 1
+    node.last_error = str(error) or type(error).__name__
+
+def is_retryable(error: Exception) -> bool:
+    """Connection problems and server-side errors are worth retrying on another node."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+async def refresh(node: Node, client: httpx.AsyncClient):
+    try:
+        tags, ps = await asyncio.gather(
+            client.get(f"{node.api}/tags", timeout=HEALTH_CHECK_TIMEOUT),
+            client.get(f"{node.api}/ps", timeout=HEALTH_CHECK_TIMEOUT),
+        )
+        tags.raise_for_status()
+        node.available = {m['name'] for m in tags.json().get('models', [])}
+        # /api/ps is optional on older Ollama versions
+        if ps.status_code == 200:
+            node.resident = {m['name'] for m in ps.json().get('models', [])}
+        node.healthy = True
+        node.last_error = None
+    except Exception as e:
+        mark_failure(node, e)
+    node.checked_at = time.time()
+
+async def refresh_all(client: httpx.AsyncClient):
+    await asyncio.gather(*(refresh(node, client) for node in _nodes))
+
+async def _health_loop(client: httpx.AsyncClient):
+    while True:
+        await refresh_all(client)
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+def start(client: httpx.AsyncClient):
+    global _task
+    _task = asyncio.create_task(_health_loop(client))
+
+async def stop():
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+
+def stats() -> Dict:
+    return {"nodes": [n.as_dict() for n in _nodes], "sticky_sessions": len(_sticky)}
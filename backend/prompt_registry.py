@@ -0,0 +1,96 @@
+import hashlib
+import os
+import string
+from typing import Dict, Set
+
+from backend import file_watch
+
+PROMPTS_DIR = "prompts"
+
+# Placeholders each template is formatted with in ollama_client. A template that
+# uses anything else would raise KeyError at request time, so it is rejected at load.
+EXPECTED_PLACEHOLDERS: Dict[str, Set[str]] = {
+    "chat_system_prompt.txt": {"practice_language", "ui_language", "scenario_setting", "scenario_goal", "japanese_script_rules"},
+    "japanese_ruby_rules.txt": set(),
+    "japanese_plain_rules.txt": set(),
+    "fused_turn_instructions.txt": {"scenario_goal"},
+    "goal_evaluation.txt": {"scenario_goal", "conversation_history"},
+    "goal_evaluation_incremental.txt": {"scenario_goal", "progress_notes", "latest_exchange"},
+    "goal_precheck.txt": {"scenario_goal", "progress_notes", "latest_exchange"},
+    "context_summary.txt": {"ui_language", "scenario_goal", "previous_summary", "conversation_history"},
+    "conversation_summary.txt": {"practice_language", "ui_language", "scenario_goal", "conversation_history"},
+    "hint_generation.txt": {"practice_language", "ui_language", "scenario_setting", "scenario_goal", "conversation_history"},
+    "generate_scenarios.txt": {"practice_language", "ui_language", "count"},
+}
+
+# Development convenience: re-check prompt files for edits (by mtime) at most once per interval.
+RELOAD = os.environ.get("LINGOFLOW_PROMPT_RELOAD", "0") == "1"
+RELOAD_CHECK_INTERVAL = 1.0
+
+class PromptTemplateError(ValueError):
+    pass
+
+class PromptTemplate:
+    __slots__ = ("name", "text", "placeholders", "version", "mtime")
+
+    def __init__(self, name: str, text: str, mtime: float):
+        self.name = name
+        self.text = text
+        self.placeholders = template_placeholders(text)
+        self.version = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        self.mtime = mtime
+
+    def format(self, **kwargs) -> str:
+        return self.text.format(**kwargs)
+
+_templates: Dict[str, PromptTemplate] = {}
+_watch = file_watch.Watcher(RELOAD_CHECK_INTERVAL)
+
+def template_placeholders(text: str) -> Set[str]:
+    names = set()
+    for _, field, _, _ in string.Formatter().parse(text):
+        if field is not None:
+            names.add(field.split(".")[0].split("[")[0])
+    return names
+
+def _load(name: str) -> PromptTemplate:
+    path = os.path.join(PROMPTS_DIR, name)
+    mtime = os.stat(path).st_mtime
+    with open(path, "r", encoding="utf-8") as f:
+        template = PromptTemplate(name, f.read(), mtime)
+    _watch.remember(path)
+
+    expected = EXPECTED_PLACEHOLDERS.get(name)
+    if expected is not None:
+        unknown = template.placeholders - expected
+        if unknown:
+            raise PromptTemplateError(f"{name} uses unknown placeholders: {', '.join(sorted(unknown))}")
+        unused = expected - template.placeholders
+        if unused:
+            print(f"Prompt {name} does not use: {', '.join(sorted(unused))}")
+    return template
+
+def load_all():
+    """Loads and validates every known template; called once at startup."""
+    for name in EXPECTED_PLACEHOLDERS:
+        _templates[name] = _load(name)
+
+def _reload_changed():
+    if not _watch.due():
+        return
+    for path in sorted(_watch.changed()):
+        name = os.path.basename(path)
+        try:
+            _templates[name] = _load(name)
+            print(f"Reloaded prompt {name}")
+        except (OSError, PromptTemplateError) as e:
+            # Keep serving the last good version while the file is being edited.
+            print(f"Could not reload prompt {name}: {e}")
+
+def get(name: str) -> PromptTemplate:
+    if RELOAD:
+        _reload_changed()
+    template = _templates.get(name)
+    if template is None:
+        template = _templates[name] = _load(name)
+    return template
@@ -0,0 +1,75 @@
+"""Typed records for the rows every turn reads, and the per-learner cache holding them.
+
+Records are compact (`__slots__`) and read-only: storage hands out the cached
+instance itself, so a change is made by replacing it (`replace()`), never by
+mutating it. They also read like the dicts storage used to return
+(`settings['model']`, `dict(record)`), so handlers do not need to care.
+"""
+from typing import Dict, Optional
+
+class Record:
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*(row[name] for name in cls.__slots__))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only; use replace()")
+
+    def replace(self, **changes):
+        return type(self)(*(changes.get(name, getattr(self, name)) for name in self.__slots__))
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def keys(self):
+        return self.__slots__
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(getattr(self, n) == getattr(other, n) for n in self.__slots__)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{n}={getattr(self, n)!r}' for n in self.__slots__)})"
+
+class Settings(Record):
+    __slots__ = ("id", "theme", "model", "practice_language", "ui_language", "score")
+
+class Scenario(Record):
+    __slots__ = ("id", "setting", "goal", "description", "clipart")
+
+class ConversationState(Record):
+    """Per-conversation working state kept on the history row between turns."""
+    __slots__ = ("goal_state", "context_summary", "context_summary_upto")
+
+class LearnerCache:
+    """What storage knows about one learner's database. Only that learner's
+    database thread touches it, so it needs no lock of its own.
+
+    `scenarios` is None until the active set has been read; `open_conversations`
+    maps a scenario id to its incomplete conversation (None: known to have none).
+    """
+    __slots__ = ("settings", "scenarios", "open_conversations", "states")
+
+    def __init__(self):
+        self.settings: Optional[Settings] = None
+        self.scenarios: Optional[Dict[str, Scenario]] = None
+        self.open_conversations: Dict[str, Optional[int]] = {}
+        self.states: Dict[int, ConversationState] = {}
+
+    def forget_conversation(self, history_id: int):
+        self.states.pop(history_id, None)
+        for scenario_id in [s for s, h in self.open_conversations.items() if h == history_id]:
+            del self.open_conversations[scenario_id]
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from backend import async_storage
+from backend import prompt_registry
+
+# LLM responses that are safe to reuse for an identical prompt (hints, summaries).
+MAX_ENTRIES = int(os.environ.get("LINGOFLOW_RESPONSE_CACHE_SIZE", "512"))
+TTL_SECONDS = float(os.environ.get("LINGOFLOW_RESPONSE_CACHE_TTL", "3600"))
+# Also keep entries in SQLite so they survive restarts.
+PERSIST = os.environ.get("LINGOFLOW_RESPONSE_CACHE_PERSIST", "0") == "1"
+
+_entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+_hits = 0
+_misses = 0
+
+def make_key(model: str, template_name: str, prompt: str) -> str:
+    """Content address: the model, the template version and the fully formatted prompt."""
+    version = prompt_registry.get(template_name).version
+    return hashlib.sha256(f"{model}\0{template_name}@{version}\0{prompt}".encode("utf-8")).hexdigest()
+
+def _remember(key: str, value: str, expires_at: float):
+    _entries[key] = (expires_at, value)
+    _entries.move_to_end(key)
+    while len(_entries) > MAX_ENTRIES:
+        _entries.popitem(last=False)
+
+async def get(key: str) -> Optional[str]:
+    global _hits, _misses
+    now = time.time()
+    entry = _entries.get(key)
+    if entry is not None and entry[0] > now:
+        _entries.move_to_end(key)
+        _hits += 1
+        return entry[1]
+    _entries.pop(key, None)
+
+    if PERSIST:
+        row = await async_storage.get_cached_response(key, now)
+        if row is not None:
+            _remember(key, row['value'], row['expires_at'])
+            _hits += 1
+            return row['value']
+    _misses += 1
+    return None
+
+async def put(key: str, value: str):
+    expires_at = time.time() + TTL_SECONDS
+    _remember(key, value, expires_at)
+    if PERSIST:
+        await async_storage.save_cached_response(key, value, expires_at)
+
+def clear():
+    _entries.clear()
+
+def stats() -> Dict:
+    lookups = _hits + _misses
+    return {
+        "entries": len(_entries),
+        "max_entries": MAX_ENTRIES,
+        "ttl_seconds": TTL_SECONDS,
+        "persistent": PERSIST,
+        "hits": _hits,
+        "misses": _misses,
+        "hit_ratio": round(_hits / lookups, 4) if lookups else None,
+    }
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import time
+from contextlib import aclosing, asynccontextmanager
+from typing import AsyncIterator, Dict, List
+
+from backend import async_storage
+from backend import ollama_client
+
+# Refill whenever the pool for the current settings drops below this many scenarios.
+LOW_WATER = int(os.environ.get("LINGOFLOW_POOL_LOW_WATER", "10"))
+BATCH_SIZE = 5
+# Background generation only starts once no learner has been waiting on the model for this long.
+IDLE_SECONDS = 2.0
+RECHECK_SECONDS = 300.0
+# Give up on a refill round after this many batches that added nothing new.
+MAX_UNPRODUCTIVE_BATCHES = 3
+
+_wakeup: asyncio.Event = None
+_task: asyncio.Task = None
+# The pool is shared by all learners; refills cover every settings combination learners have used.
+_targets: Dict[tuple, Dict] = {}
+_in_flight = 0
+_last_activity = 0.0
+
+def _key(settings: Dict):
+    return settings['model'], settings['practice_language'], settings['ui_language']
+
+def _valid(scenario) -> bool:
+    return isinstance(scenario, dict) and all(
+        isinstance(scenario.get(k), str) and scenario[k] for k in ("id", "setting", "goal", "clipart")
+    )
+
+@asynccontextmanager
+async def interactive():
+    """Marks a span in which a learner is waiting on the model; refills hold off meanwhile."""
+    global _in_flight, _last_activity
+    _in_flight += 1
+    try:
+        yield
+    finally:
+        _in_flight -= 1
+        _last_activity = time.monotonic()
+
+async def _wait_until_idle():
+    while _in_flight or time.monotonic() - _last_activity < IDLE_SECONDS:
+        await asyncio.sleep(IDLE_SECONDS)
+
+def request_refill(settings: Dict = None):
+    """Tops up the pool for `settings` (model and language pair) in the background."""
+    if settings is not None:
+        _targets[_key(settings)] = settings
+    if _wakeup is not None:
+        _wakeup.set()
+
+async def generate_into_pool(settings: Dict, count: int = BATCH_SIZE) -> int:
+    scenarios = await ollama_client.generate_scenarios(*_key(settings), count=count)
+    return await async_storage.add_to_scenario_pool(*_key(settings), [s for s in scenarios if _valid(s)])
+
+async def _refill(settings: Dict):
+    unproductive = 0
+    while await async_storage.count_scenario_pool(*_key(settings)) < LOW_WATER:
+        await _wait_until_idle()
+        added = await generate_into_pool(settings)
+        unproductive = 0 if added else unproductive + 1
+        if unproductive >= MAX_UNPRODUCTIVE_BATCHES:
+            print(f"Scenario pool refill for {_key(settings)} stopped: no new scenarios produced")
+            return
+
+async def _refill_loop():
+    while True:
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=RECHECK_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+        for settings in list(_targets.values()):
+            try:
+                await _refill(settings)
+            except Exception as e:
+                print(f"Scenario pool refill failed: {e}")
+
+def start(settings: Dict):
+    """Starts refilling, beginning with the default learner's `settings`."""
+    global _wakeup, _task
+    _wakeup = asyncio.Event()
+    _task = asyncio.create_task(_refill_loop())
+    request_refill(settings)
+
+async def stop():
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+
+async def take_stream(settings: Dict, count: int, replace_active: bool = False) -> AsyncIterator[Dict]:
+    """Yields `count` scenarios, from the pool where possible and generating any shortfall inline.
+
+    Generated scenarios are yielded one by one as the model completes them.
+    """
+    scenarios = await async_storage.take_from_scenario_pool(*_key(settings), count, replace_active)
+    for scenario in scenarios:
+        yield scenario
+    seen = {s['id'] for s in scenarios}
+    try:
+        if len(seen) < count:
+            async with aclosing(ollama_client.generate_scenarios_stream(*_key(settings), count=count - len(seen))) as generated:
+                async for scenario in generated:
+                    if _valid(scenario) and scenario['id'] not in seen:
+                        seen.add(scenario['id'])
+                        yield scenario
+                        if len(seen) >= count:
+                            break
+    finally:
+        request_refill(settings)
+
+async def take(settings: Dict, count: int, replace_active: bool = False) -> List[Dict]:
+    async with aclosing(take_stream(settings, count, replace_active)) as scenarios:
+        return [s async for s in scenarios]
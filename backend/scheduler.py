@@ -0,0 +1,162 @@
+import asyncio
+import heapq
+import itertools
+import os
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict
+
+from backend import metrics
+from backend import ollama_router
+
+# Lower value = served first. Interactive chat always jumps ahead of background work.
+PRIORITIES = {
+    "chat": 0,
+    "evaluate": 1,
+    "hint": 2,
+    "summary": 3,
+    "scenario": 4,
+}
+
+# How many requests may run against one model on each Ollama node at once; the rest wait in priority order.
+MAX_CONCURRENCY_PER_MODEL = int(os.environ.get("LINGOFLOW_OLLAMA_CONCURRENCY", "2"))
+
+_seq = itertools.count()
+
+def capacity(model: str) -> int:
+    """How many requests `model` may have running at once: MAX_CONCURRENCY_PER_MODEL on
+    each healthy node that has it. Nodes drop out and come back with the health checks,
+    so this is worked out on every acquire and release."""
+    serving = [n for n in ollama_router.nodes() if n.available is None or model in n.available]
+    healthy = sum(1 for n in serving if n.healthy)
+    # With no healthy node left, requests still go out one node's worth at a time and fail over or fail fast.
+    return MAX_CONCURRENCY_PER_MODEL * max(1, healthy)
+
+class _ModelQueue:
+    def __init__(self, model: str):
+        self.model = model
+        self.active = 0
+        self.active_by_kind: Dict[str, int] = {}
+        self._waiters = []  # heap of (priority, seq, kind, future)
+
+    @property
+    def limit(self) -> int:
+        return capacity(self.model)
+
+    def queued_by_kind(self) -> Dict[str, int]:
+        counts = {}
+        for _, _, kind, fut in self._waiters:
+            if not fut.done():
+                counts[kind] = counts.get(kind, 0) + 1
+        return counts
+
+    async def acquire(self, kind: str):
+        if self.active < self.limit and not any(not w[3].done() for w in self._waiters):
+            self.active += 1
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (PRIORITIES[kind], next(_seq), kind, fut))
+            # The capacity may have grown since the last release.
+            self._fill()
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    # The slot was handed over just as we were cancelled: pass it on.
+                    self._release_slot()
+                raise
+        self.active_by_kind[kind] = self.active_by_kind.get(kind, 0) + 1
+
+    def release(self, kind: str):
+        self.active_by_kind[kind] -= 1
+        self._release_slot()
+
+    def _release_slot(self):
+        self.active -= 1
+        self._fill()
+
+    def _fill(self):
+        # Hands free slots to the highest-priority waiters; none while the capacity has shrunk below what is running.
+        limit = self.limit
+        while self.active < limit and self._waiters:
+            _, _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self.active += 1
+                fut.set_result(None)
+
+_queues: Dict[str, _ModelQueue] = {}
+_in_flight: Dict[str, asyncio.Task] = {}
+_callers: Dict[asyncio.Task, int] = {}  # shared request -> callers still waiting for it
+_coalesced = 0
+
+def _queue(model: str) -> _ModelQueue:
+    q = _queues.get(model)
+    if q is None:
+        q = _queues[model] = _ModelQueue(model)
+    return q
+
+@asynccontextmanager
+async def slot(kind: str, model: str):
+    """Holds one of the model's concurrency slots, e.g. for the length of a streamed response."""
+    q = _queue(model)
+    with metrics.LLM_QUEUE_SECONDS.time(kind=kind, model=model):
+        await q.acquire(kind)
+    try:
+        yield
+    finally:
+        q.release(kind)
+
+async def _run(kind: str, model: str, fn: Callable[[], Awaitable]):
+    async with slot(kind, model):
+        return await fn()
+
+def _forget(key: str, task: asyncio.Task):
+    if _in_flight.get(key) is task:
+        del _in_flight[key]
+
+async def submit(kind: str, model: str, fn: Callable[[], Awaitable], key: str = None):
+    """Runs `fn` once a slot for `model` is free, in `kind` priority order.
+
+    Callers passing the same `key` while a request is still running share its
+    result instead of sending a duplicate to Ollama. The request is cancelled,
+    and its slot freed, once every caller waiting for it has been cancelled.
+    """
+    global _coalesced
+    if key is None:
+        return await _run(kind, model, fn)
+
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_run(kind, model, fn))
+        _in_flight[key] = task
+        task.add_done_callback(lambda done: _forget(key, done))
+    else:
+        _coalesced += 1
+    _callers[task] = _callers.get(task, 0) + 1
+    try:
+        # Shielded so one caller going away does not cancel the request for the others.
+        return await asyncio.shield(task)
+    finally:
+        _callers[task] -= 1
+        if not _callers[task]:
+            del _callers[task]
+            if not task.done():
+                # The last caller was cancelled: nobody wants the answer any more.
+                # Later callers with the same key start a new request.
+                _forget(key, task)
+                task.cancel()
+
+def stats() -> Dict:
+    models = {}
+    for model, q in _queues.items():
+        queued = q.queued_by_kind()
+        models[model] = {
+            "limit": q.limit,
+            "active": dict(q.active_by_kind, total=q.active),
+            "queued": dict(queued, total=sum(queued.values())),
+        }
+    return {
+        "models": models,
+        "queued_total": sum(m["queued"]["total"] for m in models.values()),
+        "in_flight_keys": len(_in_flight),
+        "coalesced_total": _coalesced,
+    }
@@ -1,97 +1,449 @@
 import sqlite3
 import json
+import itertools
 import os
+import re
+import threading
+from collections import OrderedDict
 from contextlib import contextmanager
+from contextvars import ContextVar
 
-DB_PATH = os.path.join("data", "lingoflow.db")
+from backend.records import ConversationState, LearnerCache, Scenario, Settings
+
+DB_PATH = os.environ.get("LINGOFLOW_DB_PATH", os.path.join("data", "lingoflow.db"))
+# Each learner's settings, scenarios, history and jobs live in a database file of
+# their own, so learners never wait on each other's write lock. The default learner
+# (requests without a learner id) keeps using DB_PATH, which also holds what all
+# learners share: the scenario pool and the response cache.
+LEARNER_DIR = os.environ.get("LINGOFLOW_LEARNER_DIR", os.path.join(os.path.dirname(DB_PATH), "learners"))
+DEFAULT_LEARNER = "default"
+# Database files each thread keeps a connection open to; the least recently used are closed
+# beyond this. Each open file takes about three file descriptors (database, WAL and shared memory).
+MAX_OPEN_SHARDS = int(os.environ.get("LINGOFLOW_OPEN_SHARDS", "64"))
+# Learners whose settings, scenarios and open conversations are kept in memory
+# (least recently used are dropped and read again when needed).
+MAX_CACHED_LEARNERS = int(os.environ.get("LINGOFLOW_CACHED_LEARNERS", "1024"))
+
+# Per-connection tuning, applied once when a pooled connection is opened.
+CONNECTION_PRAGMAS = [
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+]
+STATEMENT_CACHE_SIZE = 256
+
+# Furigana readings and other tags are left out of the search index, so
+# "<ruby>切符<rt>きっぷ</rt></ruby>" is found by searching for 切符.
+_RUBY_ANNOTATION = re.compile(r"<(rt|rp)>.*?</\1>", re.S)
+_TAG = re.compile(r"<[^>]+>")
+
+def strip_markup(text):
+    if text is None:
+        return None
+    return _TAG.sub("", _RUBY_ANNOTATION.sub("", text))
+
+# Whose data storage calls act on; set per request (see backend/learners.py) and
+# carried over to the database thread by async_storage.
+current_learner: ContextVar[str] = ContextVar("current_learner", default=DEFAULT_LEARNER)
+
+def shard_path(learner: str) -> str:
+    if learner == DEFAULT_LEARNER:
+        return DB_PATH
+    return os.path.join(LEARNER_DIR, f"{learner}.db")
+
+def list_learners():
+    """Every learner with a database file, the default learner first."""
+    learners = [DEFAULT_LEARNER]
+    if os.path.isdir(LEARNER_DIR):
+        learners.extend(sorted(name[:-3] for name in os.listdir(LEARNER_DIR) if name.endswith(".db")))
+    return learners
+
+# Each thread keeps persistent connections, so the statement caches survive between calls.
+_local = threading.local()
+_connections = set()
+_connections_lock = threading.Lock()
+_generation = 0  # bumped by close_connections so every thread reconnects
+_migrated = set()  # database files whose schema is known to be current
+_schema_locks = {}  # database file -> lock held while migrating it
+_schema_locks_lock = threading.Lock()
+
+# Read-through cache of what every turn reads, per learner (see backend/records.py).
+# The write functions below update it as they write, so it assumes this process is
+# the only one writing the databases, as the journal already does.
+_caches: "OrderedDict[str, LearnerCache]" = OrderedDict()
+_caches_lock = threading.Lock()
+
+def _cache() -> LearnerCache:
+    learner = current_learner.get()
+    with _caches_lock:
+        cache = _caches.get(learner)
+        if cache is None:
+            cache = _caches[learner] = LearnerCache()
+            while len(_caches) > MAX_CACHED_LEARNERS:
+                _caches.popitem(last=False)
+        else:
+            _caches.move_to_end(learner)
+        return cache
+
+def _drop_cache():
+    with _caches_lock:
+        _caches.pop(current_learner.get(), None)
+
+def _connect(path: str):
+    conn = sqlite3.connect(
+        path,
+        isolation_level=None,  # transactions are managed explicitly below
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    # Used by the search index triggers, so every connection that writes messages needs it.
+    conn.create_function("strip_markup", 1, strip_markup, deterministic=True)
+    return conn
+
+def _open_connection(path: str):
+    if path not in _migrated:
+        _ensure_schema(path)
+    conn = _connect(path)
+    with _connections_lock:
+        _connections.add(conn)
+    return conn
+
+def _close(conn):
+    with _connections_lock:
+        _connections.discard(conn)
+    conn.close()
+
+def _thread_connection(shared: bool = False):
+    """This thread's connection to the current learner's database (or the shared one)."""
+    path = DB_PATH if shared else shard_path(current_learner.get())
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.generation != _generation:
+        conns = _local.conns = OrderedDict()
+        _local.depth = {}
+        _local.generation = _generation
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = _open_connection(path)
+        _local.depth[path] = 0
+        # Close the least recently used connections that are not inside a transaction.
+        for idle in [p for p in conns if p != path and not _local.depth[p]][:max(0, len(conns) - MAX_OPEN_SHARDS)]:
+            _close(conns.pop(idle))
+            del _local.depth[idle]
+    conns.move_to_end(path)
+    return path, conn
+
+def close_connections():
+    """Closes every pooled connection; threads reopen them lazily on next use."""
+    global _generation
+    with _connections_lock:
+        conns = list(_connections)
+        _connections.clear()
+        _generation += 1
+    for conn in conns:
+        conn.close()
 
 @contextmanager
-def get_db_connection():
-    """Provides a transactional scope around a series of operations."""
-    conn = sqlite3.connect(DB_PATH)
+def _transaction(begin: str, shared: bool = False):
+    path, conn = _thread_connection(shared)
+    depth = _local.depth
+    if depth[path]:
+        # Already inside a unit of work: join its transaction.
+        depth[path] += 1
+        try:
+            yield conn
+        finally:
+            depth[path] -= 1
+        return
+    
+    conn.execute(begin)
+    depth[path] = 1
     try:
         yield conn
-        conn.commit()
+        conn.execute("COMMIT")
     except Exception:
-        conn.rollback()
+        conn.execute("ROLLBACK")
+        if not shared:
+            # Writes made in the transaction may already be in the cache.
+            _drop_cache()
         raise
     finally:
-        conn.close()
+        depth[path] = 0
 
-def init_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Settings table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS settings (
-                id INTEGER PRIMARY KEY,
-                theme TEXT DEFAULT 'system',
-                model TEXT DEFAULT 'gemma3:4b',
-                practice_language TEXT DEFAULT 'Japanese',
-                ui_language TEXT DEFAULT 'English',
-                score INTEGER DEFAULT 0
-            )
-        """)
-        
-        # Ensure a single row exists for settings
-        cursor.execute("SELECT COUNT(*) FROM settings")
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("INSERT INTO settings (id) VALUES (1)")
-            
-        # Active Scenarios table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS active_scenarios (
-                id TEXT PRIMARY KEY,
-                setting TEXT,
-                goal TEXT,
-                description TEXT,
-                clipart TEXT
-            )
-        """)
-        
-        # Conversations table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                scenario_id TEXT,
-                completed BOOLEAN DEFAULT 0,
-                summary TEXT DEFAULT NULL,
-                practice_language TEXT DEFAULT NULL,
-                model TEXT DEFAULT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Migration: add new columns for existing databases
-        for col_def in [
-            "ALTER TABLE history ADD COLUMN summary TEXT DEFAULT NULL",
-            "ALTER TABLE history ADD COLUMN practice_language TEXT DEFAULT NULL",
-            "ALTER TABLE history ADD COLUMN model TEXT DEFAULT NULL",
-        ]:
-            try:
-                cursor.execute(col_def)
-            except Exception:
-                pass  # Column already exists
+@contextmanager
+def get_db_connection(shared: bool = False):
+    """Provides a transactional scope around a series of operations.
+
+    `shared` uses the database holding what all learners share instead of the current learner's.
+    """
+    with _transaction("BEGIN", shared) as conn:
+        yield conn
+
+@contextmanager
+def unit_of_work(shared: bool = False):
+    """Groups several storage calls into one write transaction on one connection.
+
+    Helpers called inside the block join this transaction instead of committing
+    on their own. The write lock is taken up front so a read-then-write sequence
+    cannot fail halfway with SQLITE_BUSY. Keep awaits out of the block.
+    """
+    with _transaction("BEGIN IMMEDIATE", shared) as conn:
+        yield conn
+
+def _add_missing_columns(cursor, table: str, columns: dict):
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+def _migrate_base_schema(cursor, shared: bool):
+    # Written idempotently: databases from before versioning (user_version 0)
+    # already have some of these tables and columns.
+    
+    # Settings table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            id INTEGER PRIMARY KEY,
+            theme TEXT DEFAULT 'system',
+            model TEXT DEFAULT 'gemma3:4b',
+            practice_language TEXT DEFAULT 'Japanese',
+            ui_language TEXT DEFAULT 'English',
+            score INTEGER DEFAULT 0
+        )
+    """)
+    
+    # Ensure a single row exists for settings
+    cursor.execute("SELECT COUNT(*) FROM settings")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute("INSERT INTO settings (id) VALUES (1)")
         
-        # Messages table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                history_id INTEGER,
-                speaker TEXT,
-                content TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(history_id) REFERENCES history(id) ON DELETE CASCADE
-            )
-        """)
+    # Active Scenarios table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS active_scenarios (
+            id TEXT PRIMARY KEY,
+            setting TEXT,
+            goal TEXT,
+            description TEXT,
+            clipart TEXT
+        )
+    """)
+    
+    # Conversations table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scenario_id TEXT,
+            completed BOOLEAN DEFAULT 0,
+            summary TEXT DEFAULT NULL,
+            practice_language TEXT DEFAULT NULL,
+            model TEXT DEFAULT NULL,
+            goal_state TEXT DEFAULT NULL,
+            context_summary TEXT DEFAULT NULL,
+            context_summary_upto INTEGER DEFAULT 0,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Columns added to history after the first release
+    _add_missing_columns(cursor, "history", {
+        "summary": "TEXT DEFAULT NULL",
+        "practice_language": "TEXT DEFAULT NULL",
+        "model": "TEXT DEFAULT NULL",
+        "goal_state": "TEXT DEFAULT NULL",
+        "context_summary": "TEXT DEFAULT NULL",
+        "context_summary_upto": "INTEGER DEFAULT 0",
+    })
+    
+    # Pre-generated scenarios waiting to be served, per model and language pair
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scenario_pool (
+            model TEXT NOT NULL,
+            practice_language TEXT NOT NULL,
+            ui_language TEXT NOT NULL,
+            id TEXT NOT NULL,
+            setting TEXT,
+            goal TEXT,
+            description TEXT,
+            clipart TEXT,
+            setting_key TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (model, practice_language, ui_language, id),
+            UNIQUE (model, practice_language, ui_language, setting_key)
+        )
+    """)
+    
+    # Persisted LLM responses (see backend/response_cache.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+    
+    # Durable background jobs (see backend/jobs.py); finished jobs are deleted
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            history_id INTEGER,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT DEFAULT NULL,
+            run_after REAL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(history_id) REFERENCES history(id) ON DELETE CASCADE
+        )
+    """)
+    
+    # Messages table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            history_id INTEGER,
+            speaker TEXT,
+            content TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(history_id) REFERENCES history(id) ON DELETE CASCADE
+        )
+    """)
+
+def _migrate_indexes(cursor, shared: bool):
+    # Transcript reads and the ON DELETE CASCADE from history both look messages up by history_id.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_history ON messages (history_id, id)")
+    # get_incomplete_conversation: newest open conversation for a scenario.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_scenario ON history (scenario_id, completed, id)")
+    # The history list: completed conversations, newest first, paginated by id.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_completed ON history (completed, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, run_after, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_history ON jobs (history_id, kind)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_expiry ON response_cache (expires_at)")
+
+def _migrate_search_index(cursor, shared: bool):
+    # Trigram tokenizing finds any substring of 3+ characters, which works for
+    # Japanese and Chinese text that has no spaces between words.
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, tokenize='trigram')")
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(summary, tokenize='trigram')")
+    
+    # rowid of each index entry is the id of the message or history row it was made from
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, strip_markup(new.content));
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            DELETE FROM messages_fts WHERE rowid = old.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            DELETE FROM messages_fts WHERE rowid = old.id;
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, strip_markup(new.content));
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history WHEN new.summary IS NOT NULL BEGIN
+            INSERT INTO history_fts (rowid, summary) VALUES (new.id, strip_markup(new.summary));
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+            DELETE FROM history_fts WHERE rowid = old.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS history_fts_update AFTER UPDATE OF summary ON history BEGIN
+            DELETE FROM history_fts WHERE rowid = old.id;
+            INSERT INTO history_fts (rowid, summary) SELECT new.id, strip_markup(new.summary) WHERE new.summary IS NOT NULL;
+        END
+    """)
+    
+    cursor.execute("DELETE FROM messages_fts")
+    cursor.execute("INSERT INTO messages_fts (rowid, content) SELECT id, strip_markup(content) FROM messages")
+    cursor.execute("DELETE FROM history_fts")
+    cursor.execute("INSERT INTO history_fts (rowid, summary) SELECT id, strip_markup(summary) FROM history WHERE summary IS NOT NULL")
+
+def _migrate_shared_tables(cursor, shared: bool):
+    if not shared:
+        # The scenario pool and the response cache are shared by everyone and
+        # only ever used in the shared database.
+        cursor.execute("DROP TABLE IF EXISTS scenario_pool")
+        cursor.execute("DROP TABLE IF EXISTS response_cache")
+        return
+    # Learners whose database may hold unfinished jobs, so startup only opens those.
+    cursor.execute("CREATE TABLE IF NOT EXISTS job_learners (learner TEXT PRIMARY KEY)")
+    # Existing databases were not tracked yet; each is checked once at the next startup.
+    cursor.executemany("INSERT OR IGNORE INTO job_learners (learner) VALUES (?)",
+                       [(learner,) for learner in list_learners()])
+
+# Applied in order; the database's PRAGMA user_version records how many have run.
+# Each is called with the cursor and whether the database is the shared one.
+# Never edit or reorder a released migration, append a new one instead.
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_indexes,
+    _migrate_search_index,
+    _migrate_shared_tables,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def _apply_migrations(conn, path: str):
+    # WAL is persistent in the database file, so it only needs setting once.
+    conn.execute("PRAGMA journal_mode=WAL")
+    
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} of {path} is newer than this code supports ({SCHEMA_VERSION})")
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        # Each migration commits together with its version bump, so a crash never half-applies one.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migration(conn.cursor(), path == DB_PATH)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if version or path == DB_PATH:
+            # A new learner's database is created silently.
+            print(f"Applied database migration {number} ({migration.__name__}) to {path}")
+
+def _ensure_schema(path: str):
+    # Per file, so new learners' databases are created in parallel.
+    with _schema_locks_lock:
+        lock = _schema_locks.setdefault(path, threading.Lock())
+    with lock:
+        if path in _migrated:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = _connect(path)
+        try:
+            _apply_migrations(conn, path)
+        finally:
+            conn.close()
+        _migrated.add(path)
+
+def init_db():
+    """Brings the shared database up to date; each learner's is migrated on first use."""
+    _migrated.discard(DB_PATH)
+    _ensure_schema(DB_PATH)
+    with _caches_lock:
+        _caches.clear()
 
 def get_settings():
-    with get_db_connection() as conn:
-        conn.row_factory = sqlite3.Row
-        row = conn.execute("SELECT * FROM settings WHERE id = 1").fetchone()
-        return dict(row) if row else {}
+    cache = _cache()
+    if cache.settings is None:
+        with get_db_connection() as conn:
+            row = conn.execute("SELECT * FROM settings WHERE id = 1").fetchone()
+        if not row:
+            return {}
+        cache.settings = Settings.from_row(row)
+    return cache.settings
 
 def update_settings(theme=None, model=None, practice_language=None, ui_language=None, add_score=0):
     updates = []
@@ -119,6 +471,15 @@ def update_settings(theme=None, model=None, practice_language=None, ui_language=
             params.append(1) # id=1
             query = f"UPDATE settings SET {', '.join(updates)} WHERE id = ?"
             cursor.execute(query, params)
+        cache = _cache()
+        if cache.settings is not None:
+            cache.settings = cache.settings.replace(
+                theme=theme or cache.settings.theme,
+                model=model or cache.settings.model,
+                practice_language=practice_language or cache.settings.practice_language,
+                ui_language=ui_language or cache.settings.ui_language,
+                score=cache.settings.score + max(add_score, 0),
+            )
 
 def save_scenarios(scenarios, clear=True):
     with get_db_connection() as conn:
@@ -131,18 +492,112 @@ def save_scenarios(scenarios, clear=True):
                 "INSERT OR IGNORE INTO active_scenarios (id, setting, goal, description, clipart) VALUES (?, ?, ?, ?, ?)",
                 (s['id'], s['setting'], s['goal'], s.get('description', ''), s['clipart'])
             )
+    cache = _cache()
+    if clear:
+        # Conversations of the replaced scenarios cannot be continued any more.
+        cache.open_conversations.clear()
+        cache.states.clear()
+        # The table now holds exactly these scenarios.
+        cache.scenarios = {}
+    if cache.scenarios is not None:
+        for s in scenarios:
+            if s['id'] not in cache.scenarios:
+                cache.scenarios[s['id']] = Scenario(s['id'], s['setting'], s['goal'], s.get('description', ''), s['clipart'])
+
+def _active_scenarios():
+    cache = _cache()
+    if cache.scenarios is None:
+        # The active set is a handful of rows: one miss loads all of them.
+        with get_db_connection() as conn:
+            rows = conn.execute("SELECT * FROM active_scenarios").fetchall()
+        cache.scenarios = {r['id']: Scenario.from_row(r) for r in rows}
+    return cache.scenarios
 
 def get_scenarios():
-    with get_db_connection() as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute("SELECT * FROM active_scenarios").fetchall()
-        return [dict(r) for r in rows]
+    return list(_active_scenarios().values())
 
 def get_scenario(scenario_id):
-    with get_db_connection() as conn:
-        conn.row_factory = sqlite3.Row
-        row = conn.execute("SELECT * FROM active_scenarios WHERE id = ?", (scenario_id,)).fetchone()
-        return dict(row) if row else None
+    return _active_scenarios().get(scenario_id)
+
+def scenario_setting_key(setting: str) -> str:
+    """Normalizes a setting so trivially different wordings count as the same scenario."""
+    return "".join(ch for ch in (setting or "").casefold() if ch.isalnum())
+
+def add_to_scenario_pool(model: str, practice_language: str, ui_language: str, scenarios) -> int:
+    """Adds scenarios to the pool, skipping duplicates by id or setting; returns how many were new."""
+    with get_db_connection(shared=True) as conn:
+        before = conn.total_changes
+        for s in scenarios:
+            conn.execute(
+                """INSERT OR IGNORE INTO scenario_pool
+                   (model, practice_language, ui_language, id, setting, goal, description, clipart, setting_key)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (model, practice_language, ui_language, s['id'], s['setting'], s['goal'],
+                 s.get('description', ''), s['clipart'], scenario_setting_key(s['setting']))
+            )
+        return conn.total_changes - before
+
+def count_scenario_pool(model: str, practice_language: str, ui_language: str) -> int:
+    with get_db_connection(shared=True) as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM scenario_pool WHERE model = ? AND practice_language = ? AND ui_language = ?",
+            (model, practice_language, ui_language)
+        ).fetchone()
+        return row[0]
+
+def take_from_scenario_pool(model: str, practice_language: str, ui_language: str, count: int, replace_active: bool = False):
+    """Removes and returns up to `count` pooled scenarios, oldest first.
+
+    Unless the active set is about to be replaced, scenarios already on the
+    current learner's dashboard (same id or setting) are skipped so a draw
+    never duplicates one.
+    """
+    excluded_ids, excluded_keys = set(), set()
+    if not replace_active:
+        for r in get_scenarios():
+            excluded_ids.add(r['id'])
+            excluded_keys.add(scenario_setting_key(r['setting']))
+    
+    # The pool is shared by all learners.
+    with unit_of_work(shared=True) as conn:
+        rows = conn.execute(
+            """SELECT id, setting, goal, description, clipart, setting_key FROM scenario_pool
+               WHERE model = ? AND practice_language = ? AND ui_language = ?
+               ORDER BY created_at ASC""",
+            (model, practice_language, ui_language)
+        )
+        taken = []
+        for r in rows:
+            if r['id'] in excluded_ids or r['setting_key'] in excluded_keys:
+                continue
+            taken.append({k: r[k] for k in ("id", "setting", "goal", "description", "clipart")})
+            excluded_ids.add(r['id'])
+            excluded_keys.add(r['setting_key'])
+            if len(taken) >= count:
+                break
+        
+        conn.executemany(
+            "DELETE FROM scenario_pool WHERE model = ? AND practice_language = ? AND ui_language = ? AND id = ?",
+            [(model, practice_language, ui_language, s['id']) for s in taken]
+        )
+        return taken
+
+def get_cached_response(key: str, now: float):
+    with get_db_connection(shared=True) as conn:
+        return conn.execute(
+            "SELECT value, expires_at FROM response_cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+
+def save_cached_response(key: str, value: str, expires_at: float):
+    with get_db_connection(shared=True) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, expires_at)
+        )
+
+def purge_cached_responses(now: float):
+    with get_db_connection(shared=True) as conn:
+        conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
 
 def start_conversation(scenario_id, practice_language: str = None, model: str = None):
     with get_db_connection() as conn:
@@ -151,16 +606,47 @@ def start_conversation(scenario_id, practice_language: str = None, model: str =
             "INSERT INTO history (scenario_id, practice_language, model) VALUES (?, ?, ?)",
             (scenario_id, practice_language, model)
         )
-        return cursor.lastrowid
+        history_id = cursor.lastrowid
+    cache = _cache()
+    cache.open_conversations[scenario_id] = history_id
+    cache.states[history_id] = ConversationState({}, None, 0)
+    return history_id
 
 def append_conversation(history_id, speaker, content):
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("INSERT INTO messages (history_id, speaker, content) VALUES (?, ?, ?)", (history_id, speaker, content))
 
+def apply_journal(writes):
+    """Applies buffered writes, (function name, args, kwargs) each, in one transaction.
+
+    If a write violates a constraint (e.g. its conversation was deleted), the
+    batch is applied again with each write under a savepoint, so only the
+    failing writes are left out. Returns (function name, error) for those.
+    Other errors (locked, disk full) raise with nothing committed, so the
+    whole batch can be retried.
+    """
+    try:
+        with unit_of_work():
+            for fn, args, kwargs in writes:
+                globals()[fn](*args, **kwargs)
+        return []
+    except sqlite3.IntegrityError:
+        pass
+    failed = []
+    with unit_of_work() as conn:
+        for fn, args, kwargs in writes:
+            conn.execute("SAVEPOINT journal_write")
+            try:
+                globals()[fn](*args, **kwargs)
+            except sqlite3.IntegrityError as e:
+                conn.execute("ROLLBACK TO journal_write")
+                failed.append((fn, str(e)))
+            conn.execute("RELEASE journal_write")
+    return failed
+
 def get_conversation(history_id):
     with get_db_connection() as conn:
-        conn.row_factory = sqlite3.Row
         rows = conn.execute("SELECT speaker, content FROM messages WHERE history_id = ? ORDER BY id ASC", (history_id,)).fetchall()
         
         # Backwards compatibility for old JSON blob logic (conversations completed before schema update)
@@ -184,17 +670,27 @@ def mark_conversation_completed(history_id):
         scenario_row = cursor.execute("SELECT scenario_id FROM history WHERE id = ?", (history_id,)).fetchone()
         if scenario_row:
             cursor.execute("DELETE FROM active_scenarios WHERE id = ?", (scenario_row[0],))
+    cache = _cache()
+    cache.forget_conversation(history_id)
+    if scenario_row:
+        cache.open_conversations.pop(scenario_row[0], None)
+        if cache.scenarios is not None:
+            cache.scenarios.pop(scenario_row[0], None)
 
 def abandon_conversation(history_id):
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM messages WHERE history_id = ?", (history_id,))
         cursor.execute("DELETE FROM history WHERE id = ?", (history_id,))
+    _cache().forget_conversation(history_id)
 
 def get_incomplete_conversation(scenario_id):
-    with get_db_connection() as conn:
-        row = conn.execute("SELECT id FROM history WHERE scenario_id = ? AND completed = 0 ORDER BY id DESC LIMIT 1", (scenario_id,)).fetchone()
-        return row[0] if row else None
+    cache = _cache()
+    if scenario_id not in cache.open_conversations:
+        with get_db_connection() as conn:
+            row = conn.execute("SELECT id FROM history WHERE scenario_id = ? AND completed = 0 ORDER BY id DESC LIMIT 1", (scenario_id,)).fetchone()
+        cache.open_conversations[scenario_id] = row[0] if row else None
+    return cache.open_conversations[scenario_id]
 
 def save_conversation_summary(history_id, summary: str):
     with get_db_connection() as conn:
@@ -205,17 +701,227 @@ def get_conversation_summary(history_id) -> str:
         row = conn.execute("SELECT summary FROM history WHERE id = ?", (history_id,)).fetchone()
         return row[0] if row and row[0] else None
 
-def get_completed_conversations():
+def get_conversation_state(history_id) -> ConversationState:
+    """Per-conversation working state kept on the history row between turns."""
+    cache = _cache()
+    state = cache.states.get(history_id)
+    if state is None:
+        with get_db_connection() as conn:
+            row = conn.execute(
+                "SELECT goal_state, context_summary, context_summary_upto FROM history WHERE id = ?",
+                (history_id,)
+            ).fetchone()
+        if not row:
+            return ConversationState({}, None, 0)
+        state = cache.states[history_id] = ConversationState(
+            json.loads(row['goal_state']) if row['goal_state'] else {},
+            row['context_summary'],
+            row['context_summary_upto'] or 0,
+        )
+    return state
+
+def save_goal_state(history_id, state: dict):
     with get_db_connection() as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(
-            "SELECT id, scenario_id, timestamp, summary, practice_language, model FROM history WHERE completed = 1 ORDER BY id DESC"
-        ).fetchall()
+        conn.execute("UPDATE history SET goal_state = ? WHERE id = ?", (json.dumps(state, ensure_ascii=False), history_id))
+    cache = _cache()
+    if history_id in cache.states:
+        cache.states[history_id] = cache.states[history_id].replace(goal_state=state)
+
+def save_context_summary(history_id, summary: str, upto: int):
+    with get_db_connection() as conn:
+        conn.execute(
+            "UPDATE history SET context_summary = ?, context_summary_upto = ? WHERE id = ?",
+            (summary, upto, history_id)
+        )
+    cache = _cache()
+    if history_id in cache.states:
+        cache.states[history_id] = cache.states[history_id].replace(context_summary=summary, context_summary_upto=upto)
+
+def enqueue_job(kind: str, payload: dict, history_id: int = None) -> int:
+    # Recorded first: a learner listed without jobs costs a check at startup, a job without its learner is lost.
+    with get_db_connection(shared=True) as conn:
+        conn.execute("INSERT OR IGNORE INTO job_learners (learner) VALUES (?)", (current_learner.get(),))
+    with get_db_connection() as conn:
+        cursor = conn.execute(
+            "INSERT INTO jobs (kind, history_id, payload) VALUES (?, ?, ?)",
+            (kind, history_id, json.dumps(payload, ensure_ascii=False))
+        )
+        return cursor.lastrowid
+
+def claim_next_job(now: float):
+    """Marks the oldest runnable job as running and returns it, or None."""
+    with unit_of_work() as conn:
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' AND run_after <= ? ORDER BY id ASC LIMIT 1", (now,)
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1 WHERE id = ?", (row['id'],))
+        job = dict(row)
+        job['attempts'] += 1
+        job['payload'] = json.loads(job['payload'])
+        return job
+
+def finish_job(job_id: int):
+    with get_db_connection() as conn:
+        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+def fail_job(job_id: int, error: str, retry_at: float = None):
+    """Requeues the job to run again at `retry_at`, or marks it failed for good when None."""
+    with get_db_connection() as conn:
+        if retry_at is None:
+            conn.execute("UPDATE jobs SET status = 'failed', last_error = ? WHERE id = ?", (error, job_id))
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', last_error = ?, run_after = ? WHERE id = ?",
+                (error, retry_at, job_id)
+            )
+
+def get_job_status(job_id: int):
+    """The job's status, or None once it has finished successfully (and been deleted)."""
+    with get_db_connection() as conn:
+        row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+def has_queued_jobs() -> bool:
+    """Whether any job is waiting, including retries that are not due yet."""
+    with get_db_connection() as conn:
+        return conn.execute("SELECT 1 FROM jobs WHERE status = 'queued' LIMIT 1").fetchone() is not None
+
+def release_job_learner() -> bool:
+    """Drops the current learner from the learners with jobs if nothing of theirs is queued or running.
+
+    Runs on the learner's database thread like enqueue_job, so the two cannot interleave.
+    """
+    with get_db_connection() as conn:
+        busy = conn.execute("SELECT 1 FROM jobs WHERE status IN ('queued', 'running') LIMIT 1").fetchone() is not None
+    if not busy:
+        with get_db_connection(shared=True) as conn:
+            conn.execute("DELETE FROM job_learners WHERE learner = ?", (current_learner.get(),))
+    return not busy
+
+def job_learners():
+    """The learners whose database may hold unfinished jobs."""
+    with get_db_connection(shared=True) as conn:
+        return [row['learner'] for row in conn.execute("SELECT learner FROM job_learners ORDER BY learner")]
+
+def requeue_running_jobs() -> int:
+    """Jobs left 'running' by a previous process were interrupted; run them again."""
+    with get_db_connection() as conn:
+        return conn.execute("UPDATE jobs SET status = 'queued', run_after = 0 WHERE status = 'running'").rowcount
+
+def get_summary_state(history_id):
+    """Returns (summary, status, job_id); status is done, pending, failed or none."""
+    with get_db_connection() as conn:
+        row = conn.execute("SELECT summary FROM history WHERE id = ?", (history_id,)).fetchone()
+        if row and row[0]:
+            return row[0], "done", None
+        job = conn.execute(
+            "SELECT id, status FROM jobs WHERE kind = 'summary' AND history_id = ? ORDER BY id DESC LIMIT 1",
+            (history_id,)
+        ).fetchone()
+        if not job:
+            return None, "none", None
+        return None, "failed" if job['status'] == 'failed' else "pending", job['id']
+
+def get_completed_conversations(limit: int, before_id: int = None):
+    """One page of completed conversations, newest first, without the summary text.
+
+    Keyset pagination: pass the last id of the previous page as `before_id`,
+    so every page is an index range scan however deep into the history it is.
+    """
+    with get_db_connection() as conn:
+        if before_id is None:
+            rows = conn.execute(
+                "SELECT id, scenario_id, timestamp, practice_language, model FROM history "
+                "WHERE completed = 1 ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT id, scenario_id, timestamp, practice_language, model FROM history "
+                "WHERE completed = 1 AND id < ? ORDER BY id DESC LIMIT ?", (before_id, limit)
+            ).fetchall()
         return [dict(r) for r in rows]
 
+# Characters of context kept on each side of a search hit.
+SEARCH_SNIPPET_CHARS = 40
+_SEARCH_COLUMNS = "h.id AS history_id, h.scenario_id, h.timestamp, h.practice_language, h.model"
+
+def _search_phrase(text: str) -> str:
+    # One quoted FTS5 phrase, so operators and punctuation in the query are taken literally.
+    return '"' + text.replace('"', '""') + '"'
+
+def _snippet(text: str, query: str) -> str:
+    # Built here rather than with FTS5's snippet(), whose highlights end mid-word with trigram tokens.
+    # Matched on the text itself: casefolding can change its length ("ß" -> "ss") and shift the offsets.
+    found = re.search(re.escape(query), text, re.IGNORECASE)
+    if found is None:
+        return text[:SEARCH_SNIPPET_CHARS * 2]
+    start, end = found.span()
+    before = max(0, start - SEARCH_SNIPPET_CHARS)
+    after = min(len(text), end + SEARCH_SNIPPET_CHARS)
+    return ("…" if before else "") + text[before:start] + "<mark>" + text[start:end] + "</mark>" + text[end:after] + ("…" if after < len(text) else "")
+
+def search_conversations(query: str, limit: int):
+    """Messages and summaries of completed conversations containing `query`, best matches first.
+
+    Hits carry a snippet with the match wrapped in <mark>. Queries of 3+
+    characters use the trigram index, ranked by bm25; shorter ones (a 2-kanji
+    word, say) cannot use it and fall back to scanning the indexed text,
+    newest conversations first.
+
+    bm25 scores from the message and the summary index are not comparable (each
+    has its own document lengths and term statistics), so each source is ranked
+    on its own and the two lists are interleaved: the best summary, the best
+    message, the second-best summary, and so on. `rank` is the hit's bm25 score
+    within its source.
+    """
+    text = strip_markup(query).strip()
+    if not text:
+        return []
+    ranked = len(text) >= 3
+    if ranked:
+        arg, match, order = _search_phrase(text), "f.{column} MATCH ?", "f.rank"
+    else:
+        arg, match, order = text, "instr(lower(f.{column}), lower(?))", "f.rowid DESC"
+    
+    # CROSS JOIN keeps the search index as the outer loop; otherwise SQLite may
+    # walk every message and probe the index once per row. Unranked scans run
+    # newest first and stop as soon as `limit` hits are found.
+    queries = [
+        f"""SELECT {_SEARCH_COLUMNS}, 'message' AS source, m.speaker, f.content AS text, {order.split()[0]} AS rank
+            FROM messages_fts f
+            CROSS JOIN messages m ON m.id = f.rowid
+            CROSS JOIN history h ON h.id = m.history_id
+            WHERE {match.format(column="content")} AND h.completed = 1
+            ORDER BY {order} LIMIT ?""",
+        f"""SELECT {_SEARCH_COLUMNS}, 'summary' AS source, NULL AS speaker, f.summary AS text, {order.split()[0]} AS rank
+            FROM history_fts f
+            CROSS JOIN history h ON h.id = f.rowid
+            WHERE {match.format(column="summary")} AND h.completed = 1
+            ORDER BY {order} LIMIT ?""",
+    ]
+    with get_db_connection() as conn:
+        messages, summaries = ([dict(r) for r in conn.execute(sql, (arg, limit))] for sql in queries)
+    
+    if ranked:
+        # Each source keeps its own order; at the same position the summary, which covers the whole conversation, comes first.
+        rows = [row for pair in itertools.zip_longest(summaries, messages) for row in pair if row is not None]
+    else:
+        rows = messages + summaries
+        rows.sort(key=lambda r: (-r['history_id'], r['source'] == 'message', -r['rank']))
+    hits = []
+    for hit in rows[:limit]:
+        hit['snippet'] = _snippet(hit.pop('text'), text)
+        if not ranked:
+            hit['rank'] = None
+        hits.append(hit)
+    return hits
+
 def delete_conversation(history_id: int):
     with get_db_connection() as conn:
         conn.execute("DELETE FROM history WHERE id = ?", (history_id,))
+    _cache().forget_conversation(history_id)
 
 def delete_all_conversations():
     with get_db_connection() as conn:
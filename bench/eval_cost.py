@@ -0,0 +1,55 @@
+"""Compares goal-evaluation prompt size per turn: full transcript vs incremental evaluator.
+
+No model is needed; the prompts are built from the real templates and a synthetic
+conversation, and their size is reported in characters and estimated tokens.
+
+    PYTHONPATH=. python bench/eval_cost.py --turns 40
+"""
+import argparse
+
+from backend import context_window
+from backend import goal_evaluator
+from backend import ollama_client
+
+GOAL = "Buy two reserved-seat tickets to Kyoto for tomorrow morning"
+USER_LINE = "すみません、明日の朝の京都行きの指定席はまだありますか？"
+BOT_LINE = "はい、ございます。何名様でしょうか？お時間のご希望はありますか？"
+# Typical length of the evaluator's rolling notes (the prompt caps them at 40 words).
+NOTES = "User asked about reserved seats to Kyoto for tomorrow morning; number of tickets not yet given; no purchase confirmed."
+
+def full_prompt(history) -> str:
+    return ollama_client.load_prompt("goal_evaluation.txt").format(
+        scenario_goal=GOAL, conversation_history=ollama_client.format_transcript(history)
+    )
+
+def incremental_prompt(history, state) -> str:
+    latest = history[state.get("evaluated", 0):][-goal_evaluator.MAX_NEW_MESSAGES:]
+    return ollama_client.load_prompt("goal_evaluation_incremental.txt").format(
+        scenario_goal=GOAL, progress_notes=state.get("progress") or "(nothing accomplished yet)",
+        latest_exchange=ollama_client.format_transcript(latest)
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=30)
+    args = parser.parse_args()
+
+    history, state = [], {}
+    total_full = total_incremental = 0
+    print(f"{'turn':>4} {'full tokens':>12} {'incremental tokens':>19}")
+    for turn in range(1, args.turns + 1):
+        history.append({"speaker": "User", "content": USER_LINE if turn > 1 else "こんにちは"})
+        history.append({"speaker": "Bot", "content": BOT_LINE})
+        full = context_window.estimate_tokens(full_prompt(history))
+        if goal_evaluator.needs_llm(history, state):
+            incremental = context_window.estimate_tokens(incremental_prompt(history, state))
+            state = {"progress": NOTES, "evaluated": len(history)}
+        else:
+            incremental = 0  # pre-check ruled the LLM call out
+        total_full += full
+        total_incremental += incremental
+        print(f"{turn:>4} {full:>12} {incremental:>19}")
+    print(f"{'sum':>4} {total_full:>12} {total_incremental:>19}")
+
+if __name__ == "__main__":
+    main()
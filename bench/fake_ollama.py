@@ -0,0 +1,155 @@
+"""A stand-in Ollama server for benchmarks: /api/tags, /api/ps, /api/chat and /api/generate
+with configurable latency, streaming speed and token counts.
+
+It recognises LingoFlow's own prompts well enough to answer each call type
+plausibly: scenario batches as a JSON array, structured goal checks as JSON,
+plain goal checks as REACHED/PENDING, and filler text for everything else.
+A goal counts as reached once the learner has written GOAL_MARKER.
+
+    python bench/fake_ollama.py --port 11555 --latency 0.2 --tokens-per-second 40
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Learners in run_bench.py send this when they want the conversation to complete.
+GOAL_MARKER = "二枚ください"
+MODELS = ["gemma3:4b", "bench:tiny"]
+FILLER = ["はい", "、", "かしこまり", "ました", "。", "少々", "お待ち", "ください", "。", "他に", "何か", "ございます", "か", "？"]
+
+class Config:
+    latency = 0.05  # seconds before the first token (prompt processing)
+    tokens_per_second = 200.0
+    reply_tokens = 30
+    load_time = 0.0  # extra delay on the first request for each model (cold load)
+
+config = Config()
+app = FastAPI()
+_loaded = set()
+_scenario_ids = itertools.count()
+
+def _filler(tokens: int) -> list:
+    return [FILLER[i % len(FILLER)] for i in range(tokens)]
+
+def _scenarios(count: int) -> str:
+    items = []
+    for _ in range(count):
+        n = next(_scenario_ids)
+        items.append({
+            "id": f"bench_scenario_{n}",
+            "setting": f"Bench setting {n}",
+            "goal": "Buy two tickets",
+            "description": "A generated scenario for benchmarking.",
+            "clipart": "default_conversation.png",
+        })
+    return json.dumps(items, ensure_ascii=False)
+
+def _prompt_reply(body: dict) -> list:
+    """Chunks of the response text for a /api/generate request."""
+    prompt = body.get("prompt", "")
+    if body.get("format"):
+        # Incremental goal evaluation: {"progress", "goal_status"}
+        latest = prompt.rsplit("NEWEST MESSAGES", 1)[-1]
+        status = "REACHED" if GOAL_MARKER in latest else "PENDING"
+        return _split(json.dumps({"progress": "The learner asked about tickets.", "goal_status": status}))
+    if "JSON array" in prompt:
+        count = 5
+        for word in prompt.split():
+            if word.isdigit():
+                count = int(word)
+                break
+        return _split(_scenarios(count))
+    if "REACHED" in prompt:
+        return ["REACHED" if GOAL_MARKER in prompt else "PENDING"]
+    return _filler(config.reply_tokens)
+
+def _chat_reply(body: dict) -> list:
+    messages = body.get("messages", [])
+    latest = messages[-1]["content"] if messages else ""
+    if body.get("format"):
+        # Fused turn: reply and verdict in one object
+        reply = "".join(_filler(config.reply_tokens))
+        status = "REACHED" if GOAL_MARKER in latest else "PENDING"
+        return _split(json.dumps({"reply": reply, "goal_status": status}, ensure_ascii=False))
+    return _filler(config.reply_tokens)
+
+def _split(text: str, size: int = 4) -> list:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def _stats(tokens: int, started: float, load: float) -> dict:
+    eval_seconds = tokens / config.tokens_per_second
+    return {
+        "done": True,
+        "total_duration": int((time.perf_counter() - started) * 1e9),
+        "load_duration": int(load * 1e9) or 1_000_000,
+        "prompt_eval_count": 50,
+        "prompt_eval_duration": int(config.latency * 1e9),
+        "eval_count": tokens,
+        "eval_duration": int(eval_seconds * 1e9),
+    }
+
+async def _respond(body: dict, chunks: list, field: str):
+    started = time.perf_counter()
+    model = body.get("model", "")
+    load = 0.0
+    if model not in _loaded:
+        _loaded.add(model)
+        load = config.load_time
+    await asyncio.sleep(load + config.latency)
+
+    wrap = (lambda text: {"message": {"role": "assistant", "content": text}}) if field == "message" else (lambda text: {"response": text})
+    if not body.get("stream", True):
+        await asyncio.sleep(len(chunks) / config.tokens_per_second)
+        return JSONResponse({"model": model, **wrap("".join(chunks)), **_stats(len(chunks), started, load)})
+
+    async def lines():
+        for chunk in chunks:
+            await asyncio.sleep(1 / config.tokens_per_second)
+            yield json.dumps({"model": model, **wrap(chunk), "done": False}, ensure_ascii=False) + "\n"
+        yield json.dumps({"model": model, **wrap(""), **_stats(len(chunks), started, load)}) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": m, "details": {"parameter_size": "4B"}} for m in MODELS]}
+
+@app.get("/api/ps")
+async def ps():
+    return {"models": [{"name": m} for m in sorted(_loaded)]}
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    body = await request.json()
+    return await _respond(body, _chat_reply(body), "message")
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    body = await request.json()
+    if not body.get("prompt"):
+        # Preload request (model_residency.warm): load only
+        _loaded.add(body.get("model", ""))
+        return {"model": body.get("model"), "response": "", "done": True, "load_duration": int(config.load_time * 1e9)}
+    return await _respond(body, _prompt_reply(body), "response")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=11555)
+    parser.add_argument("--latency", type=float, default=config.latency, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=config.tokens_per_second)
+    parser.add_argument("--reply-tokens", type=int, default=config.reply_tokens)
+    parser.add_argument("--load-time", type=float, default=config.load_time, help="cold-load delay per model")
+    args = parser.parse_args()
+    config.latency = args.latency
+    config.tokens_per_second = args.tokens_per_second
+    config.reply_tokens = args.reply_tokens
+    config.load_time = args.load_time
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""End-to-end load benchmark: simulated learners against the real app and a fake Ollama.
+
+Starts bench/fake_ollama.py and `uvicorn backend.main:app` on a throwaway
+database, then runs the learner flow the frontend drives: generate scenarios,
+chat turns (streamed), a hint, a final turn that reaches the goal, waiting for
+the summary, and browsing/searching the history. Reports p50/p95/p99 latency
+and request rate per endpoint.
+
+Each simulated learner has its own identity (X-Learner-Id), so learners run
+fully in parallel: they generate their scenarios, then complete `--sessions`
+conversations, each in the first scenario left on their dashboard.
+
+    PYTHONPATH=. python bench/run_bench.py --learners 16 --turns 6
+    PYTHONPATH=. python bench/run_bench.py --save-baseline     # write bench/baseline.json
+    PYTHONPATH=. python bench/run_bench.py --compare           # exit 1 if p95 regressed
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from fake_ollama import GOAL_MARKER
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Differences below this many seconds are noise, whatever the ratio.
+REGRESSION_FLOOR_SECONDS = 0.005
+USER_LINES = [
+    "すみません、京都行きの切符はありますか？",
+    "明日の朝の電車は何時ですか？",
+    "指定席はいくらですか？",
+    "窓側の席がいいです。",
+]
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _percentile(sorted_values, p: float) -> float:
+    # Nearest-rank
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, name: str, seconds: float):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def error(self, name: str, detail: str):
+        self.errors.setdefault(name, []).append(detail)
+
+    async def request(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            res = await client.request(method, url, **kwargs)
+            res.raise_for_status()
+        except httpx.HTTPError as e:
+            self.error(name, str(e))
+            raise
+        self.add(name, time.perf_counter() - started)
+        return res.json()
+
+    async def stream(self, client: httpx.AsyncClient, name: str, url: str, **kwargs):
+        """POSTs to an NDJSON endpoint; records time to the first event and to the end."""
+        started = time.perf_counter()
+        events = []
+        try:
+            async with client.stream("POST", url, **kwargs) as res:
+                res.raise_for_status()
+                async for line in res.aiter_lines():
+                    if not line:
+                        continue
+                    if not events:
+                        self.add(f"{name} (first event)", time.perf_counter() - started)
+                    events.append(json.loads(line))
+        except httpx.HTTPError as e:
+            self.error(name, str(e))
+            raise
+        self.add(name, time.perf_counter() - started)
+        return events
+
+    def report(self, wall_seconds: float) -> dict:
+        endpoints = {}
+        for name in sorted(set(self.samples) | set(self.errors)):
+            values = sorted(self.samples.get(name, []))
+            endpoints[name] = {
+                "count": len(values),
+                "errors": len(self.errors.get(name, [])),
+                "p50": _percentile(values, 50),
+                "p95": _percentile(values, 95),
+                "p99": _percentile(values, 99),
+                "per_second": len(values) / wall_seconds if wall_seconds else 0.0,
+            }
+        return endpoints
+
+async def learner_session(client: httpx.AsyncClient, recorder: Recorder, turns: int):
+    # A completed conversation's scenario leaves the dashboard; its replacement arrives in the background.
+    scenarios = (await recorder.request(client, "GET /api/scenarios", "GET", "/api/scenarios"))["scenarios"]
+    if not scenarios:
+        recorder.error("GET /api/scenarios", "no active scenario left")
+        return
+    scenario_id = scenarios[0]["id"]
+    for i in range(turns):
+        events = await recorder.stream(client, "POST /api/chat/turn/stream", "/api/chat/turn/stream",
+                                       json={"scenario_id": scenario_id, "message": USER_LINES[i % len(USER_LINES)]})
+        if not any(e["type"] == "status" for e in events):
+            recorder.error("POST /api/chat/turn/stream", "no status event")
+    await recorder.request(client, "POST /api/chat/hint", "POST", "/api/chat/hint", json={"scenario_id": scenario_id})
+
+    result = await recorder.request(client, "POST /api/chat/turn", "POST", "/api/chat/turn",
+                                    json={"scenario_id": scenario_id, "message": f"{GOAL_MARKER}。"})
+    if result["status"] != "REACHED":
+        recorder.error("POST /api/chat/turn", f"goal not reached: {result['status']}")
+        return
+    history_id = result["history_id"]
+    summary = await recorder.request(client, "GET /api/history/{id}/summary", "GET",
+                                     f"/api/history/{history_id}/summary", params={"wait": 30})
+    if summary["status"] != "done":
+        recorder.error("GET /api/history/{id}/summary", f"summary {summary['status']}")
+
+    page = await recorder.request(client, "GET /api/history", "GET", "/api/history", params={"limit": 20})
+    if page["next_cursor"] is not None:
+        await recorder.request(client, "GET /api/history", "GET", "/api/history",
+                               params={"limit": 20, "cursor": page["next_cursor"]})
+    await recorder.request(client, "GET /api/history/{id}", "GET", f"/api/history/{history_id}")
+    await recorder.request(client, "GET /api/history/search", "GET", "/api/history/search", params={"q": "切符"})
+
+async def learner(base_url: str, recorder: Recorder, learner_id: str, args):
+    headers = {"X-Learner-Id": learner_id}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=httpx.Timeout(120.0)) as client:
+        try:
+            for _ in range(args.generate_rounds):
+                events = await recorder.stream(client, "POST /api/scenarios/generate/stream", "/api/scenarios/generate/stream")
+                if not events or events[-1].get("count", 0) == 0:
+                    recorder.error("POST /api/scenarios/generate/stream", "no scenarios generated")
+            for _ in range(args.sessions):
+                await learner_session(client, recorder, args.turns)
+        except httpx.HTTPError as e:
+            recorder.error("session", str(e))
+
+async def run(base_url: str, args) -> dict:
+    recorder = Recorder()
+    started = time.perf_counter()
+    await asyncio.gather(*(learner(base_url, recorder, f"bench-{i}", args) for i in range(args.learners)))
+    wall = time.perf_counter() - started
+    return {"wall_seconds": wall, "endpoints": recorder.report(wall)}
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def start_servers(args, workdir: str):
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    fake_port, app_port = _free_port(), _free_port()
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(repo, "bench", "fake_ollama.py"), "--port", str(fake_port),
+        "--latency", str(args.latency), "--tokens-per-second", str(args.tokens_per_second),
+        "--reply-tokens", str(args.reply_tokens), "--load-time", str(args.load_time),
+    ])
+    env = dict(os.environ,
+               LINGOFLOW_OLLAMA_URLS=f"http://127.0.0.1:{fake_port}",
+               LINGOFLOW_DB_PATH=os.path.join(workdir, "bench.db"),
+               LINGOFLOW_TURN_MODE=args.turn_mode)
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=repo, env=env,
+    )
+    try:
+        _wait_until_up(f"http://127.0.0.1:{fake_port}/api/tags", fake)
+        _wait_until_up(f"http://127.0.0.1:{app_port}/api/settings", app)
+    except Exception:
+        stop_servers(fake, app)
+        raise
+    return f"http://127.0.0.1:{app_port}", fake, app
+
+def stop_servers(*processes):
+    # One at a time, the app first, so it does not log errors about the fake Ollama going away.
+    for process in reversed(processes):
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def print_report(result: dict):
+    print(f"{'endpoint':<48} {'n':>5} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>7}")
+    for name, row in result["endpoints"].items():
+        print(f"{name:<48} {row['count']:>5} {row['errors']:>4} {row['p50'] * 1000:>8.1f} "
+              f"{row['p95'] * 1000:>8.1f} {row['p99'] * 1000:>8.1f} {row['per_second']:>7.2f}")
+    print(f"total: {result['wall_seconds']:.2f}s")
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Endpoints whose p95 got worse than the baseline by more than `tolerance` (a fraction)."""
+    regressions = []
+    if baseline.get("config") != result.get("config"):
+        print("warning: baseline was recorded with a different configuration")
+    for name, old in baseline["endpoints"].items():
+        new = result["endpoints"].get(name)
+        if new is None:
+            continue
+        limit = max(old["p95"] * (1 + tolerance), old["p95"] + REGRESSION_FLOOR_SECONDS)
+        if new["p95"] > limit:
+            regressions.append(f"{name}: p95 {old['p95'] * 1000:.1f} ms -> {new['p95'] * 1000:.1f} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--learners", type=int, default=8, help="concurrent simulated learners")
+    parser.add_argument("--sessions", type=int, default=3, help="conversations each learner completes")
+    parser.add_argument("--turns", type=int, default=3, help="streamed turns before the goal is reached")
+    parser.add_argument("--generate-rounds", type=int, default=1, help="scenario generations per learner")
+    parser.add_argument("--turn-mode", default="standard", choices=["standard", "fused", "pipelined"])
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Ollama: seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--reply-tokens", type=int, default=30)
+    parser.add_argument("--load-time", type=float, default=0.0, help="fake Ollama: cold-load delay per model")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--save-baseline", action="store_true", help=f"write the results to {BASELINE_PATH}")
+    parser.add_argument("--compare", action="store_true", help="fail if a p95 regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 increase for --compare")
+    args = parser.parse_args()
+
+    config = {key: getattr(args, key) for key in (
+        "learners", "sessions", "turns", "generate_rounds", "turn_mode",
+        "latency", "tokens_per_second", "reply_tokens", "load_time")}
+    with tempfile.TemporaryDirectory() as workdir:
+        base_url, *servers = start_servers(args, workdir)
+        try:
+            result = asyncio.run(run(base_url, args))
+        finally:
+            stop_servers(*servers)
+    result["config"] = config
+    print_report(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline written to {BASELINE_PATH}")
+
+    failed = any(row["errors"] for row in result["endpoints"].values())
+    if args.compare:
+        with open(BASELINE_PATH) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,18 @@
 let currentScenarioId = null;
 
+// Each learner has their own settings, scenarios and history. Open the app once as
+// /?learner=<name> to choose one on this browser; without it the shared default is used.
+const learnerId = (() => {
+    const fromUrl = new URLSearchParams(window.location.search).get('learner');
+    if (fromUrl) localStorage.setItem('learnerId', fromUrl);
+    return localStorage.getItem('learnerId');
+})();
+
+function api(url, options = {}) {
+    if (!learnerId) return fetch(url, options);
+    return fetch(url, { ...options, headers: { ...(options.headers || {}), 'X-Learner-Id': learnerId } });
+}
+
 window.addEventListener('DOMContentLoaded', async () => {
     await loadSettings();
     await loadScenarios();
@@ -16,7 +29,7 @@ function applyTheme(theme) {
 
 async function loadSettings() {
     try {
-        const res = await fetch('/api/settings');
+        const res = await api('/api/settings');
         const data = await res.json();
 
         document.getElementById('themeSelect').value = data.theme || 'system';
@@ -43,7 +56,7 @@ async function saveSettings() {
     const ui_language = document.getElementById('uiLangSelect').value;
 
     try {
-        await fetch('/api/settings', {
+        await api('/api/settings', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ theme, model, practice_language, ui_language })
@@ -63,7 +76,7 @@ async function loadModels(selectedModel) {
     select.innerHTML = '';
 
     try {
-        const res = await fetch('/api/models');
+        const res = await api('/api/models');
         if (!res.ok) throw new Error('Failed to fetch models');
         const data = await res.json();
         const models = data.models || [];
@@ -113,7 +126,7 @@ async function loadScenarios() {
     regenBtn.disabled = true;
 
     try {
-        const res = await fetch('/api/scenarios');
+        const res = await api('/api/scenarios');
         const data = await res.json();
 
         loadingObj.classList.add('hidden');
@@ -125,26 +138,7 @@ async function loadScenarios() {
             return;
         }
 
-        data.scenarios.forEach(scen => {
-            const card = document.createElement('div');
-            card.className = 'scenario-card';
-            card.onclick = () => startChat(scen);
-
-            const img = document.createElement('img');
-            img.src = `/api/clipart/${scen.clipart}`;
-
-            const textDiv = document.createElement('div');
-            const h3 = document.createElement('h3');
-            h3.innerText = scen.setting;
-            const p = document.createElement('p');
-            p.innerText = scen.goal;
-
-            textDiv.appendChild(h3);
-            textDiv.appendChild(p);
-            card.appendChild(img);
-            card.appendChild(textDiv);
-            container.appendChild(card);
-        });
+        data.scenarios.forEach(scen => container.appendChild(scenarioCard(scen)));
     } catch (e) {
         loadingObj.classList.add('hidden');
         regenBtn.disabled = false;
@@ -153,6 +147,27 @@ async function loadScenarios() {
     }
 }
 
+function scenarioCard(scen) {
+    const card = document.createElement('div');
+    card.className = 'scenario-card';
+    card.onclick = () => startChat(scen);
+
+    const img = document.createElement('img');
+    img.src = scen.thumb_url || `/api/clipart/${scen.clipart}`;
+
+    const textDiv = document.createElement('div');
+    const h3 = document.createElement('h3');
+    h3.innerText = scen.setting;
+    const p = document.createElement('p');
+    p.innerText = scen.goal;
+
+    textDiv.appendChild(h3);
+    textDiv.appendChild(p);
+    card.appendChild(img);
+    card.appendChild(textDiv);
+    return card;
+}
+
 async function generateScenarios() {
     const loadingObj = document.getElementById('scenarios-loading');
     const regenBtn = document.getElementById('regenerateBtn');
@@ -164,12 +179,32 @@ async function generateScenarios() {
     loadingObj.classList.remove('hidden');
     regenBtn.disabled = true;
 
+    // Cards are added one by one as the server saves each new scenario.
+    let received = 0;
     try {
-        await fetch('/api/scenarios/generate', { method: 'POST' });
-        await loadScenarios();
+        const res = await api('/api/scenarios/generate/stream', { method: 'POST' });
+        if (!res.ok || !res.body) throw new Error(`Scenario generation failed: ${res.status}`);
+
+        await readEventStream(res, event => {
+            if (event.type === 'scenario') {
+                received++;
+                container.appendChild(scenarioCard(event.scenario));
+            }
+        });
+        if (received === 0) throw new Error('No scenarios generated');
+
+        loadingObj.classList.add('hidden');
+        regenBtn.disabled = false;
     } catch (e) {
         loadingObj.classList.add('hidden');
         regenBtn.disabled = false;
+        if (received === 0) {
+            // Nothing new was saved, so the previous scenarios are still there
+            try {
+                const data = await (await api('/api/scenarios')).json();
+                (data.scenarios || []).forEach(scen => container.appendChild(scenarioCard(scen)));
+            } catch (_) { }
+        }
         errorBanner.innerText = 'Error generating scenarios: model took too long or failed.';
         errorBanner.classList.remove('hidden');
     }
@@ -179,7 +214,7 @@ function startChat(scenario) {
     document.getElementById('dashboard').classList.add('hidden');
     document.getElementById('chat').classList.remove('hidden');
 
-    document.getElementById('scenario-clipart').src = `/api/clipart/${scenario.clipart}`;
+    document.getElementById('scenario-clipart').src = scenario.thumb_url || `/api/clipart/${scenario.clipart}`;
     document.getElementById('scenario-setting').innerText = scenario.setting;
     document.getElementById('scenario-goal').innerText = scenario.goal;
     document.getElementById('scenario-description').innerText = scenario.description || '';
@@ -208,7 +243,7 @@ async function returnToDashboard() {
 async function abandonChat() {
     if (!confirm("Are you sure you want to abandon this chat?")) return;
     try {
-        await fetch(`/api/chat/abandon`, {
+        await api(`/api/chat/abandon`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ scenario_id: currentScenarioId })
@@ -233,8 +268,11 @@ async function sendMessage() {
     appendMessage('User', msg);
     document.getElementById('typing-indicator').classList.remove('hidden');
 
+    let botText = null;
+    let botContent = '';
+
     try {
-        const res = await fetch('/api/chat/turn', {
+        const res = await api('/api/chat/turn/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -242,46 +280,115 @@ async function sendMessage() {
                 message: msg
             })
         });
-        const data = await res.json();
+        if (!res.ok || !res.body) throw new Error(`Chat turn failed: ${res.status}`);
 
+        await readEventStream(res, event => {
+            if (event.type === 'token') {
+                if (!botText) {
+                    document.getElementById('typing-indicator').classList.add('hidden');
+                    botText = appendMessage('Bot', '');
+                }
+                botContent += event.content;
+                renderMessageContent(botText, botContent);
+                const container = document.getElementById('messages');
+                container.scrollTop = container.scrollHeight;
+            } else if (event.type === 'reply' && botText) {
+                // Final reply with furigana added by the server
+                botContent = event.content;
+                renderMessageContent(botText, botContent);
+            } else if (event.type === 'status') {
+                if (event.status === 'REACHED') showGoalReached();
+            } else if (event.type === 'summary_pending') {
+                waitForSummary(event.history_id);
+            }
+        });
+
+        document.getElementById('typing-indicator').classList.add('hidden');
+    } catch (e) {
         document.getElementById('typing-indicator').classList.add('hidden');
+        alert("Failed to get response");
+    }
+}
 
-        if (data.bot_message) {
-            appendMessage('Bot', data.bot_message);
+// Reads an NDJSON response body, invoking onEvent for every complete line.
+async function readEventStream(res, onEvent) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newline).trim();
+            buffer = buffer.slice(newline + 1);
+            if (line) onEvent(JSON.parse(line));
         }
+    }
+    buffer += decoder.decode();
+    if (buffer.trim()) onEvent(JSON.parse(buffer));
+}
 
-        if (data.status === 'REACHED') {
-            // Lock input
-            document.getElementById('userInput').disabled = true;
-            document.getElementById('sendBtn').disabled = true;
-            document.getElementById('hintBtn').disabled = true;
-            document.getElementById('chat-input-area').classList.add('hidden');
-
-            // Show the summary panel with a loading state
-            const panel = document.getElementById('chat-summary-panel');
-            const loading = document.getElementById('chat-summary-loading');
-            const content = document.getElementById('chat-summary-content');
-            panel.classList.remove('hidden');
-            loading.classList.remove('hidden');
-            content.innerHTML = '';
-            panel.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
-
-            if (data.summary) {
-                loading.classList.add('hidden');
-                content.innerHTML = DOMPurify.sanitize(marked.parse(data.summary));
-            } else {
-                loading.classList.add('hidden');
-                const em = document.createElement('em');
-                em.className = 'summary-error';
-                em.textContent = 'Summary could not be generated.';
-                content.appendChild(em);
-            }
+function showGoalReached() {
+    // Lock input
+    document.getElementById('userInput').disabled = true;
+    document.getElementById('sendBtn').disabled = true;
+    document.getElementById('hintBtn').disabled = true;
+    document.getElementById('chat-input-area').classList.add('hidden');
+
+    // Show the summary panel with a loading state until the summary job finishes
+    const panel = document.getElementById('chat-summary-panel');
+    const loading = document.getElementById('chat-summary-loading');
+    const content = document.getElementById('chat-summary-content');
+    panel.classList.remove('hidden');
+    loading.classList.remove('hidden');
+    content.innerHTML = '';
+    panel.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+}
 
-            document.getElementById('backToDashboardBtn').classList.remove('hidden');
+// The summary is written by a background job; long-poll until it is done or has failed.
+async function waitForSummary(historyId) {
+    try {
+        while (true) {
+            const res = await api(`/api/history/${historyId}/summary?wait=30`);
+            if (!res.ok) throw new Error(`Summary request failed: ${res.status}`);
+            const data = await res.json();
+            if (data.status !== 'pending') {
+                showSummary(data.summary);
+                return;
+            }
         }
     } catch (e) {
-        document.getElementById('typing-indicator').classList.add('hidden');
-        alert("Failed to get response");
+        showSummary(null);
+    }
+}
+
+function showSummary(summary) {
+    const loading = document.getElementById('chat-summary-loading');
+    const content = document.getElementById('chat-summary-content');
+    loading.classList.add('hidden');
+
+    if (summary) {
+        content.innerHTML = DOMPurify.sanitize(marked.parse(summary));
+    } else {
+        content.innerHTML = '';
+        const em = document.createElement('em');
+        em.className = 'summary-error';
+        em.textContent = 'Summary could not be generated.';
+        content.appendChild(em);
+    }
+
+    document.getElementById('backToDashboardBtn').classList.remove('hidden');
+}
+
+function renderMessageContent(text, content) {
+    if (typeof DOMPurify !== 'undefined' && typeof marked !== 'undefined') {
+        text.innerHTML = DOMPurify.sanitize(marked.parse(content));
+    } else {
+        text.innerHTML = content;
     }
 }
 
@@ -296,22 +403,19 @@ function appendMessage(speaker, content) {
 
     const text = document.createElement('div');
     text.className = 'content';
-    if (typeof DOMPurify !== 'undefined' && typeof marked !== 'undefined') {
-        text.innerHTML = DOMPurify.sanitize(marked.parse(content));
-    } else {
-        text.innerHTML = content;
-    }
+    renderMessageContent(text, content);
 
     div.appendChild(label);
     div.appendChild(text);
     container.appendChild(div);
     container.scrollTop = container.scrollHeight;
+    return text;
 }
 
 async function getHint() {
     document.getElementById('typing-indicator').classList.remove('hidden');
     try {
-        const res = await fetch('/api/chat/hint', {
+        const res = await api('/api/chat/hint', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ scenario_id: currentScenarioId })
@@ -329,7 +433,7 @@ async function getHint() {
 function closeHint() { document.getElementById('hintModal').classList.add('hidden'); }
 
 async function openSettings() {
-    const settings = await fetch('/api/settings').then(r => r.json()).catch(() => ({}));
+    const settings = await api('/api/settings').then(r => r.json()).catch(() => ({}));
     const currentModel = settings.model || document.getElementById('modelSelect').value || 'gemma3:4b';
     document.getElementById('settingsModal').classList.remove('hidden');
     await loadModels(currentModel);
@@ -371,6 +475,7 @@ function modelBadge(model) {
 
 async function openHistory() {
     document.getElementById('historyModal').classList.remove('hidden');
+    document.getElementById('history-search').value = '';
     const container = document.getElementById('history-container');
     const loading = document.getElementById('history-loading');
 
@@ -378,7 +483,7 @@ async function openHistory() {
     loading.classList.remove('hidden');
 
     try {
-        const res = await fetch('/api/history');
+        const res = await api('/api/history');
         const data = await res.json();
 
         loading.classList.add('hidden');
@@ -391,69 +496,143 @@ async function openHistory() {
             return;
         }
 
-        data.history.forEach(item => {
-            const date = new Date(item.timestamp).toLocaleString();
-            const row = document.createElement('div');
-            row.className = 'history-row';
-
-            const btn = document.createElement('button');
-            btn.className = 'secondary history-row-btn';
-
-            const titleSpan = document.createElement('span');
-            titleSpan.className = 'history-row-title';
-            titleSpan.textContent = item.scenario_id.replace(/_/g, ' ');
-
-            const metaSpan = document.createElement('span');
-            metaSpan.className = 'history-row-meta';
-            metaSpan.innerHTML = langBadge(item.practice_language) + modelBadge(item.model);
-
-            const dateSpan = document.createElement('span');
-            dateSpan.className = 'history-row-date';
-            dateSpan.textContent = date;
-
-            metaSpan.appendChild(dateSpan);
-            btn.appendChild(titleSpan);
-            btn.appendChild(metaSpan);
-
-            btn.onclick = () => viewHistoryItem(item.id, item.practice_language, item.model);
-
-            const delBtn = document.createElement('button');
-            delBtn.className = 'danger-btn';
-            delBtn.title = 'Delete this conversation';
-            delBtn.innerHTML = '🗑';
-            delBtn.onclick = async (e) => {
-                e.stopPropagation();
-                if (!confirm('Delete this conversation?')) return;
-                await fetch(`/api/history/${item.id}`, { method: 'DELETE' });
-                row.remove();
-                if (document.getElementById('history-container').children.length === 0) {
-                    const emptyDiv = document.createElement('div');
-                    emptyDiv.className = 'summary-error';
-                    emptyDiv.textContent = 'No completed conversations yet.';
-                    document.getElementById('history-container').appendChild(emptyDiv);
-                }
-            };
+        appendHistoryPage(data);
+    } catch (e) {
+        loading.classList.add('hidden');
+        const err = document.createElement('div');
+        err.className = 'error-banner';
+        err.textContent = 'Failed to load history';
+        container.appendChild(err);
+    }
+}
+
+// Renders one page of /api/history, followed by a "Load more" button while pages remain.
+function appendHistoryPage(data) {
+    const container = document.getElementById('history-container');
+    data.history.forEach(item => container.appendChild(historyRow(item)));
+
+    if (data.next_cursor) {
+        const more = document.createElement('button');
+        more.className = 'secondary history-load-more';
+        more.textContent = 'Load more';
+        more.onclick = async () => {
+            more.disabled = true;
+            try {
+                const res = await api(`/api/history?cursor=${data.next_cursor}`);
+                const next = await res.json();
+                more.remove();
+                appendHistoryPage(next);
+            } catch (e) {
+                more.disabled = false;
+            }
+        };
+        container.appendChild(more);
+    }
+}
 
-            row.appendChild(btn);
-            row.appendChild(delBtn);
+let historySearchTimer = null;
+
+function onHistorySearchInput() {
+    clearTimeout(historySearchTimer);
+    historySearchTimer = setTimeout(searchHistory, 250);
+}
+
+async function searchHistory() {
+    const query = document.getElementById('history-search').value.trim();
+    if (!query) {
+        openHistory();
+        return;
+    }
+    const container = document.getElementById('history-container');
+
+    try {
+        const res = await api(`/api/history/search?q=${encodeURIComponent(query)}`);
+        const data = await res.json();
+        // Ignore responses for a query the learner has since changed
+        if (document.getElementById('history-search').value.trim() !== query) return;
+
+        container.innerHTML = '';
+        if (!data.results || data.results.length === 0) {
+            const div = document.createElement('div');
+            div.className = 'summary-error';
+            div.textContent = 'No conversations match your search.';
+            container.appendChild(div);
+            return;
+        }
+        data.results.forEach(hit => {
+            const row = historyRow({ ...hit, id: hit.history_id });
+            const snippet = document.createElement('span');
+            snippet.className = 'history-row-snippet';
+            const who = hit.source === 'summary' ? 'Summary' : hit.speaker;
+            snippet.innerHTML = DOMPurify.sanitize(`${who}: ${hit.snippet}`, { ALLOWED_TAGS: ['mark'] });
+            row.querySelector('.history-row-btn').appendChild(snippet);
             container.appendChild(row);
         });
     } catch (e) {
-        loading.classList.add('hidden');
+        container.innerHTML = '';
         const err = document.createElement('div');
         err.className = 'error-banner';
-        err.textContent = 'Failed to load history';
+        err.textContent = 'Search failed';
         container.appendChild(err);
     }
 }
 
+function historyRow(item) {
+    const date = new Date(item.timestamp).toLocaleString();
+    const row = document.createElement('div');
+    row.className = 'history-row';
+
+    const btn = document.createElement('button');
+    btn.className = 'secondary history-row-btn';
+
+    const titleSpan = document.createElement('span');
+    titleSpan.className = 'history-row-title';
+    titleSpan.textContent = item.scenario_id.replace(/_/g, ' ');
+
+    const metaSpan = document.createElement('span');
+    metaSpan.className = 'history-row-meta';
+    metaSpan.innerHTML = langBadge(item.practice_language) + modelBadge(item.model);
+
+    const dateSpan = document.createElement('span');
+    dateSpan.className = 'history-row-date';
+    dateSpan.textContent = date;
+
+    metaSpan.appendChild(dateSpan);
+    btn.appendChild(titleSpan);
+    btn.appendChild(metaSpan);
+
+    btn.onclick = () => viewHistoryItem(item.id, item.practice_language, item.model);
+
+    const delBtn = document.createElement('button');
+    delBtn.className = 'danger-btn';
+    delBtn.title = 'Delete this conversation';
+    delBtn.innerHTML = '🗑';
+    delBtn.onclick = async (e) => {
+        e.stopPropagation();
+        if (!confirm('Delete this conversation?')) return;
+        await api(`/api/history/${item.id}`, { method: 'DELETE' });
+        row.remove();
+        const container = document.getElementById('history-container');
+        if (!container.querySelector('.history-row, .history-load-more')) {
+            const emptyDiv = document.createElement('div');
+            emptyDiv.className = 'summary-error';
+            emptyDiv.textContent = 'No completed conversations yet.';
+            container.appendChild(emptyDiv);
+        }
+    };
+
+    row.appendChild(btn);
+    row.appendChild(delBtn);
+    return row;
+}
+
 function closeHistory() {
     document.getElementById('historyModal').classList.add('hidden');
 }
 
 async function clearAllHistory() {
     if (!confirm('Delete ALL conversation history? This cannot be undone.')) return;
-    await fetch('/api/history', { method: 'DELETE' });
+    await api('/api/history', { method: 'DELETE' });
     openHistory();
 }
 
@@ -482,8 +661,8 @@ async function viewHistoryItem(historyId, practiceLanguage, model) {
     // Fetch transcript and summary in parallel
     try {
         const [transcriptRes, summaryRes] = await Promise.all([
-            fetch(`/api/history/${historyId}`),
-            fetch(`/api/history/${historyId}/summary`)
+            api(`/api/history/${historyId}`),
+            api(`/api/history/${historyId}/summary`)
         ]);
         const transcriptData = await transcriptRes.json();
         const summaryData = await summaryRes.json();
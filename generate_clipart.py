@@ -1,31 +1,199 @@
+"""Renders placeholder clipart for scenes into data/clipart/ and writes its manifest.
+
+Scenes are given by name ("florist shop", "subway_platform.png", ...), on the
+command line or one per line in a file. They are rendered in parallel across
+processes; outputs whose manifest entry already matches what would be rendered
+are skipped, and files that were not generated here (hand-made art) are never
+overwritten unless --force is given. Every clipart, hand-made or not, also gets
+a small WebP variant in thumbs/ for the dashboard cards. The manifest lists
+every clipart in the directory and is what the backend matches scenarios
+against (backend/clipart.py).
+
+    python generate_clipart.py                              # the built-in placeholders
+    python generate_clipart.py florist_shop "subway platform" --jobs 8
+    python generate_clipart.py --from-file scenes.txt
+"""
+import argparse
+import colorsys
+import hashlib
+import json
 import os
-from PIL import Image, ImageDraw, ImageFont
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 
+OUTPUT_DIR = os.path.join("data", "clipart")
+MANIFEST_NAME = "manifest.json"
+DEFAULT_CLIPART = "default_conversation.png"
+WIDTH, HEIGHT = 400, 300
+# Bump when the drawing changes, so every generated clipart is rendered again.
+RENDERER_VERSION = 1
+THUMB_DIR = "thumbs"
+# Cards and the chat header show clipart 60 CSS pixels square; twice that stays sharp on high-DPI screens.
+THUMB_SIZE = 120
+THUMB_QUALITY = 80
+
+# Scenes with a hand-picked label and color; others get a label from their name and a color from its hash.
 cliparts = [
     ("train_station_ticket_counter.png", "Train Station", (231, 76, 60)),
     ("convenience_store_snack_aisle.png", "Convenience Store", (46, 204, 113)),
     ("restaurant_ordering_table.png", "Restaurant", (241, 196, 15)),
     ("hotel_reception_desk.png", "Hotel Reception", (52, 152, 219)),
     ("hospital_reception.png", "Hospital", (155, 89, 182)),
-    ("default_conversation.png", "Conversing", (149, 165, 166))
+    (DEFAULT_CLIPART, "Conversing", (149, 165, 166))
 ]
+_KNOWN = {filename: (label, color) for filename, label, color in cliparts}
+
+def scene_filename(name: str) -> str:
+    """"Florist Shop", "florist-shop" and "florist_shop.png" all become florist_shop.png."""
+    stem = re.sub(r"\.png$", "", name.strip().lower())
+    stem = re.sub(r"[^a-z0-9]+", "_", stem).strip("_")
+    return f"{stem}.png" if stem else ""
+
+def _scene(filename: str):
+    if filename in _KNOWN:
+        return _KNOWN[filename]
+    label = filename[:-4].replace("_", " ").title()
+    hue = int(hashlib.sha1(filename.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+    color = tuple(round(c * 255) for c in colorsys.hls_to_rgb(hue, 0.5, 0.55))
+    return label, color
 
-os.makedirs("data/clipart", exist_ok=True)
-width, height = 400, 300
+def _spec(label: str, color) -> str:
+    # Everything the rendered image depends on
+    return hashlib.sha1(json.dumps([RENDERER_VERSION, label, list(color), WIDTH, HEIGHT]).encode("utf-8")).hexdigest()
 
-for filename, text, color in cliparts:
-    img = Image.new('RGB', (width, height), color=color)
+def render(task):
+    """Draws one clipart; runs in a worker process."""
+    path, label, color = task
+    img = Image.new('RGB', (WIDTH, HEIGHT), color=color)
     d = ImageDraw.Draw(img)
     try:
         font = ImageFont.truetype("Arial.ttf", 30)
     except IOError:
         font = ImageFont.load_default()
-        
-    text_bbox = d.textbbox((0, 0), text, font=font)
+
+    text_bbox = d.textbbox((0, 0), label, font=font)
     text_w = text_bbox[2] - text_bbox[0]
     text_h = text_bbox[3] - text_bbox[1]
-    
-    d.text(((width - text_w) / 2, (height - text_h) / 2), text, fill=(255, 255, 255), font=font)
-    img.save(f"data/clipart/{filename}")
 
-print("Successfully generated clipart placeholders in data/clipart/")
+    d.text(((WIDTH - text_w) / 2, (HEIGHT - text_h) / 2), label, fill=(255, 255, 255), font=font)
+    # Written under a temporary name, so an interrupted run never leaves a truncated file behind.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    img.save(tmp, format="PNG")
+    os.replace(tmp, path)
+    return os.path.basename(path)
+
+def make_thumb(task):
+    """Writes the square WebP card variant of one clipart; runs in a worker process."""
+    source, target = task
+    with Image.open(source) as img:
+        img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+        thumb = ImageOps.fit(img, (THUMB_SIZE, THUMB_SIZE), Image.LANCZOS)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    thumb.save(tmp, format="WEBP", quality=THUMB_QUALITY, method=6)
+    os.replace(tmp, target)
+    return os.path.basename(target)
+
+def thumb_name(filename: str) -> str:
+    return f"{THUMB_DIR}/{filename[:-4]}.webp"
+
+def _map(fn, tasks, jobs: int = None):
+    workers = jobs or os.cpu_count() or 1
+    if len(tasks) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # A few chunks per worker: fewer round trips, still balanced
+            return list(pool.map(fn, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+    return [fn(task) for task in tasks]
+
+def _stale_thumbs(output_dir: str, present) -> list:
+    """(source, target) for every clipart whose thumbnail is missing or older than it; removes orphans."""
+    os.makedirs(os.path.join(output_dir, THUMB_DIR), exist_ok=True)
+    tasks = []
+    for filename in sorted(present):
+        source, target = os.path.join(output_dir, filename), os.path.join(output_dir, thumb_name(filename))
+        if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source):
+            tasks.append((source, target))
+    wanted = {os.path.basename(thumb_name(f)) for f in present}
+    for name in os.listdir(os.path.join(output_dir, THUMB_DIR)):
+        if name.endswith(".webp") and name not in wanted:
+            os.remove(os.path.join(output_dir, THUMB_DIR, name))
+    return tasks
+
+def load_manifest(output_dir: str) -> dict:
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f).get("clipart", {})
+    except FileNotFoundError:
+        return {}
+
+def write_manifest(output_dir: str, entries: dict):
+    manifest = {"version": 1, "default": DEFAULT_CLIPART, "clipart": dict(sorted(entries.items()))}
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    os.replace(f"{path}.tmp", path)
+
+def build(names, output_dir: str = OUTPUT_DIR, jobs: int = None, force: bool = False):
+    """Renders the scenes that are missing or out of date, then the thumbnails that are.
+
+    Returns the file names of the (rendered, skipped) clipart and of the thumbnails written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    entries = load_manifest(output_dir)
+    present = {f for f in os.listdir(output_dir) if f.endswith(".png")}
+
+    tasks, skipped = [], []
+    for filename in dict.fromkeys(scene_filename(n) for n in names):
+        if not filename:
+            continue
+        label, color = _scene(filename)
+        spec = _spec(label, color)
+        entry = entries.get(filename)
+        if filename in present and not force and (entry is None or entry.get("spec") in (None, spec)):
+            # Up to date, or not ours to replace
+            skipped.append(filename)
+            continue
+        tasks.append((os.path.join(output_dir, filename), label, color))
+        entries[filename] = {"label": label, "spec": spec}
+
+    rendered = _map(render, tasks, jobs)
+
+    # The manifest indexes everything in the directory, including clipart added by hand.
+    present = {f for f in os.listdir(output_dir) if f.endswith(".png")}
+    thumbs = _map(make_thumb, _stale_thumbs(output_dir, present), jobs)
+    for filename in present - entries.keys():
+        entries[filename] = {"label": _scene(filename)[0], "spec": None}
+    for filename in present:
+        entries[filename]["thumb"] = thumb_name(filename)
+    write_manifest(output_dir, {f: e for f, e in entries.items() if f in present})
+    return rendered, skipped, thumbs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenes", nargs="*", help="scene names or clipart file names (default: the built-in placeholders)")
+    parser.add_argument("--from-file", action="append", default=[], help="file with one scene per line ('-' for stdin)")
+    parser.add_argument("--out", default=OUTPUT_DIR, help="output directory")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="render even up-to-date and hand-made clipart")
+    args = parser.parse_args()
+
+    names = list(args.scenes)
+    for path in args.from_file:
+        f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        with f:
+            names.extend(line.split("#", 1)[0].strip() for line in f)
+    if not names:
+        names = [filename for filename, _, _ in cliparts]
+    elif DEFAULT_CLIPART not in map(scene_filename, names):
+        # Scenarios fall back to it, so it always exists.
+        names.append(DEFAULT_CLIPART)
+
+    rendered, skipped, thumbs = build([n for n in names if n], args.out, args.jobs, args.force)
+    print(f"Rendered {len(rendered)} clipart, {len(skipped)} already up to date, and {len(thumbs)} card thumbnails "
+          f"in {args.out}/ ({MANIFEST_NAME} updated)")
+
+if __name__ == "__main__":
+    main()
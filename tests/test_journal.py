@@ -0,0 +1,210 @@
+"""Group commit, ordering, constraint fallback and completion syncing of the write-behind journal.
+
+Runs against temporary databases; nothing touches data/.
+
+    python -m pytest tests
+"""
+import asyncio
+import sqlite3
+
+import pytest
+
+from backend import async_storage
+from backend import journal
+from backend import storage
+
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DB_PATH", str(tmp_path / "lingoflow.db"))
+    monkeypatch.setattr(storage, "LEARNER_DIR", str(tmp_path / "learners"))
+    monkeypatch.setattr(journal, "FLUSH_INTERVAL", 0.01)
+    for name, value in (("_queue", []), ("_unflushed", {}), ("_waiters", []),
+                        ("_transcripts", journal.OrderedDict()), ("_flusher", None), ("_wakeup", None)):
+        monkeypatch.setattr(journal, name, value)
+    storage.close_connections()
+    with storage._caches_lock:
+        storage._caches.clear()
+    yield tmp_path
+    storage.close_connections()
+
+def _rows(learner: str, sql: str, *args):
+    # A connection of its own: only what is committed is visible.
+    with sqlite3.connect(storage.shard_path(learner)) as conn:
+        return conn.execute(sql, args).fetchall()
+
+def _messages(learner: str, history_id: int):
+    return [tuple(r) for r in _rows(learner, "SELECT speaker, content FROM messages WHERE history_id = ? ORDER BY id", history_id)]
+
+async def _conversation(learner: str, scenario_id: str = "s") -> int:
+    return await async_storage.run_as(learner, storage.start_conversation, scenario_id)
+
+def _as(learner: str):
+    storage.current_learner.set(learner)
+
+def test_writes_are_committed_in_one_transaction_per_learner(monkeypatch):
+    batches = []
+    apply = storage.apply_journal
+
+    def counting(writes):
+        batches.append((storage.current_learner.get(), len(writes)))
+        return apply(writes)
+    monkeypatch.setattr(storage, "apply_journal", counting)
+
+    async def scenario():
+        first, second = await _conversation("default"), await _conversation("default")
+        other = await _conversation("alice")
+        journal.start()
+        try:
+            for i in range(5):
+                _as("default")
+                await journal.append_message(first, "User", f"first {i}")
+                await journal.append_message(second, "User", f"second {i}")
+                _as("alice")
+                await journal.append_message(other, "User", f"alice {i}")
+            _as("default")
+            await journal.sync()
+        finally:
+            await journal.stop()
+        return first, second, other
+    first, second, other = asyncio.run(scenario())
+
+    assert sorted(batches) == [("alice", 5), ("default", 10)]
+    assert _messages("default", first) == [("User", f"first {i}") for i in range(5)]
+    assert _messages("default", second) == [("User", f"second {i}") for i in range(5)]
+    assert _messages("alice", other) == [("User", f"alice {i}") for i in range(5)]
+    assert not journal.pending()
+
+def test_failed_learner_is_retried_in_order_without_holding_up_others(monkeypatch):
+    apply = storage.apply_journal
+    failures = []
+
+    def locked_once(writes):
+        if storage.current_learner.get() == "bob" and not failures:
+            failures.append(len(writes))
+            raise sqlite3.OperationalError("database is locked")
+        return apply(writes)
+    monkeypatch.setattr(storage, "apply_journal", locked_once)
+
+    async def scenario():
+        alice, bob = await _conversation("alice"), await _conversation("bob")
+        journal.start()
+        try:
+            for i in range(3):
+                _as("alice")
+                await journal.append_message(alice, "User", f"a{i}")
+                _as("bob")
+                await journal.append_message(bob, "User", f"b{i}")
+            _as("alice")
+            await journal.sync(alice)
+            # Alice's commit does not wait for Bob's retry.
+            alice_done = _messages("alice", alice)
+            bob_early = _messages("bob", bob)
+            _as("bob")
+            await journal.append_message(bob, "Bot", "b3")
+            await journal.sync_learner()
+        finally:
+            await journal.stop()
+        return alice, bob, alice_done, bob_early
+    alice, bob, alice_done, bob_early = asyncio.run(scenario())
+
+    assert failures == [3]
+    assert alice_done == [("User", "a0"), ("User", "a1"), ("User", "a2")]
+    assert bob_early == []
+    assert _messages("bob", bob) == [("User", "b0"), ("User", "b1"), ("User", "b2"), ("Bot", "b3")]
+
+def test_constraint_violation_drops_only_the_failing_write():
+    async def scenario():
+        kept, deleted = await _conversation("default"), await _conversation("default", "gone")
+        await journal.append_message(kept, "User", "before")
+        journal.write(deleted, "append_conversation", deleted, "User", "orphan")
+        await journal.append_message(kept, "Bot", "after")
+        # The conversation disappears before the queued write reaches the database.
+        await async_storage.delete_conversation(deleted)
+        await journal.sync()
+        return kept, deleted
+    kept, deleted = asyncio.run(scenario())
+
+    # Applied once, without duplicates, and the orphan left out.
+    assert _messages("default", kept) == [("User", "before"), ("Bot", "after")]
+    assert _messages("default", deleted) == []
+    assert not journal.pending()
+
+def test_other_errors_keep_the_whole_batch_queued(monkeypatch):
+    apply = storage.apply_journal
+    calls = []
+
+    def disk_full(writes):
+        calls.append(len(writes))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database or disk is full")
+        return apply(writes)
+    monkeypatch.setattr(storage, "apply_journal", disk_full)
+
+    async def scenario():
+        history_id = await _conversation("default")
+        await journal.append_message(history_id, "User", "one")
+        await journal.append_message(history_id, "Bot", "two")
+        with pytest.raises(sqlite3.OperationalError):
+            await journal.sync(history_id)
+        assert journal.pending(history_id) and _messages("default", history_id) == []
+        await journal.sync(history_id)
+        return history_id
+    history_id = asyncio.run(scenario())
+
+    assert calls == [2, 2]
+    assert _messages("default", history_id) == [("User", "one"), ("Bot", "two")]
+
+def test_completion_is_committed_when_sync_returns():
+    async def scenario():
+        history_id = await _conversation("default")
+        journal.start()
+        try:
+            await journal.append_message(history_id, "User", "二枚ください")
+            await journal.append_message(history_id, "Bot", "かしこまりました")
+            # What the turn handler queues when the goal is reached, then syncs before reporting it.
+            journal.write(history_id, "save_goal_state", history_id, {"progress": "done", "evaluated": 2})
+            journal.write(history_id, "mark_conversation_completed", history_id)
+            await journal.sync(history_id)
+            committed = _rows("default", "SELECT completed FROM history WHERE id = ?", history_id)
+        finally:
+            await journal.stop()
+        return history_id, committed
+    history_id, committed = asyncio.run(scenario())
+
+    assert committed == [(1,)]
+    assert len(_messages("default", history_id)) == 2
+
+def test_sync_is_not_held_up_by_later_writes():
+    async def scenario():
+        mine, busy = await _conversation("default"), await _conversation("default")
+        journal.start()
+        stop = asyncio.Event()
+
+        async def keep_writing():
+            i = 0
+            while not stop.is_set():
+                await journal.append_message(busy, "User", f"busy {i}")
+                i += 1
+                await asyncio.sleep(0)
+        writer = asyncio.create_task(keep_writing())
+        try:
+            await journal.append_message(mine, "User", "mine")
+            await asyncio.wait_for(journal.sync(mine), timeout=2)
+            return _messages("default", mine)
+        finally:
+            stop.set()
+            await writer
+            await journal.stop()
+    assert asyncio.run(scenario()) == [("User", "mine")]
+
+def test_stop_drains_the_queue():
+    async def scenario():
+        history_id = await _conversation("default")
+        journal.start()
+        await journal.append_message(history_id, "User", "last words")
+        await journal.stop()
+        return history_id
+    history_id = asyncio.run(scenario())
+
+    assert _messages("default", history_id) == [("User", "last words")]
+    assert not journal.pending()
@@ -0,0 +1,76 @@
+"""Streamed JSON readers fed arbitrary chunk boundaries, as Ollama's tokens arrive.
+
+    python -m pytest tests
+"""
+import json
+
+import pytest
+
+from backend.json_stream import JsonArrayStreamReader, JsonStringFieldReader
+
+REPLY = 'はい、"二枚"ですね。\\ / \t\n改行 é 😀 \U0001f3ab end'
+
+def _splits(text: str):
+    """Every way of cutting `text` into two chunks, and one character at a time."""
+    for i in range(len(text) + 1):
+        yield [text[:i], text[i:]]
+    yield list(text)
+
+def _read_field(chunks, field: str = "reply") -> str:
+    reader = JsonStringFieldReader(field)
+    return "".join(reader.feed(chunk) for chunk in chunks), reader.done
+
+@pytest.mark.parametrize("ensure_ascii", [False, True], ids=["raw", "escaped"])
+def test_string_field_survives_any_chunk_boundary(ensure_ascii):
+    # ensure_ascii writes every non-ASCII character as \uXXXX, emoji as a surrogate pair.
+    text = json.dumps({"reply": REPLY, "goal_status": "PENDING"}, ensure_ascii=ensure_ascii)
+    for chunks in _splits(text):
+        assert _read_field(chunks) == (REPLY, True), chunks
+
+def test_string_field_yields_text_before_the_object_is_complete():
+    reader = JsonStringFieldReader("reply")
+    assert reader.feed('{"goal_status": "PENDING", "re') == ""
+    assert reader.feed('ply": "すみ') == "すみ"
+    assert reader.feed("ません\\") == "ません"  # the escape is held back until complete
+    assert reader.feed('u3002') == "。"
+    assert reader.feed('\\ud83c') == ""  # half a surrogate pair
+    assert reader.feed('\\udfab"}') == "🎫"
+    assert reader.done
+    assert reader.feed(' trailing') == ""
+
+def test_string_field_ignores_other_fields_and_whitespace():
+    text = '{"status": "reply", "reply" :\n "ok"}'
+    for chunks in _splits(text):
+        assert _read_field(chunks) == ("ok", True)
+
+def test_string_field_missing():
+    assert _read_field(['{"other": "x"}']) == ("", False)
+
+SCENARIOS = [
+    {"id": "a", "setting": "Station [platform 2]", "goal": 'Say "two tickets"', "description": "}{ braces \\ and é"},
+    {"id": "b", "setting": "Café", "goal": "😀", "description": "nested", "tags": [1, {"x": [2]}]},
+    {"id": "c", "setting": "", "goal": "\\\"", "description": "line\nbreak"},
+]
+
+@pytest.mark.parametrize("ensure_ascii", [False, True], ids=["raw", "escaped"])
+def test_array_elements_survive_any_chunk_boundary(ensure_ascii):
+    text = "```json\n" + json.dumps(SCENARIOS, ensure_ascii=ensure_ascii, indent=1) + "\n```"
+    for chunks in _splits(text):
+        reader = JsonArrayStreamReader()
+        items = [item for chunk in chunks for item in reader.feed(chunk)]
+        assert items == SCENARIOS, chunks
+        assert reader.done and reader.errors == 0
+
+def test_array_elements_are_returned_as_soon_as_they_close():
+    reader = JsonArrayStreamReader()
+    assert reader.feed('[{"id": "a"}, {"id": "b", "note": "a \\"}') == [{"id": "a"}]
+    assert reader.feed('\\" b"}') == [{"id": "b", "note": 'a "}" b'}]
+    assert not reader.done
+    assert reader.feed(']') == []
+    assert reader.done
+
+def test_array_skips_invalid_elements():
+    reader = JsonArrayStreamReader()
+    items = reader.feed('[{"id": "a"}, {"id": oops}, {"id": "c"}]')
+    assert items == [{"id": "a"}, {"id": "c"}]
+    assert reader.errors == 1 and reader.done
@@ -0,0 +1,160 @@
+"""Node selection, failover and stickiness of the Ollama router, against bench/fake_ollama.py.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from backend import ollama_client
+from backend import ollama_router
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL = "bench:tiny"
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _start_fake() -> tuple:
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO, "bench", "fake_ollama.py"), "--port", str(port), "--latency", "0"],
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 20
+    while True:
+        try:
+            httpx.get(f"{url}/api/tags", timeout=1).raise_for_status()
+            return url, process
+        except httpx.HTTPError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("fake Ollama did not start")
+            time.sleep(0.1)
+
+@pytest.fixture(scope="module")
+def servers():
+    started = [_start_fake() for _ in range(2)]
+    yield [url for url, _ in started]
+    for _, process in started:
+        process.terminate()
+        process.wait(timeout=10)
+
+@pytest.fixture
+def nodes(monkeypatch):
+    """Installs fresh router nodes for the given URLs; each test gets its own client and sticky table."""
+    def install(*urls):
+        installed = [ollama_router.Node(url) for url in urls]
+        monkeypatch.setattr(ollama_router, "_nodes", installed)
+        return installed
+    monkeypatch.setattr(ollama_router, "_sticky", ollama_router.OrderedDict())
+    monkeypatch.setattr(ollama_client, "_client", None)
+    return install
+
+def _generate(prompt: str, session: str = None):
+    async def call():
+        try:
+            return await ollama_client._post_json(
+                "summary", "/generate", {"model": MODEL, "prompt": prompt, "stream": False}, session=session)
+        finally:
+            await ollama_client.get_client().aclose()
+            ollama_client._client = None
+    return asyncio.run(call())
+
+def _down() -> str:
+    # Nothing listens on a port that was just free.
+    return f"http://127.0.0.1:{_free_port()}"
+
+def test_fails_over_when_a_node_is_down(servers, nodes):
+    down, up = nodes(_down(), servers[0])
+
+    data = _generate("failover")
+
+    assert data["done"] and data["response"]
+    assert not down.healthy and down.failures == 1 and down.last_error
+    assert up.healthy and MODEL in up.resident
+    assert down.in_flight == up.in_flight == 0
+
+def test_failed_node_is_ranked_last(servers, nodes):
+    down, up = nodes(_down(), servers[0])
+    _generate("first")
+
+    # The failure is remembered, so the next request goes to the working node first.
+    assert ollama_router.pick(MODEL) is up
+    _generate("second")
+    assert down.failures == 1
+
+def test_raises_when_every_node_is_down(nodes):
+    nodes(_down(), _down())
+
+    with pytest.raises(httpx.TransportError):
+        _generate("nowhere")
+
+def test_raises_a_connect_error_when_no_node_is_offered(nodes, monkeypatch):
+    nodes("http://unused")
+    monkeypatch.setattr(ollama_router, "pick", lambda *args, **kwargs: None)
+
+    with pytest.raises(httpx.ConnectError, match="no Ollama nodes"):
+        _generate("no nodes")
+
+def test_prefers_a_node_with_the_model_loaded(nodes):
+    first, second = nodes("http://first", "http://second")
+    second.resident = {MODEL}
+    first.in_flight = 0
+    second.in_flight = 3
+
+    assert ollama_router.pick(MODEL) is second
+    assert ollama_router.pick("other:model") is first
+
+def test_session_sticks_to_its_node(servers, nodes):
+    first, second = nodes(*servers)
+    _generate("turn 1", session="learner:1")
+    sticky = ollama_router._sticky["learner:1"]
+    other = second if sticky is first else first
+
+    # Make the other node the better choice for anyone without a session.
+    sticky.resident.clear()
+    sticky.in_flight = 5
+    assert ollama_router.pick(MODEL) is other
+
+    sticky.in_flight = 0
+    _generate("turn 2", session="learner:1")
+    assert ollama_router._sticky["learner:1"] is sticky
+    assert MODEL in sticky.resident and MODEL not in other.resident
+
+def test_session_moves_when_its_node_goes_down(servers, nodes):
+    first, second = nodes(*servers)
+    _generate("turn 1", session="learner:2")
+    sticky = ollama_router._sticky["learner:2"]
+    other = second if sticky is first else first
+
+    sticky.url = _down()
+    data = _generate("turn 2", session="learner:2")
+
+    assert data["done"]
+    assert not sticky.healthy
+    assert ollama_router._sticky["learner:2"] is other
+
+def test_health_check_evicts_and_restores_nodes(servers, nodes):
+    down, up = nodes(_down(), servers[0])
+
+    async def check():
+        async with httpx.AsyncClient() as client:
+            await ollama_router.refresh_all(client)
+            before = (down.healthy, up.healthy)
+            down.url = servers[1]
+            await ollama_router.refresh_all(client)
+            return before
+    before = asyncio.run(check())
+
+    assert before == (False, True)
+    assert up.available and MODEL in up.available
+    assert down.healthy and down.last_error is None and down.checked_at is not None
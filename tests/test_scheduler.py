@@ -0,0 +1,208 @@
+"""Priority ordering, slot hand-off and single-flight requests of the Ollama scheduler.
+
+    python -m pytest tests
+"""
+import asyncio
+
+import pytest
+
+from backend import ollama_router
+from backend import scheduler
+
+MODEL = "bench:tiny"
+
+@pytest.fixture(autouse=True)
+def one_slot(monkeypatch):
+    """One node, one request at a time per model, and no state left over from other tests."""
+    monkeypatch.setattr(scheduler, "MAX_CONCURRENCY_PER_MODEL", 1)
+    monkeypatch.setattr(ollama_router, "_nodes", [ollama_router.Node("http://only")])
+    monkeypatch.setattr(scheduler, "_queues", {})
+    monkeypatch.setattr(scheduler, "_in_flight", {})
+    monkeypatch.setattr(scheduler, "_callers", {})
+
+def _blocking():
+    """A request that runs until released: (fn, started, release, cancelled)."""
+    started, release, cancelled = asyncio.Event(), asyncio.Event(), asyncio.Event()
+
+    async def fn():
+        started.set()
+        try:
+            await release.wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "released"
+    return fn, started, release, cancelled
+
+def test_cancelling_the_last_caller_cancels_the_request():
+    async def scenario():
+        evaluate, started, _, cancelled = _blocking()
+        caller = asyncio.create_task(scheduler.submit("evaluate", MODEL, evaluate, key="precheck"))
+        await started.wait()
+
+        async def summary():
+            return "summary"
+        queued = asyncio.create_task(scheduler.submit("summary", MODEL, summary))
+        await asyncio.sleep(0)
+        caller.cancel()
+
+        # The abandoned request gives its slot up instead of running to the end.
+        assert await asyncio.wait_for(queued, timeout=1) == "summary"
+        assert cancelled.is_set()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        assert scheduler.stats()["in_flight_keys"] == 0
+        assert scheduler.stats()["models"][MODEL]["active"]["total"] == 0
+    asyncio.run(scenario())
+
+def test_request_survives_while_another_caller_waits():
+    async def scenario():
+        fn, started, release, cancelled = _blocking()
+        first = asyncio.create_task(scheduler.submit("evaluate", MODEL, fn, key="shared"))
+        second = asyncio.create_task(scheduler.submit("evaluate", MODEL, fn, key="shared"))
+        await started.wait()
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await second == "released"
+        assert not cancelled.is_set()
+        assert scheduler.stats()["coalesced_total"] >= 1
+    asyncio.run(scenario())
+
+def test_same_key_after_cancellation_starts_a_new_request():
+    async def scenario():
+        fn, started, _, _ = _blocking()
+        caller = asyncio.create_task(scheduler.submit("evaluate", MODEL, fn, key="again"))
+        await started.wait()
+        caller.cancel()
+
+        async def fresh():
+            return "fresh"
+        # Submitted before the cancelled request has finished unwinding.
+        assert await asyncio.wait_for(scheduler.submit("evaluate", MODEL, fresh, key="again"), timeout=1) == "fresh"
+    asyncio.run(scenario())
+
+def test_capacity_counts_healthy_nodes_that_have_the_model(monkeypatch):
+    monkeypatch.setattr(scheduler, "MAX_CONCURRENCY_PER_MODEL", 2)
+    first, second, third = (ollama_router.Node(f"http://node{i}") for i in range(3))
+    monkeypatch.setattr(ollama_router, "_nodes", [first, second, third])
+    first.available = {MODEL}
+    second.available = {"other:model"}
+    # third has not been checked yet (available is None) and may serve anything.
+    assert scheduler.capacity(MODEL) == 4
+
+    third.healthy = False
+    assert scheduler.capacity(MODEL) == 2
+    first.healthy = False
+    # Nothing healthy left: still one node's worth, so requests fail over or fail fast instead of hanging.
+    assert scheduler.capacity(MODEL) == 2
+    assert scheduler.capacity("other:model") == 2
+
+def test_queued_requests_start_when_a_node_comes_back(monkeypatch):
+    first, second = ollama_router.Node("http://first"), ollama_router.Node("http://second")
+    monkeypatch.setattr(ollama_router, "_nodes", [first, second])
+    second.healthy = False
+
+    async def scenario():
+        running, started, release, _ = _blocking()
+        other, other_started, other_release, _ = _blocking()
+        tasks = [asyncio.create_task(scheduler.submit("chat", MODEL, running)),
+                 asyncio.create_task(scheduler.submit("chat", MODEL, other))]
+        await started.wait()
+        await asyncio.sleep(0.01)
+        assert not other_started.is_set()
+
+        second.healthy = True
+        # Any queue activity picks the new capacity up: the waiting request gets the new slot first.
+        async def quick():
+            return "quick"
+        late = asyncio.create_task(scheduler.submit("chat", MODEL, quick))
+        await asyncio.wait_for(other_started.wait(), timeout=1)
+        release.set()
+        assert await asyncio.wait_for(late, timeout=1) == "quick"
+        other_release.set()
+        assert await asyncio.gather(*tasks) == ["released", "released"]
+    asyncio.run(scenario())
+
+def test_waiting_requests_run_in_priority_order():
+    async def scenario():
+        blocker, started, release, _ = _blocking()
+        first = asyncio.create_task(scheduler.submit("scenario", MODEL, blocker))
+        await started.wait()
+
+        order = []
+        def record(kind):
+            async def fn():
+                order.append(kind)
+            return fn
+        kinds = ["scenario", "summary", "hint", "evaluate", "chat", "summary"]
+        waiting = []
+        for kind in kinds:
+            waiting.append(asyncio.create_task(scheduler.submit(kind, MODEL, record(kind))))
+            await asyncio.sleep(0)
+        assert scheduler.stats()["models"][MODEL]["queued"]["total"] == len(kinds)
+
+        release.set()
+        await asyncio.gather(first, *waiting)
+        # Highest priority first; equal priorities in arrival order.
+        assert order == ["chat", "evaluate", "hint", "summary", "summary", "scenario"]
+    asyncio.run(scenario())
+
+def test_cancelled_waiter_passes_its_slot_on():
+    async def scenario():
+        blocker, started, release, _ = _blocking()
+        running = asyncio.create_task(scheduler.submit("chat", MODEL, blocker))
+        await started.wait()
+
+        ran = []
+        async def hint():
+            ran.append("hint")
+        async def summary():
+            ran.append("summary")
+        cancelled = asyncio.create_task(scheduler.submit("hint", MODEL, hint))
+        queued = asyncio.create_task(scheduler.submit("summary", MODEL, summary))
+        await asyncio.sleep(0)
+
+        # The chat finishes and hands its slot to the hint, which is cancelled before it gets to run.
+        release.set()
+        await asyncio.sleep(0)
+        assert running.done() and scheduler.stats()["models"][MODEL]["active"]["total"] == 1
+        cancelled.cancel()
+        await asyncio.wait_for(queued, timeout=1)
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert ran == ["summary"]
+        stats = scheduler.stats()["models"][MODEL]
+        assert stats["active"]["total"] == 0 and stats["queued"]["total"] == 0
+    asyncio.run(scenario())
+
+def test_identical_requests_share_one_call():
+    async def scenario():
+        calls = []
+        release = asyncio.Event()
+        async def fn():
+            calls.append(1)
+            await release.wait()
+            return {"response": "shared"}
+        callers = [asyncio.create_task(scheduler.submit("summary", MODEL, fn, key="same")) for _ in range(3)]
+        other = asyncio.create_task(scheduler.submit("summary", MODEL, fn, key="different"))
+        await asyncio.sleep(0)
+        release.set()
+
+        results = await asyncio.gather(*callers, other)
+        assert results[0] is results[1] is results[2]
+        assert len(calls) == 2
+        assert scheduler.stats()["in_flight_keys"] == 0
+    asyncio.run(scenario())
+
+def test_shared_failure_reaches_every_caller():
+    async def scenario():
+        async def fn():
+            await asyncio.sleep(0)
+            raise RuntimeError("model crashed")
+        callers = [asyncio.create_task(scheduler.submit("summary", MODEL, fn, key="failing")) for _ in range(2)]
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert scheduler.stats()["models"][MODEL]["active"]["total"] == 0
+    asyncio.run(scenario())